@@ -4,81 +4,94 @@ API依赖注入
 提供通用的依赖注入功能，如数据库会话、用户认证等
 """
 
-from typing import Generator
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.orm import Session
 
-# 模拟用户类
-class User:
-    def __init__(self, id: int, username: str, email: str):
-        self.id = id
-        self.username = username
-        self.email = email
-
-# 模拟数据库会话
-class Session:
-    def __init__(self):
-        pass
-    
-    def query(self, model):
-        return MockQuery()
-    
-    def add(self, obj):
-        pass
-    
-    def commit(self):
-        pass
-    
-    def rollback(self):
-        pass
-    
-    def refresh(self, obj):
-        pass
-    
-    def delete(self, obj):
-        pass
-
-class MockQuery:
-    def filter(self, *args):
-        return self
-    
-    def first(self):
-        return None
-    
-    def all(self):
-        return []
-    
-    def order_by(self, *args):
-        return self
-    
-    def offset(self, n):
-        return self
-    
-    def limit(self, n):
-        return self
+from app.core.security import AuthenticatedUser, InvalidTokenError, decode_access_token
+from app.db.config import SessionLocal, get_db
+from app.services.auth_service import AuthService
+from app.services.idempotency_service import IDEMPOTENCY_KEY_MAX_LENGTH
 
 security = HTTPBearer(auto_error=False)
 
-def get_db() -> Generator[Session, None, None]:
-    """获取数据库会话"""
-    db = Session()
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def resolve_token_user(db: Session, token: str) -> AuthenticatedUser:
+    """校验令牌并返回对应的有效用户，失败时抛出401"""
     try:
-        yield db
-    finally:
-        pass
+        claims = decode_access_token(token)
+    except InvalidTokenError:
+        raise _unauthorized("认证信息无效或已过期")
+
+    user = AuthService().get_user(db, int(claims["sub"]))
+    if not user or not user.is_active:
+        raise _unauthorized("用户不存在或已停用")
+
+    return user
+
 
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
-) -> User:
-    """获取当前认证用户"""
-    # 模拟用户认证
-    # 在实际应用中，这里应该验证JWT token
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> AuthenticatedUser:
+    """获取当前认证用户
+
+    令牌校验结果和用户信息均有进程内缓存，命中时不验签也不访问数据库
+    """
     if not credentials:
+        raise _unauthorized("未提供认证信息")
+
+    return resolve_token_user(db, credentials.credentials)
+
+
+async def get_stream_user(
+    token: Optional[str] = Query(None, description="访问令牌(EventSource/WebSocket无法设置请求头时使用)"),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> AuthenticatedUser:
+    """长连接接口的认证：支持请求头或查询参数中的令牌
+
+    使用即用即关的数据库会话，避免长连接在整个连接期间占用连接池
+    """
+    token = credentials.credentials if credentials else token
+    if not token:
+        raise _unauthorized("未提供认证信息")
+
+    db = SessionLocal()
+    try:
+        return resolve_token_user(db, token)
+    finally:
+        db.close()
+
+
+async def get_current_superuser(
+    current_user: AuthenticatedUser = Depends(get_current_user)
+) -> AuthenticatedUser:
+    """获取当前管理员用户"""
+    if not current_user.is_superuser:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="未提供认证信息",
-            headers={"WWW-Authenticate": "Bearer"},
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限"
         )
-    
-    # 模拟返回用户
-    return User(id=1, username="demo_user", email="demo@example.com") 
\ No newline at end of file
+    return current_user
+
+
+async def get_idempotency_key(
+    idempotency_key: Optional[str] = Header(
+        None,
+        min_length=1,
+        max_length=IDEMPOTENCY_KEY_MAX_LENGTH,
+        description="幂等键，重试时使用相同的值以重放首次请求的响应"
+    )
+) -> Optional[str]:
+    """读取Idempotency-Key请求头"""
+    return idempotency_key
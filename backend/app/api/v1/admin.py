@@ -0,0 +1,77 @@
+"""
+运维管理API
+
+提供仅管理员可用的运行时剖析、asyncio任务栈导出和事件循环阻塞记录，用于排查worker CPU占满或事件循环被阻塞
+"""
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.api.deps import get_current_superuser
+from app.core.loop_monitor import loop_monitor
+from app.core.profiling import (
+    PROFILE_DEFAULT_INTERVAL,
+    PROFILE_MAX_INTERVAL,
+    PROFILE_MAX_SECONDS,
+    PROFILE_MIN_INTERVAL,
+    PROFILE_MODES,
+    ProfilerBusyError,
+    dump_tasks,
+    profile
+)
+from app.core.security import AuthenticatedUser
+from app.schemas.admin import LoopBlockResponse, TaskSnapshotResponse
+
+router = APIRouter()
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS, description="采样时长(秒)"),
+    mode: str = Query("wall", pattern=f"^({'|'.join(PROFILE_MODES)})$", description="wall记录全部样本，cpu只记录消耗CPU的线程"),
+    interval_ms: float = Query(
+        PROFILE_DEFAULT_INTERVAL * 1000,
+        ge=PROFILE_MIN_INTERVAL * 1000,
+        le=PROFILE_MAX_INTERVAL * 1000,
+        description="采样间隔(毫秒)"
+    ),
+    current_user: AuthenticatedUser = Depends(get_current_superuser)
+):
+    """对当前worker采样剖析，返回折叠栈文本(可用flamegraph.pl或speedscope生成火焰图)"""
+    try:
+        result = await profile(mode, seconds, interval_ms / 1000)
+    except ProfilerBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="已有剖析在运行，请稍后再试"
+        )
+
+    return PlainTextResponse(
+        result.folded,
+        headers={
+            "X-Profile-Mode": result.mode,
+            "X-Profile-Duration": f"{result.duration:.3f}",
+            "X-Profile-Samples": str(result.samples),
+        }
+    )
+
+
+@router.get("/tasks", response_model=List[TaskSnapshotResponse])
+async def dump_asyncio_tasks(
+    current_user: AuthenticatedUser = Depends(get_current_superuser)
+):
+    """导出当前worker事件循环中所有asyncio任务的挂起位置"""
+    return [snapshot._asdict() for snapshot in dump_tasks()]
+
+
+@router.get("/loop-blocks", response_model=List[LoopBlockResponse])
+async def list_loop_blocks(
+    route: Optional[str] = Query(None, description="按路由模板筛选"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: AuthenticatedUser = Depends(get_current_superuser)
+):
+    """当前worker最近的事件循环阻塞记录(最新的在前)"""
+    events = [event for event in reversed(loop_monitor.events) if route is None or event.route == route]
+    return [event._asdict() for event in events[:limit]]
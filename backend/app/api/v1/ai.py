@@ -5,26 +5,93 @@ AI章节生成API
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from datetime import date, timedelta
+from typing import List, Optional
 import time
 
 from app.db.config import get_db
-from app.db.models import ReportDraft, User, AIGenerationLog
-from app.api.deps import get_current_user
-from app.schemas.reports import AIGenerateRequest, AIGenerateResponse
+from app.db.models import ReportDraft
+from app.api.deps import get_current_superuser, get_current_user, get_idempotency_key
+from app.core.events import EVENT_GENERATION_STATUS, event_bus
+from app.core.security import AuthenticatedUser
+from app.core.singleflight import SingleFlight
+from app.schemas.prompts import (
+    PromptVersionCreate,
+    PromptVersionResponse,
+    PromptVersionStatsResponse
+)
+from app.schemas.reports import (
+    AIGenerateRequest,
+    AIGenerateResponse,
+    DailyTokenUsage,
+    TokenUsageResponse
+)
 from app.services.ai_service import AIService
+from app.services.extraction_service import ExtractionService
+from app.services.generation_log_service import GenerationLogService, generation_log_writer
+from app.services.idempotency_service import request_fingerprint
+from app.services.prompt_service import (
+    CHAPTER_TITLES,
+    DEFAULT_INSURANCE_TYPE,
+    PromptService,
+    assemble_prompt,
+    prompt_registry
+)
+from app.services.report_cache_service import report_cache
+from app.services.retrieval_service import RetrievalService
+from app.services.search_service import SearchService
+from app.services.template_service import compile_template
+from app.services.token_service import count_message_tokens, count_tokens
+from app.services.usage_service import (
+    DAILY_TOKEN_BUDGET,
+    BudgetExceededError,
+    UsageService,
+    utc_today
+)
+from app.utils.idempotency import run_idempotent
 
 router = APIRouter()
 
 
+# 同一用户对同一报告的相同生成请求在进行中时合并为一次模型调用
+generation_flight = SingleFlight("ai.generate")
+
+
 @router.post("/generate/{report_id}", response_model=AIGenerateResponse)
 async def generate_chapter(
     report_id: int,
     generate_request: AIGenerateRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key)
 ):
-    """使用AI生成报告章节内容"""
+    """使用AI生成报告章节内容
+
+    重复点击等产生的相同请求在进行中时共享同一次生成；带Idempotency-Key的重试重放首次生成的响应
+    """
+    fingerprint = request_fingerprint(report_id, generate_request.dict())
+    
+    async def generate() -> AIGenerateResponse:
+        return await generation_flight.do(
+            (current_user.id, fingerprint),
+            lambda: _generate_chapter(report_id, generate_request, db, current_user)
+        )
+    
+    return await run_idempotent(
+        db, current_user.id, "ai.generate", idempotency_key, fingerprint, generate,
+        response_model=AIGenerateResponse
+    )
+
+
+async def _generate_chapter(
+    report_id: int,
+    generate_request: AIGenerateRequest,
+    db: Session,
+    current_user: AuthenticatedUser
+) -> AIGenerateResponse:
+    """生成章节内容并写回报告"""
     
     # 验证报告存在且属于当前用户
     report = db.query(ReportDraft).filter(
@@ -39,21 +106,67 @@ async def generate_chapter(
         )
     
     # 验证章节类型
-    valid_chapters = {
-        "accident_details": "事故经过及索赔",
-        "policy_summary": "保单内容摘要",
-        "site_investigation": "现场查勘情况", 
-        "cause_analysis": "事故原因分析",
-        "loss_assessment": "损失核定",
-        "conclusion": "公估结论"
-    }
-    
-    if generate_request.chapter_type not in valid_chapters:
+    if generate_request.chapter_type not in CHAPTER_TITLES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"无效的章节类型: {generate_request.chapter_type}"
         )
     
+    # 从报告OCR文本中检索相关段落，规模受token预算约束
+    passages = RetrievalService().retrieve(
+        db,
+        report_id,
+        generate_request.chapter_type,
+        generate_request.context
+    )
+    
+    # 结构化事实比原始OCR文本更紧凑
+    facts = ExtractionService().get_report_facts(db, report_id)
+    
+    # 自定义模板优先，否则使用注册表中该章节和保险类型的生效版本
+    prompt_version_id = None
+    if generate_request.prompt_template:
+        compiled_prompt = compile_template(generate_request.prompt_template)
+    else:
+        active_prompt = PromptService().resolve(
+            db,
+            generate_request.chapter_type,
+            report.insurance_type.value if report.insurance_type else None
+        )
+        compiled_prompt = active_prompt.compiled if active_prompt else None
+        prompt_version_id = active_prompt.id if active_prompt else None
+    
+    prompt_text = None
+    if compiled_prompt is not None:
+        prompt_text = assemble_prompt(
+            compiled_prompt,
+            generate_request.chapter_type,
+            context=generate_request.context,
+            facts=facts,
+            reference_passages=[passage.content for passage in passages]
+        )
+    
+    # 调用前校验每日token预算
+    usage_service = UsageService()
+    try:
+        if prompt_text is not None:
+            estimated_tokens = count_message_tokens([prompt_text])
+        else:
+            estimated_tokens = (
+                count_tokens(generate_request.context)
+                + sum(passage.token_count for passage in passages)
+                + sum(count_tokens(f"{label}：{value}") for label, value in facts.items())
+            )
+        usage_service.check_budget(db, current_user.id, estimated_tokens)
+    except BudgetExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+    
+    generation_event = {"report_id": report_id, "chapter_type": generate_request.chapter_type}
+    await event_bus.publish(current_user.id, EVENT_GENERATION_STATUS, {**generation_event, "status": "started"})
+    
     try:
         # 记录开始时间
         start_time = time.time()
@@ -64,131 +177,172 @@ async def generate_chapter(
             chapter_type=generate_request.chapter_type,
             context=generate_request.context,
             report_data=report,
-            prompt_template=generate_request.prompt_template
+            prompt_template=prompt_text,
+            reference_passages=[passage.content for passage in passages],
+            facts=facts
         )
         
         # 计算生成时间
         generation_time = time.time() - start_time
         
-        # 记录AI生成日志
-        ai_log = AIGenerationLog(
-            report_id=report_id,
-            chapter_type=generate_request.chapter_type,
-            prompt_text=generation_result.prompt_used,
-            generated_content=generation_result.content,
-            model_name=generation_result.model_name,
-            tokens_used=generation_result.tokens_used,
-            generation_time=generation_time
+        # 累加用户当日用量
+        usage_service.record_usage(
+            db,
+            current_user.id,
+            generation_result.prompt_tokens,
+            generation_result.completion_tokens
         )
         
-        db.add(ai_log)
-        
         # 更新报告章节内容
         setattr(report, generate_request.chapter_type, generation_result.content)
+        SearchService().index_report(db, report, [generate_request.chapter_type])
         
         db.commit()
+        await report_cache.invalidate(report_id)
         
-        return AIGenerateResponse(
+        # AI生成日志由后台批量写入，不占用请求耗时
+        generation_log_writer.enqueue(
+            report_id=report_id,
+            user_id=current_user.id,
+            prompt_version_id=prompt_version_id,
             chapter_type=generate_request.chapter_type,
+            prompt_text=generation_result.prompt_used,
             generated_content=generation_result.content,
+            model_name=generation_result.model_name,
             tokens_used=generation_result.tokens_used,
+            prompt_tokens=generation_result.prompt_tokens,
+            completion_tokens=generation_result.completion_tokens,
             generation_time=generation_time
         )
         
     except Exception as e:
         db.rollback()
+        await event_bus.publish(current_user.id, EVENT_GENERATION_STATUS, {**generation_event, "status": "failed"})
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"AI生成失败: {str(e)}"
         )
+    
+    await event_bus.publish(current_user.id, EVENT_GENERATION_STATUS, {
+        **generation_event,
+        "status": "completed",
+        "tokens_used": generation_result.tokens_used,
+        "generation_time": generation_time
+    })
+    
+    return AIGenerateResponse(
+        chapter_type=generate_request.chapter_type,
+        generated_content=generation_result.content,
+        tokens_used=generation_result.tokens_used,
+        generation_time=generation_time,
+        prompt_tokens=generation_result.prompt_tokens,
+        completion_tokens=generation_result.completion_tokens
+    )
 
 
 @router.get("/templates/{chapter_type}")
 async def get_prompt_templates(
     chapter_type: str,
-    insurance_type: str = None
+    insurance_type: str = None,
+    db: Session = Depends(get_db)
 ):
-    """获取章节的提示词模板"""
-    
-    # 预定义的提示词模板
-    templates = {
-        "accident_details": {
-            "default": """请根据以下信息生成事故经过及索赔章节：
-
-上下文信息：
-{context}
-
-请包括以下要点：
-1. 事故发生的时间、地点、经过
-2. 当事人信息
-3. 损失情况概述
-4. 索赔申请情况
-
-要求：
-- 语言专业、客观
-- 逻辑清晰、条理分明
-- 篇幅适中（300-500字）
-""",
-            "车险": """请根据以下信息生成车险事故经过及索赔章节：
-
-上下文信息：
-{context}
-
-请重点描述：
-1. 交通事故发生经过
-2. 车辆损坏情况
-3. 人员伤亡情况（如有）
-4. 交警处理情况
-5. 保险报案及理赔申请
-
-格式要求：
-- 时间线清晰
-- 责任认定明确
-- 损失描述详细
-"""
-        },
-        "site_investigation": {
-            "default": """请根据以下信息生成现场查勘情况章节：
-
-上下文信息：
-{context}
-
-请详细描述：
-1. 查勘时间、地点、参与人员
-2. 现场环境和条件
-3. 损失标的查勘情况
-4. 现场拍照和取证
-5. 相关人员询问记录
-
-要求：
-- 客观真实、详实准确
-- 重点突出、条理清晰
-- 为后续定损提供依据
-"""
-        }
-    }
-    
-    chapter_templates = templates.get(chapter_type, {})
+    """获取章节当前生效的提示词模板"""
     
-    if insurance_type and insurance_type in chapter_templates:
-        template = chapter_templates[insurance_type]
-    else:
-        template = chapter_templates.get("default", "暂无该章节模板")
+    prompt = PromptService().resolve(db, chapter_type, insurance_type)
     
     return {
         "chapter_type": chapter_type,
-        "template": template,
-        "available_types": list(chapter_templates.keys())
+        "template": prompt.content if prompt else "暂无该章节模板",
+        "version": prompt.version if prompt else None,
+        "version_id": prompt.id if prompt else None,
+        "available_types": prompt_registry.insurance_types(chapter_type)
     }
 
 
+@router.get("/prompts/stats", response_model=List[PromptVersionStatsResponse])
+async def get_prompt_stats(
+    chapter_type: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """按提示词版本对比生成次数、平均token用量和平均耗时"""
+    stats = PromptService().version_stats(db, chapter_type)
+    return [PromptVersionStatsResponse(**item._asdict()) for item in stats]
+
+
+@router.get("/prompts/{chapter_type}/versions", response_model=List[PromptVersionResponse])
+async def list_prompt_versions(
+    chapter_type: str,
+    insurance_type: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """获取章节的提示词版本列表"""
+    return PromptService().list_versions(db, chapter_type, insurance_type)
+
+
+@router.post(
+    "/prompts/{chapter_type}/versions",
+    response_model=PromptVersionResponse,
+    status_code=status.HTTP_201_CREATED
+)
+async def create_prompt_version(
+    chapter_type: str,
+    prompt_data: PromptVersionCreate,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_superuser)
+):
+    """新增提示词版本(仅管理员)"""
+    if chapter_type not in CHAPTER_TITLES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"无效的章节类型: {chapter_type}"
+        )
+    
+    try:
+        return PromptService().create_version(
+            db,
+            chapter_type,
+            prompt_data.content,
+            insurance_type=prompt_data.insurance_type.value if prompt_data.insurance_type else DEFAULT_INSURANCE_TYPE,
+            description=prompt_data.description,
+            user_id=current_user.id,
+            activate=prompt_data.activate
+        )
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="提示词版本号冲突，请稍后重试"
+        )
+
+
+@router.post("/prompts/versions/{version_id}/activate", response_model=PromptVersionResponse)
+async def activate_prompt_version(
+    version_id: int,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_superuser)
+):
+    """将指定提示词版本设为生效版本，可用于回滚(仅管理员)"""
+    prompt_service = PromptService()
+    prompt = prompt_service.get_version(db, version_id)
+    
+    if not prompt:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="提示词版本不存在"
+        )
+    
+    return prompt_service.activate_version(db, prompt)
+
+
 @router.get("/history/{report_id}")
 async def get_generation_history(
     report_id: int,
     skip: int = 0,
     limit: int = 10,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """获取报告的AI生成历史"""
     
@@ -204,10 +358,8 @@ async def get_generation_history(
             detail="报告不存在"
         )
     
-    # 获取生成历史
-    logs = db.query(AIGenerationLog).filter(
-        AIGenerationLog.report_id == report_id
-    ).order_by(AIGenerationLog.created_at.desc()).offset(skip).limit(limit).all()
+    # 获取最近的生成历史(只查询近期分区)
+    logs = GenerationLogService().history(db, report_id, skip, limit)
     
     return [
         {
@@ -227,9 +379,24 @@ async def get_generation_history(
 async def ai_chat(
     message: str,
     context: list = None,
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """AI聊天对话"""
+    # 调用前校验每日token预算
+    usage_service = UsageService()
+    try:
+        usage_service.check_budget(
+            db,
+            current_user.id,
+            count_message_tokens([*(str(item) for item in context or []), message])
+        )
+    except BudgetExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+    
     try:
         # 调用AI服务进行对话
         ai_service = AIService()
@@ -239,14 +406,67 @@ async def ai_chat(
             user_id=current_user.id
         )
         
+        # 累加用户当日用量
+        usage_service.record_usage(
+            db,
+            current_user.id,
+            response.prompt_tokens,
+            response.completion_tokens
+        )
+        db.commit()
+        
         return {
             "response": response.content,
             "tokens_used": response.tokens_used,
+            "prompt_tokens": response.prompt_tokens,
+            "completion_tokens": response.completion_tokens,
             "model": response.model_name
         }
         
     except Exception as e:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"AI对话失败: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+
+
+@router.get("/usage", response_model=TokenUsageResponse)
+async def get_token_usage(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """获取当前用户的token用量汇总(读取每日汇总表，不扫描生成日志)"""
+    end_date = end_date or utc_today()
+    start_date = start_date or end_date - timedelta(days=29)
+    
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="开始日期不能晚于结束日期"
+        )
+    
+    usage_service = UsageService()
+    rows = usage_service.get_usage(db, current_user.id, start_date, end_date)
+    summary = usage_service.summarize(rows)
+    
+    remaining_today = None
+    if DAILY_TOKEN_BUDGET > 0:
+        remaining_today = max(
+            DAILY_TOKEN_BUDGET - usage_service.get_daily_usage(db, current_user.id),
+            0
+        )
+    
+    return TokenUsageResponse(
+        start_date=start_date,
+        end_date=end_date,
+        prompt_tokens=summary.prompt_tokens,
+        completion_tokens=summary.completion_tokens,
+        total_tokens=summary.total_tokens,
+        request_count=summary.request_count,
+        daily=[DailyTokenUsage.model_validate(row) for row in rows],
+        daily_budget=DAILY_TOKEN_BUDGET if DAILY_TOKEN_BUDGET > 0 else None,
+        remaining_today=remaining_today
+    )
@@ -0,0 +1,112 @@
+"""
+认证API
+
+提供用户注册、登录、当前用户信息和用户停用功能
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.db.config import get_db
+from app.api.deps import get_current_superuser, get_current_user
+from app.core.security import AuthenticatedUser, create_access_token
+from app.schemas.auth import LoginRequest, RegisterRequest, TokenResponse, UserResponse
+from app.services.auth_service import AuthService, broadcast_user_changed, to_snapshot
+
+router = APIRouter()
+
+
+# 注册和登录计算bcrypt哈希(数百毫秒)，定义为同步接口在线程池中执行，不阻塞事件循环
+@router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+def register(
+    register_data: RegisterRequest,
+    db: Session = Depends(get_db)
+):
+    """注册新用户"""
+    auth_service = AuthService()
+    if auth_service.exists(db, register_data.username, register_data.email):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="用户名或邮箱已被注册"
+        )
+
+    user = auth_service.register(
+        db,
+        register_data.username,
+        register_data.email,
+        register_data.password
+    )
+    return UserResponse.model_validate(to_snapshot(user)._asdict())
+
+
+@router.post("/login", response_model=TokenResponse)
+def login(
+    login_data: LoginRequest,
+    db: Session = Depends(get_db)
+):
+    """用户名(或邮箱)密码登录，返回访问令牌"""
+    user = AuthService().authenticate(db, login_data.username, login_data.password)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="用户名或密码错误",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="用户已停用"
+        )
+
+    access_token, expires_in = create_access_token(user.id)
+    return TokenResponse(access_token=access_token, expires_in=expires_in)
+
+
+@router.get("/me", response_model=UserResponse)
+async def get_me(
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """获取当前用户信息"""
+    return UserResponse.model_validate(current_user._asdict())
+
+
+@router.post("/users/{user_id}/deactivate", response_model=UserResponse)
+async def deactivate_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_superuser)
+):
+    """停用用户(仅管理员)，已签发的令牌随即失效"""
+    user = AuthService().set_active(db, user_id, False)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+
+    await broadcast_user_changed(user_id)
+
+    return UserResponse.model_validate(to_snapshot(user)._asdict())
+
+
+@router.post("/users/{user_id}/activate", response_model=UserResponse)
+async def activate_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_superuser)
+):
+    """重新启用用户(仅管理员)"""
+    user = AuthService().set_active(db, user_id, True)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+
+    await broadcast_user_changed(user_id)
+
+    return UserResponse.model_validate(to_snapshot(user)._asdict())
@@ -0,0 +1,53 @@
+"""
+协作编辑API
+
+通过WebSocket以y-websocket协议同步章节的CRDT文档，
+前端使用 new WebsocketProvider(`${wsBase}/api/v1/collab/${reportId}`, chapterType, doc, { params: { token } })
+"""
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket, status
+
+from app.api.deps import resolve_token_user
+from app.db.config import SessionLocal
+from app.db.models import ReportDraft
+from app.services.collab_service import collab_service
+from app.services.prompt_service import CHAPTER_TITLES
+
+router = APIRouter()
+
+
+@router.websocket("/{report_id}/{chapter_type}")
+async def collaborate(
+    websocket: WebSocket,
+    report_id: int,
+    chapter_type: str,
+    token: str = Query(..., description="访问令牌")
+):
+    """协同编辑报告章节"""
+    db = SessionLocal()
+    try:
+        current_user = resolve_token_user(db, token)
+        report_exists = chapter_type in CHAPTER_TITLES and db.query(ReportDraft.id).filter(
+            ReportDraft.id == report_id,
+            ReportDraft.owner_id == current_user.id
+        ).first() is not None
+    except HTTPException:
+        report_exists = False
+    finally:
+        db.close()
+
+    if not report_exists:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    room = await collab_service.join(report_id, chapter_type, websocket)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                await collab_service.handle_message(room, websocket, message["bytes"])
+    finally:
+        await collab_service.leave(room, websocket)
@@ -0,0 +1,49 @@
+"""
+仪表盘API
+
+提供当前用户的报告、文件和AI用量统计(读取增量维护的计数器，不扫描报告列表)
+"""
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from app.db.config import get_db
+from app.api.deps import get_current_user
+from app.core.security import AuthenticatedUser
+from app.schemas.dashboard import (
+    AIUsageStatsResponse,
+    DashboardStatsResponse,
+    FileStatsResponse,
+    ReportStatsResponse
+)
+from app.services.stats_service import StatsService
+
+router = APIRouter()
+
+
+@router.get("/stats", response_model=DashboardStatsResponse)
+async def get_dashboard_stats(
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """获取当前用户的仪表盘统计"""
+    stats = StatsService().get_user_stats(db, current_user.id)
+
+    return DashboardStatsResponse(
+        reports=ReportStatsResponse(
+            total=sum(stats.reports_by_status.values()),
+            by_status=stats.reports_by_status,
+            by_insurance_type=stats.reports_by_insurance_type
+        ),
+        files=FileStatsResponse(
+            total=sum(stats.files_by_ocr_status.values()),
+            by_ocr_status=stats.files_by_ocr_status
+        ),
+        ai=AIUsageStatsResponse(
+            generation_count=stats.generation_count,
+            tokens_used=stats.tokens_used,
+            prompt_tokens=stats.prompt_tokens,
+            completion_tokens=stats.completion_tokens,
+            generation_time=stats.generation_time
+        )
+    )
@@ -0,0 +1,83 @@
+"""
+用户事件推送API
+
+通过SSE或WebSocket向当前用户推送OCR状态、OCR分页进度和AI生成状态，替代轮询
+"""
+
+import asyncio
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, status
+from fastapi.responses import StreamingResponse
+
+from app.api.deps import get_stream_user, resolve_token_user
+from app.core.events import event_bus
+from app.core.security import AuthenticatedUser
+from app.db.config import SessionLocal
+
+router = APIRouter()
+
+# SSE心跳间隔(秒)，防止代理因空闲断开连接
+SSE_KEEPALIVE_INTERVAL = float(os.getenv("SSE_KEEPALIVE_INTERVAL", "15"))
+
+
+@router.get("/stream")
+async def stream_events(
+    current_user: AuthenticatedUser = Depends(get_stream_user)
+):
+    """SSE事件流，每条消息的data为{"type": ..., "data": ...}"""
+
+    async def event_stream():
+        async with event_bus.subscribe(current_user.id) as queue:
+            yield f"retry: {int(SSE_KEEPALIVE_INTERVAL * 1000)}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/ws")
+async def events_websocket(
+    websocket: WebSocket,
+    token: str = Query(..., description="访问令牌")
+):
+    """WebSocket事件通道，消息格式与SSE相同"""
+    db = SessionLocal()
+    try:
+        current_user = resolve_token_user(db, token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        db.close()
+
+    await websocket.accept()
+
+    async def wait_disconnect() -> None:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    async with event_bus.subscribe(current_user.id) as queue:
+        disconnected = asyncio.create_task(wait_disconnect())
+        try:
+            while True:
+                next_message = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait(
+                    {next_message, disconnected},
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected in done:
+                    next_message.cancel()
+                    break
+                await websocket.send_text(next_message.result())
+        finally:
+            disconnected.cancel()
@@ -4,45 +4,151 @@
 提供文件上传、OCR识别等功能
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Form, HTTPException, Response, UploadFile, File, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Awaitable, Callable, Dict, List, Optional
+import hashlib
 import os
 import uuid
 import time
 from pathlib import Path
 
-from app.db.config import get_db
-from app.db.models import UploadedFile, User, OCRStatus
-from app.api.deps import get_current_user
-from app.schemas.files import FileUploadResponse, OCRResultResponse
-from app.services.ocr_service import OCRService
+from app.core.events import EVENT_OCR_PROGRESS, EVENT_OCR_STATUS, event_bus
+from app.core.metrics import OCR_FILES, OCR_QUEUE_DEPTH, OCR_STAGE_DURATION, observe_ocr_stage
+from app.core.tracing import attach_context, inject_context, traced, tracer
+from app.db.config import SessionLocal, get_db
+from app.db.models import UploadedFile, OCRStatus, ExtractedField, ReportDraft
+from app.api.deps import get_current_user, get_idempotency_key
+from app.core.security import AuthenticatedUser
+from app.core.singleflight import SingleFlight
+from app.schemas.files import (
+    FileUploadResponse,
+    OCRResultResponse,
+    ExtractedFieldResponse,
+    ExtractedFieldsResponse,
+    PresignedUploadRequest,
+    PresignedUploadResponse,
+    CompleteUploadRequest
+)
+from app.services.extraction_service import ExtractionService
+from app.services.idempotency_service import request_fingerprint
+from app.services.ocr_service import OCRResult, OCRService
+from app.services.retrieval_service import RetrievalService
+from app.services.search_service import DOC_TYPE_FILE, SearchService
+from app.services.storage_service import (
+    UPLOAD_KEY_PREFIX,
+    InvalidUploadSignatureError,
+    LocalStorage,
+    get_storage
+)
+from app.utils.idempotency import run_idempotent
 
 router = APIRouter()
 
 # 上传配置
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".tiff", ".bmp"}
 
+# 同一用户相同内容的上传、相同内容的OCR识别在进行中时合并
+upload_flight = SingleFlight("files.upload")
+ocr_flight = SingleFlight("files.ocr")
+
+
+def _validate_extension(filename: str) -> str:
+    """校验文件类型，返回小写扩展名"""
+    file_extension = Path(filename).suffix.lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的文件类型: {file_extension}"
+        )
+    return file_extension
+
+
+def _check_report_owner(db: Session, report_id: Optional[int], user_id: int) -> None:
+    """文件关联的报告必须属于当前用户，否则OCR文本和抽取的事实会进入他人报告"""
+    if report_id is None:
+        return
+    owned = db.query(ReportDraft.id).filter(
+        ReportDraft.id == report_id,
+        ReportDraft.owner_id == user_id
+    ).first()
+    if not owned:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="报告不存在"
+        )
+
+
+def _new_storage_key(user_id: int, file_extension: str) -> str:
+    """生成上传文件的对象键，按用户分目录便于校验归属"""
+    return f"{UPLOAD_KEY_PREFIX}{user_id}/{uuid.uuid4()}{file_extension}"
+
+
+def _register_upload(
+    db: Session,
+    background_tasks: BackgroundTasks,
+    key: str,
+    original_filename: str,
+    content_type: Optional[str],
+    file_size: int,
+    current_user: AuthenticatedUser,
+    report_id: Optional[int],
+    content_hash: Optional[str] = None
+) -> FileUploadResponse:
+    """登记已存入存储的文件并在响应返回后执行OCR"""
+    db_file = UploadedFile(
+        filename=Path(key).name,
+        original_filename=original_filename,
+        file_path=key,
+        file_type=content_type,
+        file_size=file_size,
+        uploader_id=current_user.id,
+        report_id=report_id,
+        ocr_status=OCRStatus.PENDING,
+        content_hash=content_hash
+    )
+    
+    db.add(db_file)
+    db.flush()
+    
+    # 索引文件名，OCR完成后再索引识别文本
+    SearchService().index_file(db, db_file)
+    
+    db.commit()
+    db.refresh(db_file)
+    
+    # 响应返回后在后台执行OCR，追踪上下文随参数传入
+    OCR_QUEUE_DEPTH.inc()
+    background_tasks.add_task(process_ocr_async, db_file.id, inject_context())
+    
+    return FileUploadResponse(
+        id=db_file.id,
+        filename=db_file.original_filename,
+        file_size=db_file.file_size,
+        ocr_status=db_file.ocr_status.value,
+        message="文件上传成功，OCR处理中..."
+    )
+
 
 @router.post("/upload", response_model=FileUploadResponse)
+@traced("upload_file")
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     report_id: int = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key)
 ):
-    """上传文件并触发OCR处理"""
+    """上传文件并触发OCR处理(文件经API转存；大文件建议使用/presign直传)
+
+    相同内容的上传在进行中时只保存和登记一次；带Idempotency-Key的重试重放首次上传的响应，不重复创建文件
+    """
     
     # 验证文件类型
-    file_extension = Path(file.filename).suffix.lower()
-    if file_extension not in ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"不支持的文件类型: {file_extension}"
-        )
+    file_extension = _validate_extension(file.filename)
+    _check_report_owner(db, report_id, current_user.id)
     
     # 验证文件大小
     content = await file.read()
@@ -52,47 +158,58 @@ async def upload_file(
             detail="文件大小超过限制(10MB)"
         )
     
+    content_hash = hashlib.sha256(content).hexdigest()
+    fingerprint = request_fingerprint(content_hash, file.filename, report_id)
+    
+    async def save() -> FileUploadResponse:
+        return await upload_flight.do(
+            (current_user.id, fingerprint),
+            lambda: _save_upload(db, background_tasks, file, file_extension, content, content_hash, current_user, report_id)
+        )
+    
+    return await run_idempotent(
+        db, current_user.id, "files.upload", idempotency_key, fingerprint, save,
+        response_model=FileUploadResponse
+    )
+
+
+async def _save_upload(
+    db: Session,
+    background_tasks: BackgroundTasks,
+    file: UploadFile,
+    file_extension: str,
+    content: bytes,
+    content_hash: str,
+    current_user: AuthenticatedUser,
+    report_id: Optional[int]
+) -> FileUploadResponse:
+    """保存上传内容并登记文件"""
+    storage = get_storage()
+    key = _new_storage_key(current_user.id, file_extension)
+    
     try:
-        # 生成唯一文件名
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
         # 保存文件
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
+        with tracer.start_as_current_span("upload_file.write", attributes={"file.size": len(content)}):
+            await storage.save(key, content, file.content_type)
         
-        # 创建文件记录
-        db_file = UploadedFile(
-            filename=unique_filename,
-            original_filename=file.filename,
-            file_path=str(file_path),
-            file_type=file.content_type,
-            file_size=len(content),
-            uploader_id=current_user.id,
-            report_id=report_id,
-            ocr_status=OCRStatus.PENDING
-        )
-        
-        db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
-        
-        # 异步触发OCR处理
-        # TODO: 这里应该使用任务队列(如Celery)来异步处理
-        await process_ocr_async(db_file.id, db)
-        
-        return FileUploadResponse(
-            id=db_file.id,
-            filename=db_file.original_filename,
-            file_size=db_file.file_size,
-            ocr_status=db_file.ocr_status.value,
-            message="文件上传成功，OCR处理中..."
+        return _register_upload(
+            db,
+            background_tasks,
+            key,
+            file.filename,
+            file.content_type,
+            len(content),
+            current_user,
+            report_id,
+            content_hash
         )
         
     except Exception as e:
         # 清理已上传的文件
-        if file_path.exists():
-            file_path.unlink()
+        try:
+            await storage.delete(key)
+        except Exception:
+            pass
         
         db.rollback()
         raise HTTPException(
@@ -101,34 +218,232 @@ async def upload_file(
         )
 
 
-async def process_ocr_async(file_id: int, db: Session):
-    """异步处理OCR识别"""
+@router.post("/presign", response_model=PresignedUploadResponse)
+async def presign_upload(
+    upload_request: PresignedUploadRequest,
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """签发直传凭证：客户端把文件直接上传到存储，完成后调用/complete登记"""
+    file_extension = _validate_extension(upload_request.filename)
+    if upload_request.file_size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="文件大小超过限制(10MB)"
+        )
+    
+    key = _new_storage_key(current_user.id, file_extension)
+    presigned = get_storage().presign_upload(key, upload_request.content_type, MAX_FILE_SIZE)
+    return PresignedUploadResponse(
+        key=key,
+        url=presigned.url,
+        fields=presigned.fields,
+        expires_in=presigned.expires_in
+    )
+
+
+@router.post("/complete", response_model=FileUploadResponse)
+async def complete_upload(
+    complete_request: CompleteUploadRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """直传完成后登记文件并触发OCR处理"""
+    key = complete_request.key
+    if not key.startswith(f"{UPLOAD_KEY_PREFIX}{current_user.id}/") or ".." in key:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权登记该文件"
+        )
+    _validate_extension(key)
+    _check_report_owner(db, complete_request.report_id, current_user.id)
+    
+    # 重复通知时返回已登记的记录
+    existing = db.query(UploadedFile).filter(UploadedFile.file_path == key).first()
+    if existing:
+        return FileUploadResponse(
+            id=existing.id,
+            filename=existing.original_filename,
+            file_size=existing.file_size,
+            ocr_status=existing.ocr_status.value,
+            message="文件已登记",
+            created_at=existing.created_at
+        )
+    
+    storage = get_storage()
+    file_size = await storage.size(key)
+    if file_size is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="文件尚未上传到存储"
+        )
+    if file_size > MAX_FILE_SIZE:
+        await storage.delete(key)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="文件大小超过限制(10MB)"
+        )
+    
     try:
-        # 获取文件记录
-        db_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
-        if not db_file:
-            return
-        
-        # 更新状态为处理中
-        db_file.ocr_status = OCRStatus.PROCESSING
-        db.commit()
-        
-        # 执行OCR识别
-        ocr_service = OCRService()
-        result = await ocr_service.process_file(db_file.file_path)
-        
-        # 更新OCR结果
-        db_file.ocr_text = result.text
-        db_file.ocr_confidence = result.confidence
-        db_file.ocr_status = OCRStatus.COMPLETED
-        
-        db.commit()
-        
+        return _register_upload(
+            db,
+            background_tasks,
+            key,
+            complete_request.filename,
+            complete_request.content_type or "application/octet-stream",
+            file_size,
+            current_user,
+            complete_request.report_id
+        )
     except Exception as e:
-        # 更新状态为失败
-        db_file.ocr_status = OCRStatus.FAILED
-        db.commit()
-        print(f"OCR处理失败: {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"文件登记失败: {str(e)}"
+        )
+
+
+@router.post("/direct-upload", status_code=status.HTTP_204_NO_CONTENT)
+async def direct_upload(
+    key: str = Form(...),
+    expires: int = Form(...),
+    max_size: int = Form(...),
+    signature: str = Form(...),
+    content_type: Optional[str] = Form(None, alias="Content-Type"),
+    file: UploadFile = File(...)
+):
+    """本地存储后端的直传地址，按/presign签发的签名鉴权(与S3预签名POST的表单格式一致)"""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="当前存储后端不支持该上传方式"
+        )
+    
+    try:
+        storage.verify_upload(key, expires, max_size, signature)
+    except InvalidUploadSignatureError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    
+    content = await file.read()
+    if not content or len(content) > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="文件大小超过限制"
+        )
+    
+    await storage.save(key, content, content_type or file.content_type)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def _publish_ocr_status(db_file: UploadedFile) -> None:
+    """向上传者推送OCR状态变化"""
+    await event_bus.publish(db_file.uploader_id, EVENT_OCR_STATUS, {
+        "file_id": db_file.id,
+        "report_id": db_file.report_id,
+        "ocr_status": db_file.ocr_status.value,
+        "ocr_confidence": db_file.ocr_confidence
+    })
+
+
+async def _recognize(
+    db: Session,
+    db_file: UploadedFile,
+    content: bytes,
+    on_page: Callable[[int, int], Awaitable[None]]
+) -> OCRResult:
+    """识别文件内容，相同内容的文件已识别完成时复用其结果"""
+    previous = db.query(UploadedFile.ocr_text, UploadedFile.ocr_confidence).filter(
+        UploadedFile.content_hash == db_file.content_hash,
+        UploadedFile.ocr_status == OCRStatus.COMPLETED,
+        UploadedFile.ocr_text.isnot(None),
+        UploadedFile.id != db_file.id
+    ).first()
+    if previous is not None:
+        return OCRResult(previous.ocr_text, previous.ocr_confidence or 0.0)
+    
+    return await OCRService().process_file(db_file.original_filename, content, on_page=on_page)
+
+
+async def process_ocr_async(file_id: int, trace_context: Optional[Dict[str, str]] = None):
+    """异步处理OCR识别(在后台运行，使用独立的数据库会话)"""
+    started = time.perf_counter()
+    db = SessionLocal()
+    db_file = None
+    try:
+        with attach_context(trace_context), tracer.start_as_current_span(
+            "process_ocr_async",
+            attributes={"file.id": file_id}
+        ) as span:
+            try:
+                # 获取文件记录
+                db_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+                if not db_file:
+                    return
+                
+                # 更新状态为处理中
+                db_file.ocr_status = OCRStatus.PROCESSING
+                db.commit()
+                await _publish_ocr_status(db_file)
+                
+                async def report_page(page: int, pages: int) -> None:
+                    await event_bus.publish(db_file.uploader_id, EVENT_OCR_PROGRESS, {
+                        "file_id": db_file.id,
+                        "report_id": db_file.report_id,
+                        "page": page,
+                        "pages": pages
+                    })
+                
+                # 从存储读取文件并执行OCR识别，相同内容的识别合并或复用
+                with observe_ocr_stage("download"):
+                    content = await get_storage().read(db_file.file_path)
+                if not db_file.content_hash:
+                    db_file.content_hash = hashlib.sha256(content).hexdigest()
+                with observe_ocr_stage("recognize"):
+                    result = await ocr_flight.do(
+                        db_file.content_hash,
+                        lambda: _recognize(db, db_file, content, report_page)
+                    )
+                
+                # 更新OCR结果
+                db_file.ocr_text = result.text
+                db_file.ocr_confidence = result.confidence
+                db_file.ocr_status = OCRStatus.COMPLETED
+                
+                # 抽取结构化字段，建立报告检索索引和全文检索索引
+                with observe_ocr_stage("extract"), tracer.start_as_current_span("ExtractionService.extract_file") as extract_span:
+                    try:
+                        ExtractionService().extract_file(db, db_file)
+                    except Exception as e:
+                        # 字段抽取失败不影响OCR结果，保留识别文本
+                        extract_span.record_exception(e)
+                        print(f"字段抽取失败: {str(e)}")
+                with observe_ocr_stage("index"), tracer.start_as_current_span("index_file"):
+                    RetrievalService().index_file(db, db_file)
+                    SearchService().index_file(db, db_file)
+                
+                with tracer.start_as_current_span("db.commit"):
+                    db.commit()
+                OCR_FILES.labels("completed").inc()
+                await _publish_ocr_status(db_file)
+                
+            except Exception as e:
+                # 更新状态为失败
+                span.record_exception(e)
+                db.rollback()
+                if db_file is not None:
+                    db_file.ocr_status = OCRStatus.FAILED
+                    db.commit()
+                    await _publish_ocr_status(db_file)
+                OCR_FILES.labels("failed").inc()
+                print(f"OCR处理失败: {str(e)}")
+    finally:
+        db.close()
+        OCR_QUEUE_DEPTH.dec()
+        OCR_STAGE_DURATION.labels("total").observe(time.perf_counter() - started)
 
 
 @router.get("/", response_model=List[FileUploadResponse])
@@ -137,7 +452,7 @@ async def get_files(
     limit: int = 20,
     report_id: int = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """获取用户上传的文件列表"""
     query = db.query(UploadedFile).filter(UploadedFile.uploader_id == current_user.id)
@@ -163,7 +478,7 @@ async def get_files(
 async def get_ocr_result(
     file_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """获取文件的OCR识别结果"""
     file = db.query(UploadedFile).filter(
@@ -205,11 +520,40 @@ async def get_ocr_result(
         )
 
 
+@router.get("/{file_id}/fields", response_model=ExtractedFieldsResponse)
+async def get_extracted_fields(
+    file_id: int,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """获取文件OCR文本中抽取出的结构化字段"""
+    file = db.query(UploadedFile).filter(
+        UploadedFile.id == file_id,
+        UploadedFile.uploader_id == current_user.id
+    ).first()
+    
+    if not file:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="文件不存在"
+        )
+    
+    fields = db.query(ExtractedField).filter(
+        ExtractedField.file_id == file_id
+    ).order_by(ExtractedField.start_offset.asc()).all()
+    
+    return ExtractedFieldsResponse(
+        file_id=file_id,
+        rule_version=fields[0].rule_version if fields else None,
+        fields=[ExtractedFieldResponse.model_validate(field) for field in fields]
+    )
+
+
 @router.delete("/{file_id}")
 async def delete_file(
     file_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """删除文件"""
     file = db.query(UploadedFile).filter(
@@ -224,12 +568,13 @@ async def delete_file(
         )
     
     try:
-        # 删除物理文件
-        file_path = Path(file.file_path)
-        if file_path.exists():
-            file_path.unlink()
+        # 删除存储中的文件
+        await get_storage().delete(file.file_path)
         
-        # 删除数据库记录
+        # 删除检索索引和数据库记录
+        ExtractionService().remove_file(db, file.id)
+        RetrievalService().remove_file(db, file.id, file.report_id)
+        SearchService().remove_document(db, DOC_TYPE_FILE, file.id)
         db.delete(file)
         db.commit()
         
@@ -4,30 +4,52 @@
 提供报告的CRUD操作接口
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
+from pathlib import Path
 
 from app.db.config import get_db
-from app.db.models import ReportDraft, User, ReportStatus, InsuranceType
+from app.db.models import ReportDraft, ReportStatus, InsuranceType, ExportJobStatus
 from app.api.deps import get_current_user
+from app.core.security import AuthenticatedUser
 from app.schemas.reports import (
     ReportCreate, 
     ReportUpdate, 
     ReportResponse, 
     ReportListResponse,
-    ChapterUpdateRequest
+    ChapterUpdateRequest,
+    BatchExportRequest,
+    ExportJobResponse
 )
+from app.schemas.files import ReportFactsResponse
+from app.utils.http import etag_matches, ranged_file_response
+from app.utils.serialization import FastJSONResponse, json_dumps, model_columns, row_to_dict, rows_to_list
+from app.services.batch_export_service import BatchExportService
+from app.services.export_service import (
+    EXPORT_FORMATS,
+    ExportError,
+    ExportService,
+    build_payload
+)
+from app.services.extraction_service import ExtractionService
+from app.services.report_cache_service import report_cache, report_etag
+from app.services.search_service import DOC_TYPE_REPORT, REPORT_FIELDS, SearchService
 
 router = APIRouter()
 
+# 列表和详情接口只查询响应模型需要的列
+REPORT_LIST_COLUMNS = model_columns(ReportListResponse, ReportDraft)
+REPORT_DETAIL_COLUMNS = model_columns(ReportResponse, ReportDraft)
+
 
 @router.post("/", response_model=ReportResponse, status_code=status.HTTP_201_CREATED)
 async def create_report(
     report_data: ReportCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """创建新报告"""
     try:
@@ -39,6 +61,11 @@ async def create_report(
         )
         
         db.add(db_report)
+        db.flush()
+        
+        # 建立全文检索索引
+        SearchService().index_report(db, db_report, ["title"])
+        
         db.commit()
         db.refresh(db_report)
         
@@ -59,10 +86,10 @@ async def get_reports(
     status_filter: Optional[str] = None,
     insurance_type_filter: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """获取用户的报告列表"""
-    query = db.query(ReportDraft).filter(ReportDraft.owner_id == current_user.id)
+    query = db.query(*REPORT_LIST_COLUMNS).filter(ReportDraft.owner_id == current_user.id)
     
     # 状态过滤
     if status_filter:
@@ -87,19 +114,148 @@ async def get_reports(
             )
     
     # 分页和排序
-    reports = query.order_by(ReportDraft.updated_at.desc()).offset(skip).limit(limit).all()
+    rows = query.order_by(ReportDraft.updated_at.desc()).offset(skip).limit(limit).all()
+    
+    return FastJSONResponse(rows_to_list(rows))
+
+
+@router.post(
+    "/export/batch",
+    response_model=ExportJobResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def create_batch_export(
+    export_request: BatchExportRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """按筛选条件批量导出报告为ZIP，后台执行"""
+    if export_request.format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="不支持的导出格式"
+        )
+    
+    filters = {
+        "status": export_request.status.value if export_request.status else None,
+        "insurance_type": export_request.insurance_type.value if export_request.insurance_type else None,
+        "created_from": export_request.created_from.isoformat() if export_request.created_from else None,
+        "created_to": export_request.created_to.isoformat() if export_request.created_to else None,
+    }
+    
+    batch_service = BatchExportService()
+    job = batch_service.create_job(db, current_user.id, filters, export_request.format)
+    background_tasks.add_task(batch_service.run_job, job.id)
     
-    return [ReportListResponse.from_orm(report) for report in reports]
+    return ExportJobResponse.from_orm(job)
+
+
+@router.get("/export/batch/{job_id}", response_model=ExportJobResponse)
+async def get_batch_export(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """查询批量导出任务进度"""
+    job = BatchExportService().get_job(db, job_id, current_user.id)
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="导出任务不存在"
+        )
+    
+    return ExportJobResponse.from_orm(job)
+
+
+@router.get("/export/batch/{job_id}/download")
+async def download_batch_export(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """下载批量导出的ZIP文件，支持Range断点续传"""
+    job = BatchExportService().get_job(db, job_id, current_user.id)
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="导出任务不存在"
+        )
+    
+    if job.status != ExportJobStatus.COMPLETED or not job.archive_path:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="导出任务尚未完成"
+        )
+    
+    return ranged_file_response(
+        request,
+        Path(job.archive_path),
+        media_type="application/zip",
+        filename=f"公估报告批量导出_{job.id[:8]}.zip",
+        etag=job.id
+    )
 
 
 @router.get("/{report_id}", response_model=ReportResponse)
 async def get_report(
     report_id: int,
+    request: Request,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
-    """获取单个报告详情"""
-    report = db.query(ReportDraft).filter(
+    """获取单个报告详情，内容未变化时返回304，否则优先返回缓存的序列化结果"""
+    # 只查询版本号，命中ETag或缓存时不再读取章节正文
+    current = db.query(ReportDraft.version).filter(
+        ReportDraft.id == report_id,
+        ReportDraft.owner_id == current_user.id
+    ).first()
+    
+    if not current:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="报告不存在"
+        )
+    
+    version = current.version
+    etag = report_etag(report_id, version)
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+        )
+    
+    body = await report_cache.get(report_id, version)
+    if body is None:
+        row = db.query(*REPORT_DETAIL_COLUMNS).filter(ReportDraft.id == report_id).first()
+        if not row:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="报告不存在"
+            )
+        # 两次查询之间报告可能已被更新，以实际读到的版本为准
+        version = row.version
+        etag = report_etag(report_id, version)
+        body = json_dumps(row_to_dict(row))
+        await report_cache.put(report_id, version, body)
+    
+    return FastJSONResponse(
+        body,
+        headers={"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    )
+
+
+@router.get("/{report_id}/facts", response_model=ReportFactsResponse)
+async def get_report_facts(
+    report_id: int,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """获取从报告关联文件中抽取出的结构化事实"""
+    report = db.query(ReportDraft.id).filter(
         ReportDraft.id == report_id,
         ReportDraft.owner_id == current_user.id
     ).first()
@@ -110,7 +266,10 @@ async def get_report(
             detail="报告不存在"
         )
     
-    return ReportResponse.from_orm(report)
+    return ReportFactsResponse(
+        report_id=report_id,
+        facts=ExtractionService().get_report_facts(db, report_id)
+    )
 
 
 @router.put("/{report_id}", response_model=ReportResponse)
@@ -118,7 +277,7 @@ async def update_report(
     report_id: int,
     report_update: ReportUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """更新报告"""
     report = db.query(ReportDraft).filter(
@@ -140,8 +299,14 @@ async def update_report(
         
         report.updated_at = datetime.utcnow()
         
+        # 增量更新变更字段的检索索引
+        indexed_fields = [field for field in update_data if field in REPORT_FIELDS]
+        if indexed_fields:
+            SearchService().index_report(db, report, indexed_fields)
+        
         db.commit()
         db.refresh(report)
+        await report_cache.invalidate(report.id)
         
         return ReportResponse.from_orm(report)
     
@@ -159,7 +324,7 @@ async def update_chapter(
     chapter_type: str,
     chapter_data: ChapterUpdateRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """更新报告章节内容"""
     report = db.query(ReportDraft).filter(
@@ -194,7 +359,10 @@ async def update_chapter(
         setattr(report, valid_chapters[chapter_type], chapter_data.content)
         report.updated_at = datetime.utcnow()
         
+        SearchService().index_report(db, report, [valid_chapters[chapter_type]])
+        
         db.commit()
+        await report_cache.invalidate(report.id)
         
         return {"message": "章节更新成功", "chapter_type": chapter_type}
     
@@ -210,7 +378,7 @@ async def update_chapter(
 async def delete_report(
     report_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """删除报告"""
     report = db.query(ReportDraft).filter(
@@ -225,8 +393,10 @@ async def delete_report(
         )
     
     try:
+        SearchService().remove_document(db, DOC_TYPE_REPORT, report.id)
         db.delete(report)
         db.commit()
+        await report_cache.invalidate(report_id)
         
         return {"message": "报告删除成功"}
     
@@ -241,11 +411,12 @@ async def delete_report(
 @router.get("/{report_id}/export")
 async def export_report(
     report_id: int,
+    request: Request,
     format: str = "docx",
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
-    """导出报告"""
+    """导出报告，内容未变化时直接返回缓存文件，支持Range断点续传"""
     report = db.query(ReportDraft).filter(
         ReportDraft.id == report_id,
         ReportDraft.owner_id == current_user.id
@@ -257,15 +428,24 @@ async def export_report(
             detail="报告不存在"
         )
     
-    if format not in ["docx", "pdf"]:
+    if format not in EXPORT_FORMATS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="不支持的导出格式"
         )
     
-    # TODO: 实现报告导出逻辑
-    return {
-        "message": "导出功能待实现",
-        "report_id": report_id,
-        "format": format
-    } 
\ No newline at end of file
+    try:
+        artifact = await ExportService().export(build_payload(report), format)
+    except ExportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"导出报告失败: {str(e)}"
+        )
+    
+    return ranged_file_response(
+        request,
+        artifact.path,
+        media_type=artifact.media_type,
+        filename=f"{report.title}_{report.id}.{format}",
+        etag=artifact.content_hash
+    )
@@ -0,0 +1,53 @@
+"""
+全文检索API
+
+提供报告标题、章节内容和OCR文本的全文检索
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import Optional
+import time
+
+from app.db.config import get_db
+from app.api.deps import get_current_user
+from app.core.security import AuthenticatedUser
+from app.schemas.search import SearchHitResponse, SearchResponse
+from app.services.search_service import DOC_TYPE_FILE, DOC_TYPE_REPORT, SearchService
+
+router = APIRouter()
+
+
+@router.get("/", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200, description="检索词"),
+    doc_type: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """检索当前用户的报告与OCR文本"""
+    if doc_type and doc_type not in (DOC_TYPE_REPORT, DOC_TYPE_FILE):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"无效的文档类型: {doc_type}"
+        )
+    
+    start_time = time.perf_counter()
+    result = SearchService().search(
+        db,
+        current_user.id,
+        q,
+        doc_type=doc_type,
+        skip=skip,
+        limit=limit
+    )
+    
+    return SearchResponse(
+        query=q,
+        total=result.total,
+        total_estimated=result.estimated,
+        items=[SearchHitResponse(**hit._asdict()) for hit in result.hits],
+        took_ms=round((time.perf_counter() - start_time) * 1000, 2)
+    )
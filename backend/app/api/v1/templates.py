@@ -5,12 +5,24 @@
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer_group
 from typing import List, Optional
 
 from app.db.config import get_db
 from app.api.deps import get_current_user
-from app.db.models import User
+from app.core.security import AuthenticatedUser
+from app.db.models import InsuranceType, ReportDraft
+from app.schemas.templates import (
+    TemplateCreate,
+    TemplateUpdate,
+    TemplateFillRequest,
+    TemplateBatchFillRequest,
+    TemplateFillResponse,
+    TemplateBatchFillResponse
+)
+from app.services.template_fill_service import FillResult, TemplateFillService
+from app.services.template_service import TemplateService, serialize_template
+from app.services.usage_service import BudgetExceededError, UsageService
 
 router = APIRouter()
 
@@ -21,100 +33,16 @@ async def get_templates(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """获取模板列表"""
-    
-    # 模拟模板数据
-    templates = [
-        {
-            "id": 1,
-            "type": "accident_details",
-            "title": "车辆事故经过模板",
-            "content": """根据现场勘查和当事人陈述，事故发生经过如下：
-
-1. 事故发生时间：{事故时间}
-2. 事故发生地点：{事故地点}
-3. 天气条件：{天气情况}
-4. 道路状况：{道路状况}
-5. 事故经过：{详细经过}
-
-当事人陈述：
-- 投保人陈述：{投保人陈述}
-- 第三方陈述：{第三方陈述}
-
-证据材料：
-- 现场照片：{照片数量}张
-- 交警认定书：{是否有}
-- 其他证据：{其他证据}""",
-            "isDefault": True,
-            "createdAt": "2024-01-15",
-            "updatedAt": "2024-03-01"
-        },
-        {
-            "id": 2,
-            "type": "loss_assessment",
-            "title": "财产损失核定模板", 
-            "content": """根据现场查勘和相关资料，损失核定情况如下：
-
-一、受损财产清单
-{财产清单}
-
-二、损失程度评估
-1. 完全损毁：{完全损毁项目}
-2. 部分损坏：{部分损坏项目}
-3. 可修复项目：{可修复项目}
-
-三、损失金额核定
-1. 直接损失：￥{直接损失金额}
-2. 间接损失：￥{间接损失金额}
-3. 合计损失：￥{总损失金额}
-
-四、核定依据
-- 市场价格调研：{价格依据}
-- 专业评估报告：{评估报告}
-- 维修报价单：{维修报价}""",
-            "isDefault": True,
-            "createdAt": "2024-01-20",
-            "updatedAt": "2024-02-28"
-        },
-        {
-            "id": 3,
-            "type": "conclusion",
-            "title": "公估结论标准模板",
-            "content": """综合本次事故的调查情况，现作出如下公估结论：
-
-一、事故责任认定
-{责任认定结果}
-
-二、保险责任分析
-1. 保险标的：{保险标的}
-2. 承保风险：{承保风险}
-3. 免责条款：{免责条款分析}
-4. 责任结论：{责任结论}
-
-三、损失核定结论
-1. 认定损失：￥{认定损失}
-2. 免赔额：￥{免赔额}
-3. 赔偿金额：￥{赔偿金额}
-
-四、处理建议
-{处理建议}
-
-以上结论供保险公司理赔参考。""",
-            "isDefault": True,
-            "createdAt": "2024-02-01",
-            "updatedAt": "2024-03-05"
-        }
-    ]
-    
-    # 根据类型筛选
-    if template_type:
-        templates = [t for t in templates if t["type"] == template_type]
-    
-    # 分页
-    total = len(templates)
-    templates = templates[skip:skip + limit]
+    total, templates = TemplateService().list_templates(
+        db,
+        current_user.id,
+        chapter_type=template_type,
+        skip=skip,
+        limit=limit
+    )
     
     return {
         "items": templates,
@@ -128,117 +56,235 @@ async def get_templates(
 async def get_template(
     template_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """获取单个模板详情"""
+    cached = TemplateService().get_cached(db, template_id, current_user.id)
     
-    # 模拟获取模板
-    template = {
-        "id": template_id,
-        "type": "accident_details",
-        "title": "车辆事故经过模板",
-        "content": """根据现场勘查和当事人陈述，事故发生经过如下：
-
-1. 事故发生时间：{事故时间}
-2. 事故发生地点：{事故地点}
-3. 天气条件：{天气情况}
-4. 道路状况：{道路状况}
-5. 事故经过：{详细经过}
-
-当事人陈述：
-- 投保人陈述：{投保人陈述}
-- 第三方陈述：{第三方陈述}
-
-证据材料：
-- 现场照片：{照片数量}张
-- 交警认定书：{是否有}
-- 其他证据：{其他证据}""",
-        "isDefault": True,
-        "createdAt": "2024-01-15",
-        "updatedAt": "2024-03-01"
-    }
+    if not cached:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="模板不存在"
+        )
     
-    return template
+    return cached.data
 
 
-@router.post("/")
+@router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_template(
-    template_data: dict,
+    template_data: TemplateCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """创建新模板"""
+    try:
+        template = TemplateService().create_template(
+            db,
+            current_user.id,
+            chapter_type=template_data.type,
+            title=template_data.title,
+            content=template_data.content,
+            description=template_data.description,
+            insurance_type=InsuranceType(template_data.insurance_type.value) if template_data.insurance_type else None
+        )
+        return serialize_template(template)
     
-    # 验证必需字段
-    required_fields = ["type", "title", "content"]
-    for field in required_fields:
-        if field not in template_data or not template_data[field]:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"缺少必需字段: {field}"
-            )
-    
-    # 模拟创建模板
-    new_template = {
-        "id": 999,  # 模拟新ID
-        "type": template_data["type"],
-        "title": template_data["title"],
-        "content": template_data["content"],
-        "isDefault": False,
-        "createdAt": "2024-03-16",
-        "updatedAt": "2024-03-16"
-    }
-    
-    return new_template
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"创建模板失败: {str(e)}"
+        )
 
 
 @router.put("/{template_id}")
 async def update_template(
     template_id: int,
-    template_data: dict,
+    template_data: TemplateUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """更新模板"""
+    template_service = TemplateService()
+    template = template_service.get_editable(db, template_id, current_user.id)
     
-    # 验证模板存在（模拟）
-    if template_id not in [1, 2, 3]:
+    if not template:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="模板不存在"
         )
     
-    # 模拟更新模板
-    updated_template = {
-        "id": template_id,
-        "type": template_data.get("type", "accident_details"),
-        "title": template_data.get("title", "更新的模板"),
-        "content": template_data.get("content", "更新的内容"),
-        "isDefault": False,
-        "createdAt": "2024-01-15",
-        "updatedAt": "2024-03-16"
-    }
+    # 默认模板所有用户共用，只有管理员可以修改
+    if template.is_default and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="默认模板只有管理员可以修改"
+        )
+    
+    changes = template_data.dict(exclude_unset=True)
+    if changes.get("insurance_type"):
+        changes["insurance_type"] = InsuranceType(changes["insurance_type"].value)
+    
+    try:
+        template = template_service.update_template(db, template, changes)
+        return serialize_template(template)
     
-    return updated_template
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"更新模板失败: {str(e)}"
+        )
 
 
 @router.delete("/{template_id}")
 async def delete_template(
     template_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """删除模板"""
+    template_service = TemplateService()
+    template = template_service.get_editable(db, template_id, current_user.id)
     
-    # 验证模板存在且不是默认模板（模拟）
-    if template_id in [1, 2, 3]:
+    if not template:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="模板不存在"
+        )
+    
+    if template.is_default:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="默认模板不能删除"
         )
     
-    # 模拟删除
-    return {"message": "模板删除成功"}
+    try:
+        template_service.delete_template(db, template)
+        return {"message": "模板删除成功"}
+    
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"删除模板失败: {str(e)}"
+        )
+
+
+def _fill_response(template_id: int, report_id: int, result: FillResult) -> TemplateFillResponse:
+    """填充结果转换为响应"""
+    return TemplateFillResponse(
+        template_id=template_id,
+        report_id=report_id,
+        content=result.content,
+        filled=result.filled,
+        missing=result.missing,
+        ai_filled=result.ai_filled,
+        tokens_used=result.prompt_tokens + result.completion_tokens
+    )
+
+
+def _ai_budget_check(db: Session, user_id: int):
+    """AI回退前按实际组装的提示词校验每日token预算"""
+    def check(prompt_tokens: int, calls: int):
+        try:
+            UsageService().check_budget(db, user_id, prompt_tokens, calls)
+        except BudgetExceededError as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e)
+            )
+    return check
+
+
+def _record_ai_usage(db: Session, user_id: int, results: List[FillResult]):
+    """记录AI回退消耗的token"""
+    prompt_tokens = sum(result.prompt_tokens for result in results)
+    completion_tokens = sum(result.completion_tokens for result in results)
+    if prompt_tokens or completion_tokens:
+        UsageService().record_usage(db, user_id, prompt_tokens, completion_tokens)
+        db.commit()
+
+
+@router.post("/{template_id}/fill", response_model=TemplateFillResponse)
+async def fill_template(
+    template_id: int,
+    fill_request: TemplateFillRequest,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """用报告事实填充模板，仅对无法填充的占位符回退到AI"""
+    cached = TemplateService().get_cached(db, template_id, current_user.id)
+    if not cached:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="模板不存在"
+        )
+    
+    report = db.query(ReportDraft).filter(
+        ReportDraft.id == fill_request.report_id,
+        ReportDraft.owner_id == current_user.id
+    ).first()
+    if not report:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="报告不存在"
+        )
+    
+    result = await TemplateFillService().fill_report(
+        db,
+        cached.compiled,
+        report,
+        overrides=fill_request.facts,
+        use_ai=fill_request.use_ai,
+        context=fill_request.context,
+        budget_check=_ai_budget_check(db, current_user.id)
+    )
+    _record_ai_usage(db, current_user.id, [result])
+    
+    return _fill_response(template_id, report.id, result)
+
+
+@router.post("/{template_id}/fill/batch", response_model=TemplateBatchFillResponse)
+async def fill_template_batch(
+    template_id: int,
+    fill_request: TemplateBatchFillRequest,
+    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """批量为多个报告填充同一模板"""
+    cached = TemplateService().get_cached(db, template_id, current_user.id)
+    if not cached:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="模板不存在"
+        )
+    
+    report_ids = list(dict.fromkeys(fill_request.report_ids))
+    reports = db.query(ReportDraft).options(undefer_group("content")).filter(
+        ReportDraft.id.in_(report_ids),
+        ReportDraft.owner_id == current_user.id
+    ).all()
+    found = {report.id for report in reports}
+    
+    results = await TemplateFillService().fill_reports(
+        db,
+        cached.compiled,
+        reports,
+        use_ai=fill_request.use_ai,
+        budget_check=_ai_budget_check(db, current_user.id)
+    )
+    _record_ai_usage(db, current_user.id, list(results.values()))
+    
+    return TemplateBatchFillResponse(
+        template_id=template_id,
+        items=[
+            _fill_response(template_id, report_id, results[report_id])
+            for report_id in report_ids
+            if report_id in found
+        ],
+        not_found=[report_id for report_id in report_ids if report_id not in found]
+    )
 
 
 @router.get("/types/available")
@@ -0,0 +1,181 @@
+"""
+用户事件通道
+
+按用户推送OCR状态、OCR分页进度和AI生成状态等事件，替代前端轮询。
+配置Redis时事件经Redis发布订阅在多个后端进程间扇出，每个进程只订阅本进程上有连接的用户频道；
+未配置Redis时只在本进程内分发。
+另有所有进程都订阅的广播频道，用于在各进程间同步缓存失效等进程级事件
+"""
+
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+
+from redis.exceptions import RedisError
+
+from app.core.redis import get_redis, redis_configured
+
+# 每个连接缓存的未发送事件数，超出时丢弃最旧的事件
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_CHANNEL_PREFIX = "events:user:"
+BROADCAST_CHANNEL = "events:broadcast"
+# Redis订阅读取超时(秒)，同时决定空闲监听任务的退出延迟
+LISTEN_TIMEOUT = 1.0
+# Redis异常后的重试间隔(秒)
+RECONNECT_DELAY = 1.0
+
+# 事件类型
+EVENT_OCR_STATUS = "ocr_status"
+EVENT_OCR_PROGRESS = "ocr_progress"
+EVENT_GENERATION_STATUS = "generation_status"
+# 广播事件类型
+EVENT_USER_CHANGED = "user_changed"
+
+# 广播事件处理函数，参数为事件数据
+BroadcastHandler = Callable[[Dict[str, Any]], None]
+
+
+def _channel(user_id: int) -> str:
+    return f"{EVENT_CHANNEL_PREFIX}{user_id}"
+
+
+class EventBus:
+    """按用户分发的事件总线"""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._handlers: Dict[str, List[BroadcastHandler]] = {}
+        self._broadcast_subscribed = False
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def publish(self, user_id: int, event_type: str, data: Dict[str, Any]) -> None:
+        """向用户的所有连接(可能在其他进程上)推送事件"""
+        message = json.dumps({"type": event_type, "data": data}, ensure_ascii=False, default=str)
+        if redis_configured():
+            try:
+                await get_redis().publish(_channel(user_id), message)
+                return
+            except RedisError as e:
+                print(f"事件发布失败，改为本进程内分发: {str(e)}")
+        self._dispatch(user_id, message)
+
+    def on_broadcast(self, event_type: str, handler: BroadcastHandler) -> None:
+        """登记广播事件的处理函数(同步执行，应只做缓存失效等轻量操作)"""
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    async def broadcast(self, event_type: str, data: Dict[str, Any]) -> None:
+        """向所有进程(含本进程)广播事件，未配置Redis或发布失败时只在本进程处理"""
+        message = json.dumps({"type": event_type, "data": data}, ensure_ascii=False, default=str)
+        if redis_configured():
+            try:
+                await get_redis().publish(BROADCAST_CHANNEL, message)
+                return
+            except RedisError as e:
+                print(f"广播事件发布失败，改为本进程内处理: {str(e)}")
+        self._handle_broadcast(message)
+
+    def _handle_broadcast(self, message: str) -> None:
+        event = json.loads(message)
+        for handler in self._handlers.get(event["type"], ()):
+            try:
+                handler(event["data"])
+            except Exception as e:
+                print(f"广播事件处理失败 {event['type']}: {str(e)}")
+
+    async def start(self) -> None:
+        """订阅广播频道(配置Redis时)，进程运行期间保持监听"""
+        if not redis_configured() or self._broadcast_subscribed:
+            return
+        try:
+            if self._pubsub is None:
+                self._pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(BROADCAST_CHANNEL)
+        except RedisError as e:
+            print(f"订阅广播事件失败: {str(e)}")
+            return
+        self._broadcast_subscribed = True
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    def _dispatch(self, user_id: int, message: str) -> None:
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int) -> AsyncIterator[asyncio.Queue]:
+        """订阅用户事件，返回的队列中为JSON格式的事件({"type": ..., "data": ...})"""
+        queue: asyncio.Queue = asyncio.Queue(EVENT_QUEUE_SIZE)
+        queues = self._subscribers.setdefault(user_id, set())
+        queues.add(queue)
+        if len(queues) == 1 and redis_configured():
+            await self._redis_subscribe(user_id)
+        try:
+            yield queue
+        finally:
+            queues.discard(queue)
+            if not queues and self._subscribers.get(user_id) is queues:
+                del self._subscribers[user_id]
+                if redis_configured():
+                    await self._redis_unsubscribe(user_id)
+
+    def subscriber_count(self) -> int:
+        """本进程上的连接数"""
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    async def _redis_subscribe(self, user_id: int) -> None:
+        try:
+            if self._pubsub is None:
+                self._pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(_channel(user_id))
+        except RedisError as e:
+            print(f"订阅用户事件失败: {str(e)}")
+            return
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _redis_unsubscribe(self, user_id: int) -> None:
+        if self._pubsub is None:
+            return
+        try:
+            await self._pubsub.unsubscribe(_channel(user_id))
+        except RedisError as e:
+            print(f"取消订阅用户事件失败: {str(e)}")
+
+    async def _listen(self) -> None:
+        """读取Redis订阅消息并分发给本进程的连接或广播处理函数，未订阅广播且没有连接时退出"""
+        while self._subscribers or self._broadcast_subscribed:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=LISTEN_TIMEOUT)
+            except RedisError as e:
+                print(f"读取用户事件失败: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            if message and message["type"] == "message":
+                if message["channel"] == BROADCAST_CHANNEL:
+                    self._handle_broadcast(message["data"])
+                    continue
+                user_id = int(message["channel"][len(EVENT_CHANNEL_PREFIX):])
+                self._dispatch(user_id, message["data"])
+
+    async def close(self) -> None:
+        """停止监听并关闭订阅连接"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self._broadcast_subscribed = False
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+
+event_bus = EventBus()
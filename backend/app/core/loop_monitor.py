@@ -0,0 +1,151 @@
+"""
+事件循环阻塞检测
+
+事件循环内的心跳任务按固定间隔测量调度延迟；另起监视线程在心跳停滞超过阈值时
+抓取事件循环线程的调用栈，并据此定位正在执行的路由。每次阻塞记录时长、路由和阻塞位置，
+输出日志并按路由计数，用于发现async处理函数中的同步数据库调用、文件读写等阻塞操作
+"""
+
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.metrics import (
+    EVENT_LOOP_BLOCKED_SECONDS,
+    EVENT_LOOP_BLOCKS,
+    EVENT_LOOP_LAG,
+    collect_route_paths
+)
+
+# 检测配置
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.05"))
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))
+# 保留的最近阻塞记录数和每条记录的栈深度
+LOOP_BLOCK_HISTORY = 100
+BLOCK_STACK_LIMIT = 30
+# 日志中输出的栈帧数
+BLOCK_LOG_FRAMES = 8
+
+# 阻塞发生在请求之外(启动、后台任务调度等)或未抓到调用栈时的路由标签
+NO_ROUTE = "<none>"
+
+
+class BlockEvent(NamedTuple):
+    """一次事件循环阻塞"""
+    occurred_at: datetime
+    duration: float
+    route: str
+    stack: List[str]
+
+
+class LoopMonitor:
+    """事件循环阻塞检测器"""
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.events: Deque[BlockEvent] = deque(maxlen=LOOP_BLOCK_HISTORY)
+        self._code_routes: Dict[Any, str] = {}
+        self._loop_thread: Optional[int] = None
+        self._last_beat = time.monotonic()
+        # (抓取时的心跳时间, 路由, 调用栈)
+        self._capture: Optional[Tuple[float, str, List[str]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, routes: List[Any]) -> None:
+        """在事件循环内启动心跳任务和监视线程"""
+        if self.running:
+            return
+
+        self._code_routes = {
+            getattr(inspect.unwrap(endpoint), "__code__", None): path
+            for endpoint, path in collect_route_paths(routes).items()
+        }
+        self._code_routes.pop(None, None)
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        """停止检测"""
+        if not self.running:
+            return
+
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._thread = None
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+
+            previous_beat = self._last_beat
+            self._last_beat = time.monotonic()
+            capture, self._capture = self._capture, None
+
+            EVENT_LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                # 只采用本次停滞期间抓到的调用栈
+                if capture is not None and capture[0] == previous_beat:
+                    self._record(lag, capture[1], capture[2])
+                else:
+                    self._record(lag, NO_ROUTE, [])
+
+    def _watch(self) -> None:
+        """监视线程：心跳停滞超过阈值时抓取一次事件循环线程的调用栈"""
+        captured_beat = None
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            if beat == captured_beat or time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            route, stack = self._capture_stack()
+            self._capture = (beat, route, stack)
+            captured_beat = beat
+
+    def _capture_stack(self) -> Tuple[str, List[str]]:
+        frame = sys._current_frames().get(self._loop_thread)
+        route = NO_ROUTE
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            labels.append(f"{code.co_qualname} ({code.co_filename}:{frame.f_lineno})")
+            if route == NO_ROUTE:
+                route = self._code_routes.get(code, NO_ROUTE)
+            frame = frame.f_back
+        labels.reverse()
+        return route, labels[-BLOCK_STACK_LIMIT:]
+
+    def _record(self, duration: float, route: str, stack: List[str]) -> None:
+        self.events.append(BlockEvent(datetime.utcnow(), duration, route, stack))
+        EVENT_LOOP_BLOCKS.labels(route).inc()
+        EVENT_LOOP_BLOCKED_SECONDS.labels(route).inc(duration)
+
+        location = "\n".join(f"    {label}" for label in stack[-BLOCK_LOG_FRAMES:]) or "    (未抓取到调用栈)"
+        print(f"事件循环阻塞 {duration * 1000:.0f}ms，路由: {route}\n{location}")
+
+
+loop_monitor = LoopMonitor()
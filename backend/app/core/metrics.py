@@ -0,0 +1,301 @@
+"""
+监控指标
+
+以Prometheus格式暴露请求延迟、每请求数据库查询、OCR队列与阶段耗时、AI调用延迟与token、
+事件循环阻塞，以及各进程内缓存的命中情况。热路径上只做计数和直方图观测，缓存命中数在抓取时才读取
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 直方图分桶(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+AI_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+# 未匹配到路由的请求统一归为一个标签，避免路径参数造成标签爆炸
+UNMATCHED_ROUTE = "<unmatched>"
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP请求耗时",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "正在处理的HTTP请求数"
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "单条SQL执行耗时",
+    buckets=DB_BUCKETS
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "每个请求执行的SQL条数",
+    ["route"],
+    buckets=COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "每个请求的SQL总耗时",
+    ["route"],
+    buckets=DB_BUCKETS + (2.5, 5)
+)
+OCR_QUEUE_DEPTH = Gauge(
+    "ocr_queue_depth",
+    "等待或正在进行OCR处理的文件数"
+)
+OCR_STAGE_DURATION = Histogram(
+    "ocr_stage_duration_seconds",
+    "OCR处理各阶段耗时",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+OCR_FILES = Counter(
+    "ocr_files_total",
+    "OCR处理完成的文件数",
+    ["status"]
+)
+AI_TIME_TO_FIRST_TOKEN = Histogram(
+    "ai_time_to_first_token_seconds",
+    "AI调用首个token的等待时间",
+    ["operation", "model"],
+    buckets=AI_BUCKETS
+)
+AI_REQUEST_DURATION = Histogram(
+    "ai_request_duration_seconds",
+    "AI调用总耗时",
+    ["operation", "model"],
+    buckets=AI_BUCKETS
+)
+AI_TOKENS = Counter(
+    "ai_tokens_total",
+    "AI调用消耗的token数",
+    ["operation", "model", "kind"]
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "事件循环调度延迟",
+    buckets=DB_BUCKETS + (2.5, 5, 10)
+)
+EVENT_LOOP_BLOCKS = Counter(
+    "event_loop_blocks_total",
+    "事件循环阻塞超过阈值的次数",
+    ["route"]
+)
+EVENT_LOOP_BLOCKED_SECONDS = Counter(
+    "event_loop_blocked_seconds_total",
+    "事件循环阻塞超过阈值的累计时长",
+    ["route"]
+)
+SINGLEFLIGHT_SHARED = Counter(
+    "singleflight_shared_total",
+    "合并到进行中的相同调用的请求数",
+    ["operation"]
+)
+IDEMPOTENT_REPLAYS = Counter(
+    "idempotent_replays_total",
+    "按幂等键重放已保存响应的请求数",
+    ["scope"]
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    "startup_phase_seconds",
+    "worker启动各阶段(模块导入、预热)耗时",
+    ["phase"]
+)
+
+_request_stats: ContextVar[Optional["RequestStats"]] = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """单个请求内累计的SQL条数和耗时"""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """当前请求的统计对象(不在请求内时为None)"""
+    return _request_stats.get()
+
+
+@contextmanager
+def observe_ocr_stage(stage: str) -> Iterator[None]:
+    """记录OCR处理阶段耗时"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        OCR_STAGE_DURATION.labels(stage).observe(time.perf_counter() - started)
+
+
+def observe_ai_call(
+    operation: str,
+    model: str,
+    started: float,
+    first_token_at: float,
+    prompt_tokens: int,
+    completion_tokens: int
+) -> None:
+    """记录一次AI调用的首token时间、总耗时和token数(时间为perf_counter读数)"""
+    finished = time.perf_counter()
+    AI_TIME_TO_FIRST_TOKEN.labels(operation, model).observe(first_token_at - started)
+    AI_REQUEST_DURATION.labels(operation, model).observe(finished - started)
+    AI_TOKENS.labels(operation, model, "prompt").inc(prompt_tokens)
+    AI_TOKENS.labels(operation, model, "completion").inc(completion_tokens)
+
+
+class _CacheCollector(Collector):
+    """抓取时读取已注册缓存的hits/misses计数"""
+
+    def __init__(self):
+        self._sources: Dict[str, Any] = {}
+
+    def register(self, name: str, source: Any) -> None:
+        self._sources[name] = source
+
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "缓存命中次数", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "缓存未命中次数", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "缓存命中率", labels=["cache"])
+        for name, source in self._sources.items():
+            hit_count, miss_count = source.hits, source.misses
+            hits.add_metric([name], hit_count)
+            misses.add_metric([name], miss_count)
+            total = hit_count + miss_count
+            ratio.add_metric([name], hit_count / total if total else 0.0)
+        yield hits
+        yield misses
+        yield ratio
+
+
+_cache_collector = _CacheCollector()
+REGISTRY.register(_cache_collector)
+
+
+def register_cache(name: str, source: Any) -> None:
+    """登记带hits/misses属性的缓存"""
+    _cache_collector.register(name, source)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """为数据库引擎挂载SQL计时事件"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_list = conn.info.get("query_started")
+        if not started_list:
+            return
+        elapsed = time.perf_counter() - started_list.pop()
+        DB_QUERY_DURATION.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+_route_paths: Optional[Dict[Any, str]] = None
+
+
+def collect_route_paths(routes: List[Any], prefix: str = "") -> Dict[Any, str]:
+    """收集路由endpoint到路径模板的映射(含挂载的子路由)"""
+    paths: Dict[Any, str] = {}
+    for route in routes:
+        path = getattr(route, "path", "")
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is not None:
+            paths.setdefault(endpoint, prefix + path)
+        sub_routes = getattr(route, "routes", None)
+        if sub_routes and endpoint is None:
+            for sub_endpoint, sub_path in collect_route_paths(sub_routes, prefix + path).items():
+                paths.setdefault(sub_endpoint, sub_path)
+    return paths
+
+
+def route_template(scope: dict) -> str:
+    """由路由匹配写入scope的endpoint反查路径模板(如/api/v1/reports/{report_id})"""
+    global _route_paths
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    if _route_paths is None:
+        _route_paths = collect_route_paths(scope["app"].routes)
+    return _route_paths.get(endpoint, UNMATCHED_ROUTE)
+
+
+class MetricsMiddleware:
+    """按路由模板记录请求耗时和每请求SQL统计(纯ASGI中间件)"""
+
+    def __init__(self, app: Callable):
+        self.app = app
+        self._children: Dict[Tuple[str, str, int], Any] = {}
+        self._db_children: Dict[str, Tuple[Any, Any]] = {}
+
+    def _observe(self, method: str, route: str, status_code: int, elapsed: float, stats: RequestStats) -> None:
+        key = (method, route, status_code)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = HTTP_REQUEST_DURATION.labels(method, route, str(status_code))
+        child.observe(elapsed)
+
+        db_children = self._db_children.get(route)
+        if db_children is None:
+            db_children = self._db_children[route] = (
+                DB_QUERIES_PER_REQUEST.labels(route),
+                DB_TIME_PER_REQUEST.labels(route)
+            )
+        db_children[0].observe(stats.queries)
+        db_children[1].observe(stats.db_seconds)
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            _request_stats.reset(token)
+            self._observe(scope["method"], route_template(scope), status_code, elapsed, stats)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成指标文本，返回(内容, Content-Type)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,163 @@
+"""
+运行时剖析
+
+在运行中的worker内按固定间隔采样各线程调用栈，输出折叠栈格式(flamegraph.pl、speedscope可直接导入)；
+并可导出事件循环中各asyncio任务当前挂起的位置，用于定位阻塞事件循环的处理函数
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# 单次剖析的最长时间(秒)和采样间隔范围
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_DEFAULT_INTERVAL = 0.01
+PROFILE_MIN_INTERVAL = 0.001
+PROFILE_MAX_INTERVAL = 1.0
+PROFILE_MODES = ("wall", "cpu")
+# cpu模式下，线程在一个采样间隔内消耗的CPU时间达到该比例才计入样本
+CPU_BUSY_RATIO = 0.5
+# 导出任务栈时每个任务最多保留的帧数
+TASK_STACK_LIMIT = 50
+
+
+class ProfileResult(NamedTuple):
+    """剖析结果"""
+    mode: str
+    duration: float
+    interval: float
+    samples: int
+    folded: str
+
+
+class TaskSnapshot(NamedTuple):
+    """asyncio任务快照"""
+    name: str
+    coroutine: str
+    done: bool
+    awaiting: Optional[str]
+    stack: List[str]
+
+
+class ProfilerBusyError(Exception):
+    """已有剖析在运行"""
+
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def _fold(thread_name: str, frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    labels.reverse()
+    return ";".join(label.replace(";", ":") for label in labels)
+
+
+def _thread_cpu_time(ident: int) -> Optional[float]:
+    """线程累计CPU时间(线程已退出或平台不支持时为None)"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+def _sample_stacks(mode: str, duration: float, interval: float) -> ProfileResult:
+    """在当前线程中采样其余线程的调用栈"""
+    own_ident = threading.get_ident()
+    thread_names: Dict[int, str] = {}
+    last_cpu: Dict[int, float] = {}
+    stacks: Counter = Counter()
+    samples = 0
+
+    started = time.perf_counter()
+    deadline = started + duration
+    while True:
+        tick = time.perf_counter()
+        if tick >= deadline:
+            break
+
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+
+            if mode == "cpu":
+                cpu = _thread_cpu_time(ident)
+                previous = last_cpu.get(ident)
+                if cpu is None:
+                    continue
+                last_cpu[ident] = cpu
+                if previous is None or cpu - previous < interval * CPU_BUSY_RATIO:
+                    continue
+
+            name = thread_names.get(ident)
+            if name is None:
+                thread_names.update((t.ident, t.name) for t in threading.enumerate())
+                name = thread_names.setdefault(ident, f"thread-{ident}")
+            stacks[_fold(name, frame)] += 1
+        samples += 1
+
+        time.sleep(max(interval - (time.perf_counter() - tick), 0))
+
+    folded = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+    return ProfileResult(mode, time.perf_counter() - started, interval, samples, folded)
+
+
+async def profile(mode: str, duration: float, interval: float = PROFILE_DEFAULT_INTERVAL) -> ProfileResult:
+    """对当前进程剖析duration秒
+
+    wall模式记录各线程所有样本(包括等待IO和锁)，cpu模式只记录采样间隔内在消耗CPU的线程。
+    采样在独立线程中进行，不占用事件循环；同一进程同时只允许一个剖析
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("已有剖析在运行")
+    try:
+        return await asyncio.to_thread(_sample_stacks, mode, duration, interval)
+    finally:
+        _profile_lock.release()
+
+
+def _await_chain(coro) -> Tuple[List[Any], Optional[Any]]:
+    """沿await链收集协程帧，返回(帧列表, 最内层等待对象)"""
+    frames = []
+    awaiting = None
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None and not hasattr(coro, "cr_await") and not hasattr(coro, "gi_yieldfrom"):
+            awaiting = coro
+            break
+        if frame is not None:
+            frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames, awaiting
+
+
+def dump_tasks() -> List[TaskSnapshot]:
+    """导出当前事件循环中所有任务挂起的位置(外层调用在前)"""
+    snapshots = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        frames, awaiting = _await_chain(coro)
+        stack = [
+            f"{frame.f_code.co_qualname} ({frame.f_code.co_filename}:{frame.f_lineno})"
+            for frame in frames[:TASK_STACK_LIMIT]
+        ]
+        snapshots.append(TaskSnapshot(
+            name=task.get_name(),
+            coroutine=getattr(coro, "__qualname__", repr(coro)),
+            done=task.done(),
+            awaiting=repr(awaiting) if awaiting is not None else None,
+            stack=stack
+        ))
+    return snapshots
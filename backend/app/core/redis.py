@@ -0,0 +1,48 @@
+"""
+Redis连接
+
+按REDIS_URL(或REDIS_HOST/REDIS_PORT/REDIS_DB)创建进程内共享的异步客户端，
+文本客户端自动解码响应，二进制客户端用于传输CRDT更新等原始字节
+"""
+
+import os
+from typing import Dict
+
+from redis import asyncio as aioredis
+
+REDIS_HOST = os.getenv("REDIS_HOST")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+REDIS_URL = os.getenv("REDIS_URL") or (
+    f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}" if REDIS_HOST else None
+)
+
+_clients: Dict[bool, aioredis.Redis] = {}
+
+
+def redis_configured() -> bool:
+    """是否配置了Redis"""
+    return REDIS_URL is not None
+
+
+def get_redis(decode_responses: bool = True) -> aioredis.Redis:
+    """获取共享的Redis客户端(首次调用时创建，连接按需建立)"""
+    client = _clients.get(decode_responses)
+    if client is None:
+        if REDIS_URL is None:
+            raise RuntimeError("未配置Redis(REDIS_URL或REDIS_HOST)")
+        client = _clients[decode_responses] = aioredis.from_url(REDIS_URL, decode_responses=decode_responses)
+    return client
+
+
+async def ping_redis() -> None:
+    """检查Redis连接并建立连接池中的首个连接"""
+    await get_redis().ping()
+    await get_redis(decode_responses=False).ping()
+
+
+async def close_redis() -> None:
+    """关闭Redis连接池"""
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
@@ -0,0 +1,180 @@
+"""
+安全模块
+
+JWT签发与校验、密码哈希，以及已验证令牌和用户信息的进程内缓存
+"""
+
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Generic, NamedTuple, Optional, Tuple, TypeVar
+
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+from passlib.context import CryptContext
+
+from app.core.metrics import register_cache
+
+# JWT配置：HS*算法使用SECRET_KEY；RS*/ES*算法从PEM文件读取密钥对。
+# SECRET_KEY必须设置(也用于文件下载签名)，仅本地开发可设置ALLOW_INSECURE_SECRET_KEY=true使用公开的开发密钥
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALLOW_INSECURE_SECRET_KEY = os.getenv("ALLOW_INSECURE_SECRET_KEY", "false").lower() == "true"
+INSECURE_DEV_SECRET_KEY = "pila-agent-dev-secret-change-me"
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_PRIVATE_KEY_FILE = os.getenv("JWT_PRIVATE_KEY_FILE")
+JWT_PUBLIC_KEY_FILE = os.getenv("JWT_PUBLIC_KEY_FILE")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
+
+# 缓存配置：令牌校验结果缓存到令牌过期为止(不超过TTL)；
+# 停用或启用用户时经事件总线通知所有进程立即清除用户缓存(Redis不可用时其他进程的变更在TTL后可见)
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+if not SECRET_KEY:
+    if not ALLOW_INSECURE_SECRET_KEY:
+        raise RuntimeError("未设置SECRET_KEY环境变量；本地开发可设置ALLOW_INSECURE_SECRET_KEY=true使用开发密钥")
+    print("警告: 未设置SECRET_KEY，使用公开的开发密钥，令牌可被伪造，禁止用于生产环境")
+    SECRET_KEY = INSECURE_DEV_SECRET_KEY
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class InvalidTokenError(Exception):
+    """令牌无效或已过期"""
+    pass
+
+
+class AuthenticatedUser(NamedTuple):
+    """认证用户快照，不绑定数据库会话"""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    is_superuser: bool
+
+
+def hash_password(password: str) -> str:
+    """计算密码哈希"""
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """校验密码"""
+    try:
+        return pwd_context.verify(password, hashed_password)
+    except (ValueError, TypeError):
+        return False
+
+
+def _read_key_file(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@lru_cache(maxsize=1)
+def _signing_key() -> Key:
+    """解析后的签名密钥(只解析一次)"""
+    if JWT_ALGORITHM.startswith("HS"):
+        return jwk.construct(SECRET_KEY, JWT_ALGORITHM)
+    return jwk.construct(_read_key_file(JWT_PRIVATE_KEY_FILE), JWT_ALGORITHM)
+
+
+@lru_cache(maxsize=1)
+def _verification_key() -> Key:
+    """解析后的验签密钥(只解析一次)"""
+    if JWT_ALGORITHM.startswith("HS"):
+        return _signing_key()
+    return jwk.construct(_read_key_file(JWT_PUBLIC_KEY_FILE), JWT_ALGORITHM)
+
+
+class _TTLCache(Generic[K, V]):
+    """带过期时间的进程内缓存，写满时先清理过期项，再淘汰最早写入的项"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: Dict[K, Tuple[V, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: K) -> Optional[V]:
+        item = self._items.get(key)
+        if item is not None and time.monotonic() < item[1]:
+            self.hits += 1
+            return item[0]
+        self.misses += 1
+        return None
+
+    def put(self, key: K, value: V, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._items) >= self.max_size and key not in self._items:
+                self._items = {k: v for k, v in self._items.items() if v[1] > now}
+                if len(self._items) >= self.max_size:
+                    self._items.pop(next(iter(self._items)))
+            self._items[key] = (value, now + ttl)
+
+    def invalidate(self, key: K) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+token_cache: "_TTLCache[str, Dict[str, Any]]" = _TTLCache(TOKEN_CACHE_SIZE)
+user_cache: "_TTLCache[int, AuthenticatedUser]" = _TTLCache(USER_CACHE_SIZE)
+register_cache("auth_token", token_cache)
+register_cache("auth_user", user_cache)
+
+
+def create_access_token(user_id: int, expires_delta: Optional[timedelta] = None) -> Tuple[str, int]:
+    """签发访问令牌，返回(令牌, 有效秒数)"""
+    expires_delta = expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": str(user_id),
+        "iat": int(now.timestamp()),
+        "exp": int((now + expires_delta).timestamp()),
+        "jti": uuid.uuid4().hex,
+    }
+    token = jwt.encode(claims, _signing_key(), algorithm=JWT_ALGORITHM)
+    return token, int(expires_delta.total_seconds())
+
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """校验访问令牌并返回声明，命中缓存时不重复验签"""
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+
+    try:
+        claims = jwt.decode(
+            token,
+            _verification_key(),
+            algorithms=[JWT_ALGORITHM],
+            options={"require_exp": True, "require_sub": True}
+        )
+    except JWTError as e:
+        raise InvalidTokenError(str(e))
+
+    subject = claims.get("sub")
+    if not subject or not str(subject).isdigit():
+        raise InvalidTokenError("令牌缺少用户标识")
+
+    remaining = float(claims.get("exp", 0)) - time.time()
+    token_cache.put(token, claims, min(TOKEN_CACHE_TTL, remaining))
+    return claims
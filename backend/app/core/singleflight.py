@@ -0,0 +1,59 @@
+"""
+请求合并(single-flight)
+
+同一进程内键相同的并发调用只执行一次，其余调用等待并共享结果或异常，
+用于合并重复点击、客户端重试等产生的相同AI生成和OCR识别
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.core.metrics import SINGLEFLIGHT_SHARED
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """按键合并进行中的异步调用"""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """执行func，已有相同键的调用进行中时等待其结果"""
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            SINGLEFLIGHT_SHARED.labels(self.operation).inc()
+            try:
+                # shield：等待方被取消时不影响执行方
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 执行方被取消时由等待方重新执行
+                if future.cancelled():
+                    continue
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待方时避免"异常未被获取"的警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
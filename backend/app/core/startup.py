@@ -0,0 +1,187 @@
+"""
+启动耗时与预热
+
+记录worker启动各阶段(路由模块导入、预热步骤)的耗时，预热完成后输出启动耗时报告，
+总耗时超过STARTUP_BUDGET_SECONDS时给出提示。重依赖(tokenizer、渲染进程池、OCR引擎等)在服务内按需加载，
+启动后由预热任务在后台提前加载；预热步骤可以用"模块:函数"登记，模块在执行该步骤时才导入并计入耗时报告。
+/ready在全部预热步骤成功前返回503，与只表示进程存活的/health区分，
+使负载均衡在连接池、模型等就绪后再转发流量
+"""
+
+import asyncio
+import functools
+import importlib
+import inspect
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from app.core.metrics import STARTUP_PHASE_SECONDS
+
+# 启动配置
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "10"))
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+# 预热步骤失败后的重试间隔(秒)
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+# 报告中列出的最慢阶段数
+REPORT_TOP_PHASES = 10
+
+
+class PhaseTiming(NamedTuple):
+    """启动阶段耗时"""
+    name: str
+    seconds: float
+    # 该阶段新加载的模块数(仅导入阶段)
+    modules: Optional[int] = None
+
+
+class WarmupStep(NamedTuple):
+    """
+    预热步骤，func为同步函数时在线程中执行；抛出异常或返回False视为失败
+
+    func为"模块:属性"字符串时在执行时导入
+    """
+    name: str
+    func: Union[Callable[[], Any], str]
+
+
+def process_uptime() -> Optional[float]:
+    """进程已运行的秒数，包括解释器启动和导入FastAPI等依赖的时间(仅Linux)"""
+    try:
+        with open("/proc/self/stat") as f:
+            # 进程名可能包含空格，从右括号之后开始计数字段
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            system_uptime = float(f.read().split()[0])
+        return system_uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTracker:
+    """启动阶段计时和预热状态"""
+
+    def __init__(self):
+        self.phases: List[PhaseTiming] = []
+        self.steps: List[WarmupStep] = []
+        self.step_status: Dict[str, str] = {}
+        self.ready = False
+        self.ready_after: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _record(self, timing: PhaseTiming) -> None:
+        self.phases.append(timing)
+        STARTUP_PHASE_SECONDS.labels(timing.name).set(timing.seconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录一个启动阶段的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(PhaseTiming(name, time.perf_counter() - started))
+
+    def import_module(self, path: str) -> Any:
+        """导入模块并记录耗时和新加载的模块数，已导入的模块不重复记录"""
+        if path in sys.modules:
+            return sys.modules[path]
+        loaded = len(sys.modules)
+        started = time.perf_counter()
+        try:
+            return importlib.import_module(path)
+        finally:
+            self._record(PhaseTiming(f"import {path}", time.perf_counter() - started, len(sys.modules) - loaded))
+
+    def resolve(self, target: str) -> Any:
+        """按"模块:属性"导入对象，导入耗时计入启动报告"""
+        module_path, _, attribute = target.partition(":")
+        return functools.reduce(getattr, attribute.split("."), self.import_module(module_path))
+
+    def add_warmup(self, name: str, func: Union[Callable[[], Any], str]) -> None:
+        """登记预热步骤"""
+        self.steps.append(WarmupStep(name, func))
+        self.step_status[name] = "pending"
+
+    def start(self) -> None:
+        """在后台执行预热，未启用预热时直接就绪"""
+        if not WARMUP_ENABLED:
+            self._mark_ready()
+            return
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._warmup())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_step(self, step: WarmupStep) -> bool:
+        try:
+            # 在事件循环中依次导入，各步骤的导入耗时和模块数互不混淆
+            func = self.resolve(step.func) if isinstance(step.func, str) else step.func
+            started = time.perf_counter()
+            if inspect.iscoroutinefunction(func):
+                result = await func()
+            else:
+                result = await asyncio.to_thread(func)
+            if result is False:
+                raise RuntimeError("预热步骤返回失败")
+        except Exception as e:
+            self.step_status[step.name] = "failed"
+            print(f"预热步骤失败 {step.name}: {str(e)}")
+            return False
+        self.step_status[step.name] = "done"
+        self._record(PhaseTiming(f"warmup {step.name}", time.perf_counter() - started))
+        return True
+
+    async def _warmup(self) -> None:
+        pending = list(self.steps)
+        while True:
+            results = await asyncio.gather(*(self._run_step(step) for step in pending))
+            pending = [step for step, ok in zip(pending, results) if not ok]
+            if not pending:
+                break
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+        self._mark_ready()
+
+    def _mark_ready(self) -> None:
+        self.ready = True
+        self.ready_after = process_uptime()
+        print(self.format_report())
+
+    def format_report(self) -> str:
+        """启动耗时报告"""
+        lines = []
+        if self.ready_after is not None:
+            over = "，超出预算" if self.ready_after > STARTUP_BUDGET_SECONDS else ""
+            lines.append(f"启动耗时报告：进程启动至就绪 {self.ready_after:.2f}s(预算 {STARTUP_BUDGET_SECONDS:.0f}s{over})")
+        else:
+            lines.append("启动耗时报告：")
+        for timing in sorted(self.phases, key=lambda t: t.seconds, reverse=True)[:REPORT_TOP_PHASES]:
+            modules = f"，新加载模块 {timing.modules}" if timing.modules is not None else ""
+            lines.append(f"    {timing.seconds * 1000:8.1f}ms  {timing.name}{modules}")
+        return "\n".join(lines)
+
+    def status(self) -> Dict[str, Any]:
+        """就绪状态和各阶段耗时"""
+        return {
+            "ready": self.ready,
+            "uptime_seconds": process_uptime(),
+            "ready_after_seconds": self.ready_after,
+            "budget_seconds": STARTUP_BUDGET_SECONDS,
+            "warmup": dict(self.step_status),
+            "phases": [
+                {"name": timing.name, "seconds": round(timing.seconds, 4), "modules": timing.modules}
+                for timing in self.phases
+            ],
+        }
+
+
+startup_tracker = StartupTracker()
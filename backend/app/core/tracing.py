@@ -0,0 +1,192 @@
+"""
+链路追踪
+
+基于OpenTelemetry记录上传、OCR、字段抽取、AI生成和SQL的耗时span，
+通过TRACING_EXPORTER选择导出方式：none(默认，不采集)、otlp、file、console
+"""
+
+import functools
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Sequence, TypeVar
+
+from opentelemetry import context as otel_context
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+    SpanExportResult
+)
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.metrics import route_template
+
+# 追踪配置；otlp导出地址使用标准环境变量OTEL_EXPORTER_OTLP_ENDPOINT(默认http://localhost:4318)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "pila-agent-backend")
+# SQL语句写入span时的最大长度
+DB_STATEMENT_MAX_LENGTH = 1000
+
+tracer = trace.get_tracer("app")
+
+_enabled = False
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """每行一个span的JSON文件导出器，便于本地用jq等工具分析"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = [json.dumps(json.loads(span.to_json()), ensure_ascii=False) for span in spans]
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _build_exporter() -> Optional[SpanExporter]:
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if TRACING_EXPORTER == "file":
+        return JsonLinesSpanExporter(TRACING_FILE)
+    if TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    return None
+
+
+def setup_tracing() -> bool:
+    """按配置初始化TracerProvider，未启用时保持OpenTelemetry默认的空实现"""
+    global _enabled
+    exporter = _build_exporter()
+    if exporter is None:
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": TRACING_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _enabled = True
+    return True
+
+
+def shutdown_tracing() -> None:
+    """刷新并关闭span导出"""
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, TracerProvider):
+        provider.shutdown()
+
+
+def inject_context() -> Dict[str, str]:
+    """序列化当前追踪上下文，随任务参数传给后台任务"""
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+@contextmanager
+def attach_context(carrier: Optional[Dict[str, str]]) -> Iterator[None]:
+    """在后台任务中恢复调用方的追踪上下文"""
+    token = otel_context.attach(propagate.extract(carrier or {}))
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """为协程函数创建同名span的装饰器(保留函数签名，可用于路由函数)"""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return await func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def trace_engine(engine: Engine) -> None:
+    """为每条SQL创建span(仅在启用追踪时挂载)"""
+    if not _enabled:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = tracer.start_span(
+            f"db {statement.split(None, 1)[0].upper() if statement else 'QUERY'}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": conn.engine.dialect.name,
+                "db.statement": statement[:DB_STATEMENT_MAX_LENGTH],
+            }
+        )
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        spans = connection.info.get("trace_spans") if connection is not None else None
+        if spans:
+            span = spans.pop()
+            span.set_status(Status(StatusCode.ERROR, str(exception_context.original_exception)))
+            span.end()
+
+
+class TracingMiddleware:
+    """为每个HTTP请求创建服务端span，并接收上游传入的traceparent(纯ASGI中间件)"""
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not _enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        parent = propagate.extract(headers)
+        status_code = 500
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            context=parent,
+            kind=SpanKind.SERVER,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]}
+        ) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = route_template(scope)
+                span.update_name(f"{scope['method']} {route}")
+                span.set_attribute("http.route", route)
+                span.set_attribute("http.status_code", status_code)
+                if status_code >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
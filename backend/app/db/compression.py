@@ -0,0 +1,318 @@
+"""
+大文本列压缩
+
+CompressedText列类型在写入时用zstd压缩文本、读取时解压，对业务代码透明。
+压缩可使用由业务语料(报告章节、OCR文本、生成内容)训练的字典，字典存放在数据库中，
+zstd帧头记录字典ID，旧字典压缩的数据在更换字典后仍可读取；短文本和未压缩的历史数据按UTF-8原样存储和读取。
+压缩列在Postgres中为bytea，已有库中仍为文本类型的列在服务启动时自动迁移(TEXT_COLUMNS_AUTO_MIGRATE)。
+
+用法(在backend目录下)：
+    python -m app.db.compression train --samples 5000 --size 112640
+    python -m app.db.compression recompress
+"""
+
+import argparse
+import os
+import threading
+from typing import Dict, List, Optional
+
+import zstandard
+from sqlalchemy import LargeBinary, bindparam, func, inspect, select, text
+from sqlalchemy.types import TypeDecorator
+
+from app.db.config import SessionLocal, engine
+
+# 压缩配置
+TEXT_COMPRESSION_ENABLED = os.getenv("TEXT_COMPRESSION_ENABLED", "true").lower() == "true"
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "3"))
+# 短于该字节数的文本不压缩(帧头开销大于收益)
+TEXT_COMPRESSION_MIN_SIZE = int(os.getenv("TEXT_COMPRESSION_MIN_SIZE", "128"))
+# 训练字典的默认大小(字节)和样本数
+DEFAULT_DICT_SIZE = 112640
+DEFAULT_DICT_SAMPLES = 5000
+# 重新压缩时每批处理的行数
+RECOMPRESS_BATCH_SIZE = 200
+# 启动时把仍为文本类型的压缩列迁移为bytea；关闭时列类型不符则拒绝启动
+TEXT_COLUMNS_AUTO_MIGRATE = os.getenv("TEXT_COLUMNS_AUTO_MIGRATE", "true").lower() == "true"
+# 多个worker同时启动时只由一个执行列类型迁移
+MIGRATE_LOCK_KEY = 4701
+
+# zstd帧魔数；合法的UTF-8文本不可能以0x28 0xB5开头，因此可与原样存储的文本区分
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class TextCodec:
+    """zstd文本编解码，按字典ID缓存字典和各线程的压缩器(压缩器不能跨线程共享)"""
+
+    def __init__(self, level: int = TEXT_COMPRESSION_LEVEL):
+        self.level = level
+        self.dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+        self.active_dict_id = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def register(self, dict_id: int, data: bytes, active: bool = False) -> None:
+        """登记字典，active为True时此后的压缩使用该字典"""
+        with self._lock:
+            self.dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+            if active:
+                self.active_dict_id = dict_id
+
+    def _dictionary(self, dict_id: int) -> Optional[zstandard.ZstdCompressionDict]:
+        if dict_id == 0:
+            return None
+        dictionary = self.dictionaries.get(dict_id)
+        if dictionary is None:
+            # 其他worker训练的新字典，按需从数据库加载
+            data = _fetch_dictionary(dict_id)
+            if data is None:
+                raise ValueError(f"压缩字典不存在: {dict_id}")
+            self.register(dict_id, data)
+            dictionary = self.dictionaries[dict_id]
+        return dictionary
+
+    def _cached(self, kind: str, dict_id: int):
+        cache = getattr(self._local, kind, None)
+        if cache is None:
+            cache = {}
+            setattr(self._local, kind, cache)
+        coder = cache.get(dict_id)
+        if coder is None:
+            dictionary = self._dictionary(dict_id)
+            if kind == "compressors":
+                coder = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+            else:
+                coder = zstandard.ZstdDecompressor(dict_data=dictionary)
+            cache[dict_id] = coder
+        return coder
+
+    def compress(self, value: str) -> bytes:
+        data = value.encode("utf-8")
+        if not TEXT_COMPRESSION_ENABLED or len(data) < TEXT_COMPRESSION_MIN_SIZE:
+            return data
+        return self._cached("compressors", self.active_dict_id).compress(data)
+
+    def decompress(self, data: bytes) -> str:
+        if not data.startswith(ZSTD_MAGIC):
+            return data.decode("utf-8")
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        return self._cached("decompressors", dict_id).decompress(data).decode("utf-8")
+
+
+codec = TextCodec()
+
+
+class CompressedText(TypeDecorator):
+    """透明压缩的文本列，数据库中以二进制存储"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return codec.compress(value)
+
+    def process_result_value(self, value, dialect) -> Optional[str]:
+        if value is None:
+            return None
+        # 列类型尚未迁移为二进制的库(如SQLite中的历史数据)直接返回文本
+        if isinstance(value, str):
+            return value
+        return codec.decompress(bytes(value))
+
+
+def _fetch_dictionary(dict_id: int) -> Optional[bytes]:
+    from app.db.models import CompressionDictionary
+
+    db = SessionLocal()
+    try:
+        row = db.query(CompressionDictionary.data).filter(CompressionDictionary.id == dict_id).first()
+        return row.data if row else None
+    finally:
+        db.close()
+
+
+def load_dictionaries() -> int:
+    """从数据库加载全部字典并启用当前生效的字典，返回字典数"""
+    from app.db.models import CompressionDictionary
+
+    db = SessionLocal()
+    try:
+        rows = db.query(CompressionDictionary).order_by(CompressionDictionary.created_at.asc()).all()
+        for row in rows:
+            codec.register(row.id, row.data, active=bool(row.is_active))
+        return len(rows)
+    finally:
+        db.close()
+
+
+def compressed_columns() -> List:
+    """所有CompressedText列(ORM属性)"""
+    from app.db.models import Base
+
+    columns = []
+    for mapper in Base.registry.mappers:
+        for column in mapper.columns:
+            if isinstance(column.type, CompressedText):
+                columns.append(getattr(mapper.class_, column.key))
+    return columns
+
+
+def sample_texts(limit: int) -> List[str]:
+    """从各压缩列随机抽取训练样本"""
+    db = SessionLocal()
+    try:
+        samples: List[str] = []
+        columns = compressed_columns()
+        per_column = max(limit // max(len(columns), 1), 1)
+        for column in columns:
+            rows = db.query(column).filter(column.isnot(None)).order_by(func.random()).limit(per_column)
+            samples.extend(value for (value,) in rows if value)
+        return samples
+    finally:
+        db.close()
+
+
+def train(samples: List[str], size: int = DEFAULT_DICT_SIZE) -> zstandard.ZstdCompressionDict:
+    """用样本训练zstd字典"""
+    return zstandard.train_dictionary(size, [sample.encode("utf-8") for sample in samples])
+
+
+def save_dictionary(dictionary: zstandard.ZstdCompressionDict, sample_count: int) -> int:
+    """保存字典并设为生效，返回字典ID"""
+    from app.db.models import CompressionDictionary
+
+    db = SessionLocal()
+    try:
+        db.query(CompressionDictionary).update({CompressionDictionary.is_active: False})
+        db.add(CompressionDictionary(
+            id=dictionary.dict_id(),
+            data=dictionary.as_bytes(),
+            sample_count=sample_count,
+            is_active=True
+        ))
+        db.commit()
+        return dictionary.dict_id()
+    finally:
+        db.close()
+
+
+def _text_columns(connection) -> List:
+    """Postgres中仍为文本类型的压缩列"""
+    inspector = inspect(connection)
+    pending = []
+    for column in compressed_columns():
+        table = column.class_.__tablename__
+        types = {info["name"]: info["type"] for info in inspector.get_columns(table)}
+        if column.key in types and not isinstance(types[column.key], LargeBinary):
+            pending.append(column)
+    return pending
+
+
+def migrate_column_types() -> List[str]:
+    """把Postgres中仍为文本类型的压缩列改为bytea，返回修改的列"""
+    if engine.dialect.name != "postgresql":
+        return []
+
+    changed = []
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATE_LOCK_KEY})
+        for column in _text_columns(connection):
+            table = column.class_.__tablename__
+            connection.execute(text(
+                f'ALTER TABLE {table} ALTER COLUMN "{column.key}" TYPE bytea '
+                f'USING convert_to("{column.key}", \'UTF8\')'
+            ))
+            changed.append(f"{table}.{column.key}")
+    return changed
+
+
+def ensure_column_types() -> List[str]:
+    """
+    启动时检查压缩列的列类型，返回迁移的列
+
+    压缩列以bytea写入，列仍为文本类型时所有写入都会失败，因此在开始服务前迁移；
+    未开启自动迁移时列类型不符直接抛出RuntimeError
+    """
+    if engine.dialect.name != "postgresql":
+        return []
+
+    if TEXT_COLUMNS_AUTO_MIGRATE:
+        changed = migrate_column_types()
+        for column in changed:
+            print(f"已迁移压缩列类型: {column}")
+        return changed
+
+    with engine.connect() as connection:
+        pending = [f"{column.class_.__tablename__}.{column.key}" for column in _text_columns(connection)]
+    if pending:
+        raise RuntimeError(
+            f"压缩列仍为文本类型: {', '.join(pending)}，请先运行 python -m app.db.compression recompress"
+        )
+    return []
+
+
+def recompress() -> int:
+    """用当前生效的字典重新写入全部压缩列，返回处理的行数
+
+    通过Core批量更新只改变存储格式，不触发更新时间、报告版本号等ORM更新逻辑
+    """
+    total = 0
+    columns = compressed_columns()
+    for model in dict.fromkeys(column.class_ for column in columns):
+        table = model.__table__
+        keys = [column.key for column in columns if column.class_ is model]
+        # 带onupdate的列(updated_at)赋值为自身，保持原值
+        values = {column.name: column for column in table.columns if column.onupdate is not None}
+        values.update({key: bindparam(f"new_{key}", type_=table.c[key].type) for key in keys})
+        statement = table.update().where(table.c.id == bindparam("row_id")).values(values)
+
+        last_id = 0
+        while True:
+            with engine.begin() as connection:
+                rows = connection.execute(
+                    select(table.c.id, *(table.c[key] for key in keys))
+                    .where(table.c.id > last_id)
+                    .order_by(table.c.id.asc())
+                    .limit(RECOMPRESS_BATCH_SIZE)
+                ).all()
+                if not rows:
+                    break
+                connection.execute(statement, [
+                    {"row_id": row.id, **{f"new_{key}": getattr(row, key) for key in keys}}
+                    for row in rows
+                ])
+            last_id = rows[-1].id
+            total += len(rows)
+    return total
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="大文本列压缩字典管理")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="用库中文本训练字典并设为生效")
+    train_parser.add_argument("--samples", type=int, default=DEFAULT_DICT_SAMPLES, help="样本数")
+    train_parser.add_argument("--size", type=int, default=DEFAULT_DICT_SIZE, help="字典大小(字节)")
+    subparsers.add_parser("recompress", help="迁移列类型并用生效的字典重新压缩已有数据")
+    args = parser.parse_args(argv)
+
+    load_dictionaries()
+    if args.command == "train":
+        samples = sample_texts(args.samples)
+        if not samples:
+            raise SystemExit("库中没有可用于训练的文本")
+        try:
+            dictionary = train(samples, args.size)
+        except zstandard.ZstdError as e:
+            raise SystemExit(f"训练字典失败(样本可能过少): {str(e)}")
+        dict_id = save_dictionary(dictionary, len(samples))
+        print(f"已保存字典 {dict_id}({len(dictionary.as_bytes())}字节，样本{len(samples)}条)，worker重启后用于压缩")
+    else:
+        for column in migrate_column_types():
+            print(f"已迁移列类型: {column}")
+        print(f"已重新压缩 {recompress()} 行")
+
+
+if __name__ == "__main__":
+    main()
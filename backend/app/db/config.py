@@ -29,6 +29,18 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def warm_pool(connections: int = 0) -> None:
+    """预先建立连接池中的连接，connections为0时按连接池大小"""
+    pool_size = getattr(engine.pool, "size", lambda: 1)()
+    opened = [engine.connect() for _ in range(connections or pool_size)]
+    try:
+        for connection in opened:
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in opened:
+            connection.close()
+
+
 def get_db():
     """获取数据库会话"""
     db = SessionLocal()
@@ -4,13 +4,15 @@
 定义了用户、报告、文件上传等核心业务实体
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Enum, Float
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Date, Boolean, ForeignKey, Enum, Float, UniqueConstraint, Index, LargeBinary, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, deferred, relationship
 from sqlalchemy.sql import func
 import enum
 from datetime import datetime
 
+from app.db.compression import CompressedText
+
 Base = declarative_base()
 
 
@@ -47,6 +49,7 @@ class User(Base):
     email = Column(String(100), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
+    is_superuser = Column(Boolean, default=False, comment="是否为管理员")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -61,27 +64,35 @@ class ReportDraft(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
-    insurance_type = Column(Enum(InsuranceType), nullable=True)
-    status = Column(Enum(ReportStatus), default=ReportStatus.DRAFT)
+    # 修改时加载旧值，用于增量维护用户统计计数
+    insurance_type = column_property(Column(Enum(InsuranceType), nullable=True), active_history=True)
+    status = column_property(Column(Enum(ReportStatus), default=ReportStatus.DRAFT), active_history=True)
     
-    # 报告内容章节
-    accident_details = Column(Text, nullable=True, comment="事故经过及索赔")
-    policy_summary = Column(Text, nullable=True, comment="保单内容摘要")
-    site_investigation = Column(Text, nullable=True, comment="现场查勘情况")
-    cause_analysis = Column(Text, nullable=True, comment="事故原因分析")
-    loss_assessment = Column(Text, nullable=True, comment="损失核定")
-    conclusion = Column(Text, nullable=True, comment="公估结论")
+    # 报告内容章节(压缩存储，首次访问任一章节时一并加载)
+    accident_details = deferred(Column(CompressedText, nullable=True, comment="事故经过及索赔"), group="content")
+    policy_summary = deferred(Column(CompressedText, nullable=True, comment="保单内容摘要"), group="content")
+    site_investigation = deferred(Column(CompressedText, nullable=True, comment="现场查勘情况"), group="content")
+    cause_analysis = deferred(Column(CompressedText, nullable=True, comment="事故原因分析"), group="content")
+    loss_assessment = deferred(Column(CompressedText, nullable=True, comment="损失核定"), group="content")
+    conclusion = deferred(Column(CompressedText, nullable=True, comment="公估结论"), group="content")
     
-    # 元数据
-    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # 元数据(所属用户同样加载旧值，转移报告时从原用户的计数中扣除)
+    owner_id = column_property(Column(Integer, ForeignKey("users.id"), nullable=False), active_history=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1", comment="内容版本号，每次更新递增")
     
     # 关系
     owner = relationship("User", back_populates="reports")
     associated_files = relationship("UploadedFile", back_populates="report")
 
 
+@event.listens_for(ReportDraft, "before_update")
+def _bump_report_version(mapper, connection, target):
+    """报告每次更新时在数据库端递增版本号，并发更新也不会得到相同的版本"""
+    target.version = ReportDraft.version + 1
+
+
 class UploadedFile(Base):
     """上传文件模型"""
     __tablename__ = "uploaded_files"
@@ -94,12 +105,13 @@ class UploadedFile(Base):
     file_size = Column(Integer, nullable=False, comment="文件大小(字节)")
     
     # OCR相关
-    ocr_status = Column(Enum(OCRStatus), default=OCRStatus.PENDING)
-    ocr_text = Column(Text, nullable=True, comment="OCR识别结果")
+    ocr_status = column_property(Column(Enum(OCRStatus), default=OCRStatus.PENDING), active_history=True)
+    ocr_text = deferred(Column(CompressedText, nullable=True, comment="OCR识别结果"))
     ocr_confidence = Column(Float, nullable=True, comment="OCR识别置信度")
+    content_hash = Column(String(64), nullable=True, index=True, comment="文件内容SHA-256，相同内容复用OCR结果")
     
-    # 关联
-    uploader_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # 关联(上传者加载旧值，用于增量维护用户统计计数)
+    uploader_id = column_property(Column(Integer, ForeignKey("users.id"), nullable=False), active_history=True)
     report_id = Column(Integer, ForeignKey("report_drafts.id"), nullable=True)
     
     # 元数据
@@ -111,26 +123,258 @@ class UploadedFile(Base):
     report = relationship("ReportDraft", back_populates="associated_files")
 
 
+class OCRTextChunk(Base):
+    """OCR文本分块模型(用于报告内检索)"""
+    __tablename__ = "ocr_text_chunks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("uploaded_files.id", ondelete="CASCADE"), nullable=False, index=True)
+    report_id = Column(Integer, ForeignKey("report_drafts.id"), nullable=True, index=True)
+    chunk_index = Column(Integer, nullable=False, comment="文件内分块序号")
+    content = Column(Text, nullable=False, comment="分块文本")
+    token_count = Column(Integer, nullable=False, comment="分块token数")
+    term_freqs = Column(Text, nullable=False, comment="词项频次JSON")
+    
+    # 元数据
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ExtractedField(Base):
+    """OCR文本结构化字段模型"""
+    __tablename__ = "extracted_fields"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("uploaded_files.id", ondelete="CASCADE"), nullable=False, index=True)
+    report_id = Column(Integer, ForeignKey("report_drafts.id"), nullable=True, index=True)
+    
+    # 字段内容
+    name = Column(String(50), nullable=False, comment="字段标识")
+    label = Column(String(50), nullable=False, comment="字段中文名")
+    value_type = Column(String(20), nullable=False, comment="值类型: string/datetime/money/plate")
+    value = Column(String(255), nullable=False, comment="规范化后的值")
+    raw_text = Column(String(255), nullable=False, comment="原文片段")
+    start_offset = Column(Integer, nullable=False, comment="原文起始偏移")
+    end_offset = Column(Integer, nullable=False, comment="原文结束偏移")
+    rule_version = Column(String(50), nullable=True, comment="规则集版本")
+    
+    # 元数据
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class SearchPosting(Base):
+    """全文检索倒排表模型"""
+    __tablename__ = "search_postings"
+    __table_args__ = (
+        Index("ix_search_postings_owner_term", "owner_id", "term", "doc_type", "doc_id"),
+        Index("ix_search_postings_doc", "doc_type", "doc_id", "field"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    term = Column(String(64), nullable=False, comment="词项(英文词/汉字二元组)")
+    doc_type = Column(String(16), nullable=False, comment="文档类型: report/file")
+    doc_id = Column(Integer, nullable=False, comment="文档ID")
+    field = Column(String(50), nullable=False, comment="字段名")
+    owner_id = Column(Integer, nullable=False, comment="文档所属用户")
+    tf = Column(Integer, nullable=False, comment="词频")
+
+
 class AIGenerationLog(Base):
     """AI生成日志模型"""
     __tablename__ = "ai_generation_logs"
+    __table_args__ = (
+        # 生成历史按报告和时间倒序查询；Postgres中该表按created_at按月分区
+        Index("ix_ai_generation_logs_report_created", "report_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     report_id = Column(Integer, ForeignKey("report_drafts.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    prompt_version_id = Column(Integer, ForeignKey("prompt_templates.id"), nullable=True, index=True, comment="使用的提示词版本")
     chapter_type = Column(String(50), nullable=False, comment="章节类型")
-    prompt_text = Column(Text, nullable=False, comment="提示词")
-    generated_content = Column(Text, nullable=False, comment="生成内容")
+    prompt_text = deferred(Column(CompressedText, nullable=False, comment="提示词"))
+    generated_content = deferred(Column(CompressedText, nullable=False, comment="生成内容"))
     
     # AI服务相关
     model_name = Column(String(100), nullable=False)
     tokens_used = Column(Integer, nullable=False)
+    prompt_tokens = Column(Integer, nullable=True, comment="提示词token数")
+    completion_tokens = Column(Integer, nullable=True, comment="生成内容token数")
     generation_time = Column(Float, nullable=False, comment="生成耗时(秒)")
     
-    # 元数据
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # 元数据(分区键，由日志写入时的生成时间填充)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     
     # 关系
     report = relationship("ReportDraft")
+    prompt_version = relationship("PromptTemplate")
+
+
+class AIGenerationStat(Base):
+    """AI生成日志月度汇总模型(超过保留期的日志归档为汇总后删除)"""
+    __tablename__ = "ai_generation_stats"
+    __table_args__ = (
+        Index("ix_ai_generation_stats_month_report", "month", "report_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, nullable=False, comment="所属月份(当月1日)")
+    # 汇总保留已删除报告的历史用量，不设外键
+    report_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=True, index=True)
+    prompt_version_id = Column(Integer, nullable=True, index=True, comment="使用的提示词版本")
+    chapter_type = Column(String(50), nullable=False, comment="章节类型")
+    model_name = Column(String(100), nullable=False)
+    
+    # 汇总值；prompt_tokens等列可能为空，分别记录参与求和的行数以便计算平均值
+    generation_count = Column(Integer, nullable=False, default=0)
+    tokens_used = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    prompt_tokens_rows = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens_rows = Column(Integer, nullable=False, default=0)
+    generation_time = Column(Float, nullable=False, default=0)
+    
+    # 元数据
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class PromptTemplate(Base):
+    """提示词模板版本模型"""
+    __tablename__ = "prompt_templates"
+    __table_args__ = (
+        UniqueConstraint("chapter_type", "insurance_type", "version", name="uq_prompt_templates_version"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    chapter_type = Column(String(50), nullable=False, index=True, comment="章节类型")
+    insurance_type = Column(String(50), nullable=False, default="default", comment="保险类型，default为通用")
+    version = Column(Integer, nullable=False, comment="版本号")
+    content = Column(Text, nullable=False, comment="提示词模板，占位符格式为{名称}")
+    description = Column(Text, nullable=True, comment="版本说明")
+    is_active = Column(Boolean, default=False, comment="是否为当前生效版本")
+    
+    # 元数据
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class CollabDocument(Base):
+    """协作编辑文档状态模型(压缩后的CRDT状态)"""
+    __tablename__ = "collab_documents"
+    __table_args__ = (
+        UniqueConstraint("report_id", "chapter_type", name="uq_collab_documents_chapter"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    report_id = Column(Integer, ForeignKey("report_drafts.id"), nullable=False)
+    chapter_type = Column(String(50), nullable=False, comment="章节类型")
+    state = Column(LargeBinary, nullable=False, comment="Yjs文档完整状态(update编码)")
+    content_hash = Column(String(64), nullable=False, comment="写回章节时正文的SHA-256，用于识别章节被其他接口修改")
+    
+    # 元数据
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class CompressionDictionary(Base):
+    """大文本列压缩字典模型(zstd字典，ID即字典ID)"""
+    __tablename__ = "compression_dictionaries"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False, comment="zstd字典ID")
+    data = Column(LargeBinary, nullable=False, comment="字典内容")
+    sample_count = Column(Integer, nullable=False, comment="训练样本数")
+    is_active = Column(Boolean, nullable=False, default=False, comment="是否用于新数据压缩")
+    
+    # 元数据
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UserTokenUsage(Base):
+    """用户每日token用量汇总模型"""
+    __tablename__ = "user_token_usage"
+    __table_args__ = (
+        UniqueConstraint("user_id", "usage_date", name="uq_user_token_usage_user_date"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    usage_date = Column(Date, nullable=False, index=True, comment="用量日期(UTC)")
+    
+    # 用量汇总
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    request_count = Column(Integer, nullable=False, default=0)
+    
+    # 元数据
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class UserStatCounter(Base):
+    """用户统计计数器模型(仪表盘统计，随报告、文件和AI生成日志的写入增量维护)"""
+    __tablename__ = "user_stat_counters"
+    __table_args__ = (
+        UniqueConstraint("user_id", "name", name="uq_user_stat_counters_user_name"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    name = Column(String(100), nullable=False, comment="计数项，如reports.status.draft")
+    value = Column(BigInteger, nullable=False, default=0)
+    
+    # 元数据
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class IdempotencyRecord(Base):
+    """幂等键记录模型(保存带Idempotency-Key的请求的响应，重试时重放)"""
+    __tablename__ = "idempotency_records"
+    __table_args__ = (
+        UniqueConstraint("user_id", "scope", "key", name="uq_idempotency_records_user_scope_key"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    scope = Column(String(50), nullable=False, comment="接口，如ai.generate")
+    key = Column(String(255), nullable=False, comment="客户端提供的幂等键")
+    fingerprint = Column(String(64), nullable=False, comment="请求内容摘要，同一幂等键只能用于相同的请求")
+    
+    # 响应(为空表示首个请求仍在处理中)
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    
+    # 元数据
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class ExportJobStatus(enum.Enum):
+    """批量导出任务状态枚举"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class ExportJob(Base):
+    """批量导出任务模型"""
+    __tablename__ = "export_jobs"
+    
+    id = Column(String(36), primary_key=True, comment="任务ID(UUID)")
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(Enum(ExportJobStatus), default=ExportJobStatus.PENDING)
+    export_format = Column(String(10), nullable=False, default="docx")
+    filters = Column(Text, nullable=True, comment="筛选条件JSON")
+    
+    # 进度
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    archive_path = Column(String(500), nullable=True, comment="ZIP文件路径")
+    error_message = Column(Text, nullable=True)
+    
+    # 元数据
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
 
 
 class ReportTemplate(Base):
@@ -142,12 +386,17 @@ class ReportTemplate(Base):
     description = Column(Text, nullable=True)
     insurance_type = Column(Enum(InsuranceType), nullable=True)
     
+    chapter_type = Column(String(50), nullable=True, index=True, comment="适用章节类型")
+    
     # 模板内容
-    template_structure = Column(Text, nullable=False, comment="模板结构JSON")
+    content = Column(Text, nullable=True, comment="含{占位符}的模板原文")
+    template_structure = Column(Text, nullable=False, comment="模板结构JSON(编译后的文本片段与占位符列表)")
+    version = Column(Integer, nullable=False, default=1, comment="内容版本，每次更新递增")
     
     # 元数据
+    is_default = Column(Boolean, default=False, comment="是否系统默认模板")
     is_active = Column(Boolean, default=True)
-    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True, comment="创建人，系统默认模板为空")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -0,0 +1,170 @@
+"""
+按月分区
+
+把Postgres中的日志类大表改为按时间列的RANGE分区表，每月一个分区(表名_pYYYYMM)，另有一个默认分区兜底；
+查询带时间条件时只扫描相关分区，过期数据按整个分区删除。其他数据库不分区，相关函数直接返回
+"""
+
+import re
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from sqlalchemy import Table, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex
+
+
+def month_start(value: datetime) -> datetime:
+    """所在月份的第一天零点(UTC)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """月初时间加减月数"""
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def supports_partitions(connection: Connection) -> bool:
+    return connection.dialect.name == "postgresql"
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    """表是否已是分区表"""
+    if not supports_partitions(connection):
+        return False
+    return connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": table}
+    ).first() is not None
+
+
+def list_partitions(connection: Connection, table: str) -> List[Tuple[str, datetime]]:
+    """按月分区及其月份，按月份升序(不含默认分区)"""
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass(:table)"
+    ), {"table": table}).scalars()
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+    partitions = []
+    for name in rows:
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def _create_partition(connection: Connection, table: str, column: str, month: datetime) -> str:
+    """创建month所在月份的分区
+
+    默认分区中已有该月的数据时(分区未提前创建的月份写入了默认分区)，Postgres不允许直接创建分区，
+    先建独立的表并把这些数据从默认分区移入，再挂载为分区
+    """
+    name = partition_name(table, month)
+    default = f"{table}_default"
+    bounds = {"start": month, "end": add_months(month, 1)}
+    values = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+
+    has_default_rows = connection.execute(
+        text("SELECT to_regclass(:default) IS NOT NULL"), {"default": default}
+    ).scalar() and connection.execute(
+        text(f"SELECT 1 FROM {default} WHERE {column} >= :start AND {column} < :end LIMIT 1"), bounds
+    ).first() is not None
+
+    if not has_default_rows:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES {values}"))
+        return name
+
+    # 移动期间阻止写入默认分区，否则挂载时发现新写入的该月数据会失败
+    connection.execute(text(f"LOCK TABLE {default} IN EXCLUSIVE MODE"))
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING COMMENTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE {column} >= :start AND {column} < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    # 挂载时自动创建分区表上的主键、索引和外键
+    connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {values}"))
+    return name
+
+
+def ensure_monthly_partitions(connection: Connection, table: str, column: str, start: datetime, months: int) -> List[str]:
+    """创建从start所在月份起共months个月的分区和默认分区，返回新建的分区"""
+    if not is_partitioned(connection, table):
+        return []
+
+    existing = {name for name, _ in list_partitions(connection, table)}
+    created = []
+    month = month_start(start)
+    for _ in range(months):
+        if partition_name(table, month) not in existing:
+            created.append(_create_partition(connection, table, column, month))
+        month = add_months(month, 1)
+    # 分区尚未创建的月份写入默认分区，保证写入不失败
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+    return created
+
+
+def drop_partitions_before(connection: Connection, table: str, cutoff: datetime) -> List[str]:
+    """删除整月都早于cutoff的分区，返回删除的分区"""
+    if not is_partitioned(connection, table):
+        return []
+
+    dropped = []
+    for name, month in list_partitions(connection, table):
+        if add_months(month, 1) <= cutoff:
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def partition_by_month(connection: Connection, table: Table, column: str, months_ahead: int) -> bool:
+    """把已有的普通表改为按column按月分区的表，保留数据、自增序列、外键和索引
+
+    分区表的主键必须包含分区列，主键改为(id, column)。已分区或非Postgres时返回False
+    """
+    name = table.name
+    if not supports_partitions(connection) or is_partitioned(connection, name):
+        return False
+
+    legacy = f"{name}_legacy"
+    connection.execute(text(f"LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE"))
+    oldest = connection.execute(text(f"SELECT min({column}) FROM {name}")).scalar()
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": name}).scalar()
+
+    connection.execute(text(f"ALTER TABLE {name} RENAME TO {legacy}"))
+    connection.execute(text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {name}_pkey TO {legacy}_pkey"))
+    if sequence:
+        # 序列归属旧表，删除旧表前解除归属
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    connection.execute(text(f"UPDATE {legacy} SET {column} = now() WHERE {column} IS NULL"))
+
+    foreign_keys = "".join(
+        f", FOREIGN KEY ({fk.parent.name}) REFERENCES {fk.column.table.name} ({fk.column.name})"
+        for fk in table.foreign_keys
+    )
+    connection.execute(text(
+        f"CREATE TABLE {name} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING COMMENTS, "
+        f"CONSTRAINT {name}_pkey PRIMARY KEY (id, {column}){foreign_keys}) "
+        f"PARTITION BY RANGE ({column})"
+    ))
+
+    now = datetime.now(timezone.utc)
+    first = month_start(oldest) if oldest is not None else month_start(now)
+    months = (now.year - first.year) * 12 + now.month - first.month + 1 + months_ahead
+    ensure_monthly_partitions(connection, name, column, first, months)
+
+    connection.execute(text(f"INSERT INTO {name} SELECT * FROM {legacy}"))
+    connection.execute(text(f"DROP TABLE {legacy}"))
+    if sequence:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {name}.id"))
+    # 数据写入后再建索引，分区表上的索引自动建到各分区
+    for index in table.indexes:
+        connection.execute(CreateIndex(index))
+    return True
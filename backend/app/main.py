@@ -4,9 +4,21 @@
 Main FastAPI application entry point for the insurance assessment report assistant.
 """
 
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import Response
+
+from app.core.compression import CompressionMiddleware
+from app.core.loop_monitor import LOOP_MONITOR_ENABLED, loop_monitor
+from app.core.metrics import MetricsMiddleware, instrument_engine, render_metrics
+from app.core.redis import close_redis, redis_configured
+from app.core.startup import startup_tracker
+from app.core.tracing import TracingMiddleware, setup_tracing, shutdown_tracing, trace_engine
+from app.db.config import engine
+from app.utils.serialization import FastJSONResponse
 
 app = FastAPI(
     title="公估报告智能撰写助手 API",
@@ -14,6 +26,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
 )
 
 # CORS中间件
@@ -25,20 +38,91 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 响应压缩(brotli/gzip)
+app.add_middleware(CompressionMiddleware)
+
+# 请求耗时与每请求SQL统计
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
+# 链路追踪(TRACING_EXPORTER未配置时不采集)
+if setup_tracing():
+    app.add_middleware(TracingMiddleware)
+    trace_engine(engine)
+
+
+# API路由：(名称, 模块)，挂载在/api/v1/{名称}下
+API_ROUTERS = [
+    ("auth", "app.api.v1.auth"),
+    ("reports", "app.api.v1.reports"),
+    ("files", "app.api.v1.files"),
+    ("ai", "app.api.v1.ai"),
+    ("templates", "app.api.v1.templates"),
+    ("search", "app.api.v1.search"),
+    ("admin", "app.api.v1.admin"),
+    ("events", "app.api.v1.events"),
+    ("collab", "app.api.v1.collab"),
+    ("dashboard", "app.api.v1.dashboard"),
+]
+
+# 注册API路由，逐个导入并记录耗时(含路由依赖的服务模块)，单个模块导入失败不影响其他路由
+for router_name, module_path in API_ROUTERS:
+    try:
+        router_module = startup_tracker.import_module(module_path)
+    except ImportError as e:
+        print(f"Warning: Could not import API routes ({router_name}): {e}")
+        continue
+    app.include_router(router_module.router, prefix=f"/api/v1/{router_name}", tags=[router_name])
+
+# 启动后在后台预热，全部完成前/ready返回503；服务模块在预热时才导入
+startup_tracker.add_warmup("database", "app.db.config:warm_pool")
+startup_tracker.add_warmup("compression_dicts", "app.db.compression:load_dictionaries")
+startup_tracker.add_warmup("default_prompts", "app.services.prompt_service:seed_default_prompts")
+startup_tracker.add_warmup("default_templates", "app.services.template_service:seed_default_templates")
+startup_tracker.add_warmup("ai_log_partitions", "app.services.generation_log_service:ensure_partitions")
+if redis_configured():
+    startup_tracker.add_warmup("redis", "app.core.redis:ping_redis")
+startup_tracker.add_warmup("tokenizer", "app.services.token_service:preload_encoding")
+startup_tracker.add_warmup("ocr_engine", "app.services.ocr_service:OCRService.warm_up")
+startup_tracker.add_warmup("export_workers", "app.services.export_service:ExportService.warm_up")
 
-# 注册API路由
-try:
-    from app.api.v1.reports import router as reports_router
-    from app.api.v1.files import router as files_router
-    from app.api.v1.ai import router as ai_router
-    from app.api.v1.templates import router as templates_router
-    
-    app.include_router(reports_router, prefix="/api/v1/reports", tags=["reports"])
-    app.include_router(files_router, prefix="/api/v1/files", tags=["files"])
-    app.include_router(ai_router, prefix="/api/v1/ai", tags=["ai"])
-    app.include_router(templates_router, prefix="/api/v1/templates", tags=["templates"])
-except ImportError as e:
-    print(f"Warning: Could not import API routes: {e}")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """迁移压缩列类型，启动事件循环阻塞检测、广播事件订阅、协作文档定期写回、AI生成日志批量写入和预热，按需创建对象存储桶"""
+    # 压缩列仍为文本类型时写入会失败，开始服务前完成迁移(未开启自动迁移时拒绝启动)
+    ensure_column_types = startup_tracker.resolve("app.db.compression:ensure_column_types")
+    with startup_tracker.phase("compressed_columns"):
+        await asyncio.to_thread(ensure_column_types)
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start(app.routes)
+    # 订阅广播频道，接收其他进程的用户缓存失效等通知
+    await startup_tracker.resolve("app.core.events:event_bus").start()
+    startup_tracker.resolve("app.services.collab_service:collab_service").start()
+    startup_tracker.resolve("app.services.generation_log_service:generation_log_writer").start()
+    storage = startup_tracker.import_module("app.services.storage_service")
+    if storage.STORAGE_BACKEND == "s3" and storage.S3_AUTO_CREATE_BUCKET:
+        with startup_tracker.phase("ensure_bucket"):
+            await storage.get_storage().ensure_bucket()
+    startup_tracker.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """关闭导出渲染进程池，停止阻塞检测，写回协作文档和缓冲的AI生成日志，关闭事件订阅和Redis连接，刷新未导出的span"""
+    from app.core.events import event_bus
+    from app.services.collab_service import collab_service
+    from app.services.export_service import ExportService
+    from app.services.generation_log_service import generation_log_writer
+
+    await startup_tracker.stop()
+    await loop_monitor.stop()
+    await collab_service.stop()
+    await generation_log_writer.stop()
+    await event_bus.close()
+    await close_redis()
+    ExportService.shutdown()
+    shutdown_tracing()
 
 
 @app.get("/health")
@@ -47,6 +131,22 @@ async def health_check():
     return {"status": "healthy", "version": "1.0.0"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查端点，预热完成前返回503"""
+    return FastJSONResponse(
+        startup_tracker.status(),
+        status_code=200 if startup_tracker.ready else 503
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus指标端点"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @app.get("/")
 async def root():
     """根端点"""
@@ -68,12 +168,7 @@ async def api_info():
     return {
         "title": "公估报告智能撰写助手",
         "version": "1.0.0",
-        "endpoints": {
-            "reports": "/api/v1/reports",
-            "files": "/api/v1/files", 
-            "ai": "/api/v1/ai",
-            "templates": "/api/v1/templates"
-        }
+        "endpoints": {name: f"/api/v1/{name}" for name, _ in API_ROUTERS}
     }
 
 
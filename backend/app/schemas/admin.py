@@ -0,0 +1,27 @@
+"""
+运维管理相关的Pydantic模式
+
+定义asyncio任务快照和事件循环阻塞记录的响应格式
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class TaskSnapshotResponse(BaseModel):
+    """asyncio任务快照"""
+    name: str
+    coroutine: str
+    done: bool
+    awaiting: Optional[str] = None
+    stack: List[str]
+
+
+class LoopBlockResponse(BaseModel):
+    """事件循环阻塞记录"""
+    occurred_at: datetime
+    duration: float
+    route: str
+    stack: List[str]
@@ -0,0 +1,39 @@
+"""
+认证相关的Pydantic模式
+
+定义登录、注册请求和令牌、用户信息响应的数据格式
+"""
+
+from pydantic import BaseModel, Field
+
+
+class LoginRequest(BaseModel):
+    """登录请求"""
+    username: str = Field(..., min_length=1, max_length=100, description="用户名或邮箱")
+    password: str = Field(..., min_length=1, max_length=128, description="密码")
+
+
+class RegisterRequest(BaseModel):
+    """注册请求"""
+    username: str = Field(..., min_length=3, max_length=50, description="用户名")
+    email: str = Field(..., min_length=3, max_length=100, pattern=r"^[^@\s]+@[^@\s]+$", description="邮箱")
+    password: str = Field(..., min_length=8, max_length=72, description="密码")
+
+
+class TokenResponse(BaseModel):
+    """访问令牌响应"""
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int = Field(..., description="有效期(秒)")
+
+
+class UserResponse(BaseModel):
+    """用户信息响应"""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    is_superuser: bool
+
+    class Config:
+        from_attributes = True
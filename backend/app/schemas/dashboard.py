@@ -0,0 +1,38 @@
+"""
+仪表盘相关的Pydantic模式
+
+定义用户统计的响应格式
+"""
+
+from typing import Dict
+
+from pydantic import BaseModel, Field
+
+
+class ReportStatsResponse(BaseModel):
+    """报告数量统计"""
+    total: int
+    by_status: Dict[str, int] = Field(..., description="按报告状态")
+    by_insurance_type: Dict[str, int] = Field(..., description="按保险类型，未设置的计入unset")
+
+
+class FileStatsResponse(BaseModel):
+    """文件数量统计"""
+    total: int
+    by_ocr_status: Dict[str, int] = Field(..., description="按OCR处理状态")
+
+
+class AIUsageStatsResponse(BaseModel):
+    """AI生成用量统计"""
+    generation_count: int
+    tokens_used: int
+    prompt_tokens: int
+    completion_tokens: int
+    generation_time: float = Field(..., description="累计生成耗时(秒)")
+
+
+class DashboardStatsResponse(BaseModel):
+    """仪表盘统计响应"""
+    reports: ReportStatsResponse
+    files: FileStatsResponse
+    ai: AIUsageStatsResponse
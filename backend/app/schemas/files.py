@@ -5,7 +5,7 @@
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 
@@ -19,10 +19,60 @@ class FileUploadResponse(BaseModel):
     created_at: Optional[datetime] = None
 
 
+class PresignedUploadRequest(BaseModel):
+    """直传凭证请求"""
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: str = Field("application/octet-stream", max_length=100)
+    file_size: int = Field(..., gt=0, description="文件大小(字节)")
+
+
+class PresignedUploadResponse(BaseModel):
+    """直传凭证：以multipart/form-data把fields和file字段POST到url"""
+    key: str
+    url: str
+    fields: Dict[str, str]
+    expires_in: int
+
+
+class CompleteUploadRequest(BaseModel):
+    """直传完成通知"""
+    key: str = Field(..., max_length=500)
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: Optional[str] = Field(None, max_length=100)
+    report_id: Optional[int] = None
+
+
 class OCRResultResponse(BaseModel):
     """OCR识别结果响应"""
     file_id: int
     status: str
     text: Optional[str] = None
     confidence: Optional[float] = None
-    message: str 
\ No newline at end of file
+    message: str 
+
+
+class ExtractedFieldResponse(BaseModel):
+    """结构化字段"""
+    name: str
+    label: str
+    value_type: str
+    value: str
+    raw_text: str
+    start_offset: int
+    end_offset: int
+    
+    class Config:
+        from_attributes = True
+
+
+class ExtractedFieldsResponse(BaseModel):
+    """文件结构化字段响应"""
+    file_id: int
+    rule_version: Optional[str] = None
+    fields: List[ExtractedFieldResponse]
+
+
+class ReportFactsResponse(BaseModel):
+    """报告事实汇总响应"""
+    report_id: int
+    facts: Dict[str, str]
@@ -0,0 +1,50 @@
+"""
+提示词相关的Pydantic模式
+
+定义提示词版本的创建请求、响应和版本统计格式
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.reports import InsuranceTypeEnum
+
+
+class PromptVersionCreate(BaseModel):
+    """新增提示词版本请求"""
+    content: str = Field(..., min_length=1, description="提示词模板，支持{context}、{facts}、{references}、{chapter_title}占位符")
+    insurance_type: Optional[InsuranceTypeEnum] = Field(None, description="适用保险类型，为空表示通用")
+    description: Optional[str] = Field(None, description="版本说明")
+    activate: bool = Field(True, description="创建后是否立即生效")
+
+
+class PromptVersionResponse(BaseModel):
+    """提示词版本响应"""
+    id: int
+    chapter_type: str
+    insurance_type: str
+    version: int
+    content: str
+    description: Optional[str] = None
+    is_active: bool
+    created_by: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PromptVersionStatsResponse(BaseModel):
+    """提示词版本的生成统计"""
+    id: int
+    chapter_type: str
+    insurance_type: str
+    version: int
+    is_active: bool
+    generation_count: int
+    avg_prompt_tokens: float
+    avg_completion_tokens: float
+    avg_tokens: float
+    avg_generation_time: float
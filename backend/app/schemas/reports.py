@@ -6,7 +6,7 @@
 
 from pydantic import BaseModel, Field
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 
@@ -95,6 +95,7 @@ class ReportResponse(BaseModel):
     owner_id: int
     created_at: datetime
     updated_at: datetime
+    version: int = 1
     
     class Config:
         from_attributes = True
@@ -114,7 +115,49 @@ class ReportResponse(BaseModel):
             conclusion=obj.conclusion,
             owner_id=obj.owner_id,
             created_at=obj.created_at,
-            updated_at=obj.updated_at
+            updated_at=obj.updated_at,
+            version=obj.version or 1
+        )
+
+
+class BatchExportRequest(BaseModel):
+    """批量导出请求"""
+    status: Optional[ReportStatusEnum] = Field(None, description="报告状态")
+    insurance_type: Optional[InsuranceTypeEnum] = Field(None, description="保险类型")
+    created_from: Optional[datetime] = Field(None, description="创建时间起")
+    created_to: Optional[datetime] = Field(None, description="创建时间止")
+    format: str = Field("docx", description="导出格式: docx/pdf")
+
+
+class ExportJobResponse(BaseModel):
+    """批量导出任务响应"""
+    job_id: str
+    status: str
+    format: str
+    total: int
+    completed: int
+    failed: int
+    progress: float = Field(..., description="完成比例(0-1)")
+    download_url: Optional[str] = None
+    error_message: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    @classmethod
+    def from_orm(cls, obj):
+        done = obj.completed + obj.failed
+        return cls(
+            job_id=obj.id,
+            status=obj.status.value,
+            format=obj.export_format,
+            total=obj.total,
+            completed=obj.completed,
+            failed=obj.failed,
+            progress=round(done / obj.total, 4) if obj.total else (1.0 if obj.status.value == "completed" else 0.0),
+            download_url=f"/api/v1/reports/export/batch/{obj.id}/download" if obj.status.value == "completed" else None,
+            error_message=obj.error_message,
+            created_at=obj.created_at,
+            finished_at=obj.finished_at
         )
 
 
@@ -130,4 +173,31 @@ class AIGenerateResponse(BaseModel):
     chapter_type: str
     generated_content: str
     tokens_used: int
-    generation_time: float 
\ No newline at end of file
+    generation_time: float
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class DailyTokenUsage(BaseModel):
+    """每日token用量"""
+    usage_date: date
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    request_count: int
+    
+    class Config:
+        from_attributes = True
+
+
+class TokenUsageResponse(BaseModel):
+    """token用量汇总响应"""
+    start_date: date
+    end_date: date
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    request_count: int
+    daily: List[DailyTokenUsage]
+    daily_budget: Optional[int] = Field(None, description="每日预算，为空表示不限制")
+    remaining_today: Optional[int] = Field(None, description="今日剩余额度") 
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""
+全文检索相关的Pydantic模式
+
+定义检索请求和响应的数据格式
+"""
+
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class SearchHitResponse(BaseModel):
+    """检索命中项"""
+    doc_type: str = Field(..., description="文档类型: report/file")
+    doc_id: int
+    report_id: Optional[int] = None
+    title: str
+    field: str = Field(..., description="命中字段")
+    snippet: str = Field(..., description="高亮摘要(HTML，命中词用<mark>标记)")
+    score: float
+
+
+class SearchResponse(BaseModel):
+    """检索响应"""
+    query: str
+    total: int
+    total_estimated: bool = Field(False, description="命中文档过多时total只统计最新的部分")
+    items: List[SearchHitResponse]
+    took_ms: float
@@ -0,0 +1,60 @@
+"""
+模板相关的Pydantic模式
+
+定义模板创建、更新请求的数据格式
+"""
+
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+from app.schemas.reports import InsuranceTypeEnum
+
+
+class TemplateCreate(BaseModel):
+    """创建模板请求"""
+    type: str = Field(..., min_length=1, max_length=50, description="章节类型")
+    title: str = Field(..., min_length=1, max_length=255, description="模板标题")
+    content: str = Field(..., min_length=1, description="模板内容，占位符格式为{名称}")
+    description: Optional[str] = Field(None, description="模板说明")
+    insurance_type: Optional[InsuranceTypeEnum] = Field(None, description="适用保险类型")
+
+
+class TemplateUpdate(BaseModel):
+    """更新模板请求"""
+    type: Optional[str] = Field(None, min_length=1, max_length=50, description="章节类型")
+    title: Optional[str] = Field(None, min_length=1, max_length=255, description="模板标题")
+    content: Optional[str] = Field(None, min_length=1, description="模板内容")
+    description: Optional[str] = Field(None, description="模板说明")
+    insurance_type: Optional[InsuranceTypeEnum] = Field(None, description="适用保险类型")
+
+
+class TemplateFillRequest(BaseModel):
+    """模板填充请求"""
+    report_id: int = Field(..., description="报告ID")
+    facts: Optional[Dict[str, str]] = Field(None, description="额外提供的占位符取值，优先级最高")
+    use_ai: bool = Field(False, description="无法确定性填充的占位符是否回退到AI")
+    context: Optional[str] = Field(None, description="AI补全时的上下文信息")
+
+
+class TemplateBatchFillRequest(BaseModel):
+    """批量模板填充请求"""
+    report_ids: List[int] = Field(..., min_length=1, max_length=500, description="报告ID列表")
+    use_ai: bool = Field(False, description="无法确定性填充的占位符是否回退到AI")
+
+
+class TemplateFillResponse(BaseModel):
+    """模板填充结果"""
+    template_id: int
+    report_id: int
+    content: str
+    filled: Dict[str, str]
+    missing: List[str] = Field(..., description="仍未填充的占位符")
+    ai_filled: List[str] = Field(..., description="由AI补全的占位符")
+    tokens_used: int = 0
+
+
+class TemplateBatchFillResponse(BaseModel):
+    """批量模板填充结果"""
+    template_id: int
+    items: List[TemplateFillResponse]
+    not_found: List[int] = Field(..., description="不存在或无权访问的报告ID")
@@ -5,7 +5,13 @@ AI服务
 """
 
 import asyncio
-from typing import NamedTuple, Optional
+import json
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from app.core.metrics import observe_ai_call
+from app.core.tracing import traced
+from app.services.token_service import count_message_tokens, count_tokens
 
 
 class AIGenerationResult(NamedTuple):
@@ -14,11 +20,31 @@ class AIGenerationResult(NamedTuple):
     prompt_used: str
     model_name: str
     tokens_used: int
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+def build_fill_prompt(
+    slots: List[str],
+    template_content: str,
+    facts: Optional[Dict[str, str]] = None,
+    context: Optional[str] = None
+) -> str:
+    """组装模板占位符补全的提示词"""
+    fact_lines = "\n".join(f"- {label}：{value}" for label, value in (facts or {}).items())
+    return (
+        f"请根据已知信息补全模板中的占位符，以JSON对象返回。\n\n"
+        f"模板：\n{template_content}\n\n"
+        f"已知事实：\n{fact_lines or '无'}\n\n"
+        f"上下文：{context or '无'}\n\n"
+        f"需要补全的占位符：{'、'.join(slots)}"
+    )
 
 
 class AIService:
     """AI服务类"""
     
+    @traced("AIService.chat")
     async def chat(
         self,
         message: str,
@@ -28,7 +54,10 @@ class AIService:
         """AI聊天对话"""
         try:
             # 模拟AI处理时间
+            started = time.perf_counter()
             await asyncio.sleep(1)
+            # 非流式调用，首个token随完整响应一起到达
+            first_token_at = time.perf_counter()
             
             # 根据用户消息生成回复
             if "车险" in message or "交通事故" in message:
@@ -114,27 +143,44 @@ class AIService:
 
 请告诉我您遇到的具体问题，我会为您提供专业的建议和指导。"""
             
+            prompt_tokens = count_message_tokens([*(str(item) for item in context or []), message])
+            completion_tokens = count_tokens(response_content)
+            observe_ai_call("chat", "gpt-3.5-turbo", started, first_token_at, prompt_tokens, completion_tokens)
+            
             return AIGenerationResult(
                 content=response_content,
-                tokens_used=len(response_content) // 2,
+                tokens_used=prompt_tokens + completion_tokens,
                 model_name="gpt-3.5-turbo",
-                prompt_used=message
+                prompt_used=message,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens
             )
             
         except Exception as e:
             raise Exception(f"AI聊天服务调用失败: {str(e)}")
     
+    @traced("AIService.generate_chapter")
     async def generate_chapter(
         self,
         chapter_type: str,
         context: Optional[str] = None,
         report_data: Optional[any] = None,
-        prompt_template: Optional[str] = None
+        prompt_template: Optional[str] = None,
+        reference_passages: Optional[List[str]] = None,
+        facts: Optional[Dict[str, str]] = None
     ) -> AIGenerationResult:
-        """生成报告章节内容"""
+        """生成报告章节内容
+        
+        prompt_template为已拼接好的完整提示(来自提示词注册表或自定义模板)，
+        提供时直接使用，其中已包含事实和参考资料；
+        reference_passages为从报告OCR文本中检索出的相关段落，已按token预算裁剪；
+        facts为从OCR文本中抽取出的结构化事实(字段中文名 -> 值)
+        """
         
         # 模拟AI处理时间
+        started = time.perf_counter()
         await asyncio.sleep(3)
+        first_token_at = time.perf_counter()
         
         # 根据章节类型生成不同内容
         content_templates = {
@@ -149,11 +195,63 @@ class AIService:
         generator = content_templates.get(chapter_type, self._generate_default)
         content = generator(context, report_data)
         
+        if prompt_template:
+            prompt_used = prompt_template
+        else:
+            prompt_used = f"生成{chapter_type}章节，上下文：{context or '无'}"
+            if facts:
+                fact_lines = "\n".join(f"- {label}：{value}" for label, value in facts.items())
+                prompt_used += f"\n\n已知事实：\n{fact_lines}"
+            if reference_passages:
+                references = "\n\n".join(
+                    f"[资料{i}]\n{passage}" for i, passage in enumerate(reference_passages, 1)
+                )
+                prompt_used += f"\n\n参考资料：\n{references}"
+        prompt_tokens = count_message_tokens([prompt_used])
+        completion_tokens = count_tokens(content)
+        observe_ai_call("generate", "gpt-3.5-turbo", started, first_token_at, prompt_tokens, completion_tokens)
+        
+        return AIGenerationResult(
+            content=content,
+            prompt_used=prompt_used,
+            model_name="gpt-3.5-turbo",
+            tokens_used=prompt_tokens + completion_tokens,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
+    
+    @traced("AIService.fill_slots")
+    async def fill_slots(
+        self,
+        slots: List[str],
+        template_content: str,
+        facts: Optional[Dict[str, str]] = None,
+        context: Optional[str] = None
+    ) -> AIGenerationResult:
+        """补全模板中无法确定性填充的占位符，返回内容为JSON对象(占位符 -> 值)"""
+        
+        # 模拟AI处理时间
+        started = time.perf_counter()
+        await asyncio.sleep(1)
+        first_token_at = time.perf_counter()
+        
+        prompt_used = build_fill_prompt(slots, template_content, facts, context)
+        content = json.dumps(
+            {slot: f"（{slot}待核实）" for slot in slots},
+            ensure_ascii=False
+        )
+        
+        prompt_tokens = count_message_tokens([prompt_used])
+        completion_tokens = count_tokens(content)
+        observe_ai_call("fill_slots", "gpt-3.5-turbo", started, first_token_at, prompt_tokens, completion_tokens)
+        
         return AIGenerationResult(
             content=content,
-            prompt_used=f"生成{chapter_type}章节，上下文：{context or '无'}",
+            prompt_used=prompt_used,
             model_name="gpt-3.5-turbo",
-            tokens_used=500
+            tokens_used=prompt_tokens + completion_tokens,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
         )
     
     def _generate_accident_details(self, context: Optional[str], report_data: any) -> str:
@@ -0,0 +1,103 @@
+"""
+认证服务
+
+负责用户注册、登录校验，以及按ID读取用户快照(优先使用进程内缓存)。
+用户状态变更经事件总线广播，各进程收到后立即清除该用户的缓存
+"""
+
+from typing import Any, Dict, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.events import EVENT_USER_CHANGED, event_bus
+from app.core.security import (
+    USER_CACHE_TTL,
+    AuthenticatedUser,
+    hash_password,
+    user_cache,
+    verify_password
+)
+from app.db.models import User
+
+
+def to_snapshot(user: User) -> AuthenticatedUser:
+    """ORM用户对象转换为与会话无关的快照"""
+    return AuthenticatedUser(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        is_active=bool(user.is_active),
+        is_superuser=bool(user.is_superuser)
+    )
+
+
+def _on_user_changed(data: Dict[str, Any]) -> None:
+    user_cache.invalidate(int(data["user_id"]))
+
+
+event_bus.on_broadcast(EVENT_USER_CHANGED, _on_user_changed)
+
+
+async def broadcast_user_changed(user_id: int) -> None:
+    """通知所有进程清除用户缓存"""
+    await event_bus.broadcast(EVENT_USER_CHANGED, {"user_id": user_id})
+
+
+class AuthService:
+    """认证服务类"""
+
+    def get_user(self, db: Session, user_id: int) -> Optional[AuthenticatedUser]:
+        """获取用户快照，缓存命中时不访问数据库"""
+        snapshot = user_cache.get(user_id)
+        if snapshot is not None:
+            return snapshot
+
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            return None
+
+        snapshot = to_snapshot(user)
+        user_cache.put(user_id, snapshot, USER_CACHE_TTL)
+        return snapshot
+
+    def authenticate(self, db: Session, login: str, password: str) -> Optional[User]:
+        """按用户名或邮箱校验密码"""
+        user = db.query(User).filter(
+            or_(User.username == login, User.email == login)
+        ).first()
+        if not user or not verify_password(password, user.hashed_password):
+            return None
+        return user
+
+    def register(self, db: Session, username: str, email: str, password: str) -> User:
+        """注册新用户"""
+        user = User(
+            username=username,
+            email=email,
+            hashed_password=hash_password(password),
+            is_active=True,
+            is_superuser=False
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user
+
+    def exists(self, db: Session, username: str, email: str) -> bool:
+        """用户名或邮箱是否已被占用"""
+        return db.query(User.id).filter(
+            or_(User.username == username, User.email == email)
+        ).first() is not None
+
+    def set_active(self, db: Session, user_id: int, is_active: bool) -> Optional[User]:
+        """启用或停用用户，并使本进程的用户缓存失效(其他进程由调用方调用broadcast_user_changed通知)"""
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            return None
+
+        user.is_active = is_active
+        db.commit()
+        db.refresh(user)
+        user_cache.invalidate(user_id)
+        return user
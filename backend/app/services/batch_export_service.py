@@ -0,0 +1,200 @@
+"""
+批量导出服务
+
+按筛选条件并行渲染多份报告，并逐个流式写入磁盘上的ZIP归档，
+内存占用与报告数量无关
+"""
+
+import asyncio
+import json
+import os
+import re
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Set
+
+from sqlalchemy.orm import Query, Session, undefer_group
+
+from app.db.config import SessionLocal
+from app.db.models import (
+    ExportJob,
+    ExportJobStatus,
+    InsuranceType,
+    ReportDraft,
+    ReportStatus
+)
+from app.services.export_service import (
+    EXPORT_CACHE_DIR,
+    EXPORT_WORKERS,
+    ExportArtifact,
+    ExportService,
+    build_payload
+)
+
+# 批量导出配置
+BATCH_EXPORT_DIR = Path(os.getenv("BATCH_EXPORT_DIR", str(EXPORT_CACHE_DIR / "batches"))).resolve()
+# 同时在渲染的报告数，略多于进程数以保持进程池满载
+BATCH_EXPORT_CONCURRENCY = int(os.getenv("BATCH_EXPORT_CONCURRENCY", str(EXPORT_WORKERS * 2)))
+# 每次从数据库加载的报告数
+REPORT_PAGE_SIZE = 100
+# 每完成多少份报告更新一次进度
+PROGRESS_UPDATE_INTERVAL = 5
+
+_UNSAFE_FILENAME_PATTERN = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def _archive_name(report_id: int, title: str, export_format: str) -> str:
+    """ZIP内的文件名，以报告ID开头保证唯一"""
+    safe_title = _UNSAFE_FILENAME_PATTERN.sub("_", title or "").strip("_")[:80]
+    return f"{report_id}_{safe_title or 'report'}.{export_format}"
+
+
+def build_report_query(db: Session, owner_id: int, filters: dict) -> Query:
+    """根据筛选条件构建报告查询"""
+    query = db.query(ReportDraft).filter(ReportDraft.owner_id == owner_id)
+
+    if filters.get("status"):
+        query = query.filter(ReportDraft.status == ReportStatus(filters["status"]))
+    if filters.get("insurance_type"):
+        query = query.filter(ReportDraft.insurance_type == InsuranceType(filters["insurance_type"]))
+    if filters.get("created_from"):
+        query = query.filter(ReportDraft.created_at >= datetime.fromisoformat(filters["created_from"]))
+    if filters.get("created_to"):
+        query = query.filter(ReportDraft.created_at <= datetime.fromisoformat(filters["created_to"]))
+
+    return query.order_by(ReportDraft.id.asc())
+
+
+class BatchExportService:
+    """批量导出服务类"""
+
+    def create_job(self, db: Session, owner_id: int, filters: dict, export_format: str) -> ExportJob:
+        """创建导出任务并统计待导出报告数"""
+        job = ExportJob(
+            id=str(uuid.uuid4()),
+            owner_id=owner_id,
+            status=ExportJobStatus.PENDING,
+            export_format=export_format,
+            filters=json.dumps(filters, ensure_ascii=False),
+            total=build_report_query(db, owner_id, filters).count()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    async def run_job(self, job_id: str) -> None:
+        """执行导出任务(在后台运行，使用独立的数据库会话)"""
+        db = SessionLocal()
+        try:
+            job = db.query(ExportJob).filter(ExportJob.id == job_id).first()
+            if not job:
+                return
+
+            job.status = ExportJobStatus.RUNNING
+            db.commit()
+
+            try:
+                archive_path = await self._build_archive(db, job)
+            except Exception as e:
+                db.rollback()
+                job.status = ExportJobStatus.FAILED
+                job.error_message = str(e)
+                job.finished_at = datetime.now(timezone.utc)
+                db.commit()
+                print(f"批量导出失败: {str(e)}")
+                return
+
+            job.archive_path = str(archive_path)
+            job.status = ExportJobStatus.COMPLETED
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _build_archive(self, db: Session, job: ExportJob) -> Path:
+        """并行渲染报告并按完成顺序写入ZIP"""
+        BATCH_EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        archive_path = BATCH_EXPORT_DIR / f"{job.id}.zip"
+        partial_path = archive_path.with_suffix(".zip.part")
+
+        export_service = ExportService()
+        filters = json.loads(job.filters or "{}")
+        pending: Set[asyncio.Task] = set()
+        finished_count = 0
+
+        async def record(task: asyncio.Task, archive: zipfile.ZipFile) -> None:
+            nonlocal finished_count
+            try:
+                name, artifact = task.result()
+                # 文档本身已压缩，直接存储；按块从磁盘复制，不整体读入内存。
+                # 复制在线程中执行，不阻塞事件循环；写入逐个等待完成，ZipFile不会被并发使用
+                await asyncio.to_thread(
+                    archive.write, artifact.path, arcname=name, compress_type=zipfile.ZIP_STORED
+                )
+                job.completed += 1
+            except Exception as e:
+                job.failed += 1
+                print(f"报告导出失败: {str(e)}")
+            finished_count += 1
+            if finished_count % PROGRESS_UPDATE_INTERVAL == 0:
+                db.commit()
+
+        async def render(report_id: int, title: str, payload: dict) -> "tuple[str, ExportArtifact]":
+            artifact = await export_service.export(payload, job.export_format)
+            return _archive_name(report_id, title, job.export_format), artifact
+
+        # 先取ID列表再分页加载报告，进度提交不会打断结果集游标
+        report_ids = [
+            report_id for (report_id,) in
+            build_report_query(db, job.owner_id, filters).with_entities(ReportDraft.id)
+        ]
+
+        archive = await asyncio.to_thread(zipfile.ZipFile, partial_path, "w", allowZip64=True)
+        try:
+            try:
+                for offset in range(0, len(report_ids), REPORT_PAGE_SIZE):
+                    page_ids = report_ids[offset:offset + REPORT_PAGE_SIZE]
+                    reports = db.query(ReportDraft).options(undefer_group("content")).filter(
+                        ReportDraft.id.in_(page_ids)
+                    ).order_by(ReportDraft.id.asc()).all()
+
+                    for report in reports:
+                        if len(pending) >= BATCH_EXPORT_CONCURRENCY:
+                            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                            for task in done:
+                                await record(task, archive)
+
+                        pending.add(asyncio.create_task(
+                            render(report.id, report.title, build_payload(report))
+                        ))
+                        # 报告对象不再需要，避免会话缓存随数量增长
+                        db.expunge(report)
+
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        await record(task, archive)
+            finally:
+                # 出错或任务被取消时取消仍在等待的渲染，不留下脱离任务运行的协程
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                # 关闭时写入中央目录
+                await asyncio.to_thread(archive.close)
+        except BaseException:
+            # 未完成的归档不会再被使用
+            partial_path.unlink(missing_ok=True)
+            raise
+
+        os.replace(partial_path, archive_path)
+        return archive_path
+
+    def get_job(self, db: Session, job_id: str, owner_id: int) -> Optional[ExportJob]:
+        """获取当前用户的导出任务"""
+        return db.query(ExportJob).filter(
+            ExportJob.id == job_id,
+            ExportJob.owner_id == owner_id
+        ).first()
@@ -0,0 +1,476 @@
+"""
+协作编辑服务
+
+章节内容以Yjs CRDT文档(y-py)同步，WebSocket消息使用y-websocket协议，前端可直接使用WebsocketProvider。
+配置Redis时，增量更新追加到每个章节的Redis更新日志并经发布订阅扇出到其他后端进程；
+后台任务定期把有变更的文档批量写回ReportDraft章节，并把更新日志压缩为一份完整状态存入数据库
+"""
+
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import y_py as Y
+from fastapi import WebSocket
+from redis.exceptions import RedisError
+from sqlalchemy.orm import undefer_group
+
+from app.core.redis import get_redis, redis_configured
+from app.db.config import SessionLocal
+from app.db.models import CollabDocument, ReportDraft
+from app.services.report_cache_service import report_cache
+from app.services.search_service import SearchService
+
+# 写回章节和压缩更新日志的间隔(秒)
+COLLAB_FLUSH_INTERVAL = float(os.getenv("COLLAB_FLUSH_INTERVAL", "5"))
+# 压缩锁的过期时间(秒)，防止持锁进程退出后锁无法释放
+COLLAB_LOCK_TTL = 30
+# 文档中保存章节正文的共享类型名
+COLLAB_TEXT_NAME = "content"
+# 由章节正文初始化文档时使用的固定客户端ID，保证各进程独立初始化得到相同的CRDT结构
+SEED_CLIENT_ID = 0
+# Redis订阅读取超时和异常后的重试间隔(秒)
+LISTEN_TIMEOUT = 1.0
+RECONNECT_DELAY = 1.0
+
+# y-websocket消息类型
+MESSAGE_SYNC = 0
+MESSAGE_AWARENESS = 1
+SYNC_STEP1 = 0
+SYNC_STEP2 = 1
+SYNC_UPDATE = 2
+
+# 不含任何变更的update编码(客户端同步时常发送)
+EMPTY_UPDATE = b"\x00\x00"
+
+# 跨进程消息类型(首字节)
+RELAY_UPDATE = b"u"
+RELAY_AWARENESS = b"a"
+
+_KEY_PREFIX = "collab:"
+
+
+def _write_var_uint(buffer: bytearray, value: int) -> None:
+    while value > 0x7F:
+        buffer.append(0x80 | (value & 0x7F))
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_var_uint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _read_var_bytes(data: bytes, pos: int) -> Tuple[bytes, int]:
+    length, pos = _read_var_uint(data, pos)
+    return data[pos:pos + length], pos + length
+
+
+def encode_message(message_type: int, payload: bytes, sync_type: Optional[int] = None) -> bytes:
+    """按lib0编码构造y-websocket消息"""
+    buffer = bytearray()
+    _write_var_uint(buffer, message_type)
+    if sync_type is not None:
+        _write_var_uint(buffer, sync_type)
+    _write_var_uint(buffer, len(payload))
+    buffer += payload
+    return bytes(buffer)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _replace_text(doc: Y.YDoc, text: str) -> None:
+    """把文档正文替换为text，只删除和插入首尾相同部分之间的内容"""
+    current = str(doc.get_text(COLLAB_TEXT_NAME))
+    prefix = 0
+    limit = min(len(current), len(text))
+    while prefix < limit and current[prefix] == text[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and current[-1 - suffix] == text[-1 - suffix]:
+        suffix += 1
+
+    # y-py按UTF-8字节计算位置
+    index = len(current[:prefix].encode("utf-8"))
+    removed = current[prefix:len(current) - suffix]
+    inserted = text[prefix:len(text) - suffix]
+
+    shared_text = doc.get_text(COLLAB_TEXT_NAME)
+    with doc.begin_transaction() as txn:
+        if removed:
+            shared_text.delete_range(txn, index, len(removed.encode("utf-8")))
+        if inserted:
+            shared_text.insert(txn, index, inserted)
+
+
+def external_edit_update(base_state: bytes, text: str) -> bytes:
+    """章节在协作之外被修改时，生成把上次写回的文档(base_state)正文改为text的增量更新
+
+    更新基于上次写回的状态而不是当前文档，合并进当前文档时保留之后的协作编辑；
+    客户端ID由base_state和text确定，各进程或重复合并同一次修改得到相同的更新，重复应用不会重复插入
+    """
+    digest = hashlib.sha256(base_state + text.encode("utf-8")).digest()
+    doc = Y.YDoc(client_id=int.from_bytes(digest[:4], "big") or 1)
+    Y.apply_update(doc, base_state)
+    state_vector = Y.encode_state_vector(doc)
+    _replace_text(doc, text)
+    return Y.encode_state_as_update(doc, state_vector)
+
+
+def _seed_update(text: str) -> bytes:
+    """由章节正文生成初始文档状态"""
+    doc = Y.YDoc(client_id=SEED_CLIENT_ID)
+    if text:
+        with doc.begin_transaction() as txn:
+            doc.get_text(COLLAB_TEXT_NAME).extend(txn, text)
+    return Y.encode_state_as_update(doc)
+
+
+class CollabRoom:
+    """一个章节的协作文档及其在本进程上的连接"""
+
+    def __init__(self, report_id: int, chapter_type: str):
+        self.report_id = report_id
+        self.chapter_type = chapter_type
+        self.key = f"{report_id}:{chapter_type}"
+        self.doc = Y.YDoc()
+        self.connections: Set[WebSocket] = set()
+        self.ready = asyncio.Event()
+        self.dirty = False
+        # 由章节正文初始化文档时的正文(尚无压缩状态时作为合并外部修改的基准)
+        self.base_text = ""
+
+    @property
+    def log_key(self) -> str:
+        return f"{_KEY_PREFIX}log:{self.key}"
+
+    @property
+    def channel(self) -> str:
+        return f"{_KEY_PREFIX}channel:{self.key}"
+
+    @property
+    def lock_key(self) -> str:
+        return f"{_KEY_PREFIX}lock:{self.key}"
+
+    def text(self) -> str:
+        return str(self.doc.get_text(COLLAB_TEXT_NAME))
+
+
+class CollabService:
+    """协作编辑服务：管理本进程上的协作文档、跨进程扇出和定期写回"""
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().bytes
+        self.rooms: Dict[str, CollabRoom] = {}
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """启动定期写回任务"""
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        """停止后台任务并写回所有文档"""
+        for task in (self._flusher, self._listener):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flusher = None
+        self._listener = None
+        await self.flush(list(self.rooms.values()))
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def join(self, report_id: int, chapter_type: str, websocket: WebSocket) -> CollabRoom:
+        """加入章节协作，首个连接负责加载文档"""
+        key = f"{report_id}:{chapter_type}"
+        room = self.rooms.get(key)
+        if room is None:
+            room = self.rooms[key] = CollabRoom(report_id, chapter_type)
+            try:
+                await self._load(room)
+            finally:
+                room.ready.set()
+        else:
+            await room.ready.wait()
+
+        room.connections.add(websocket)
+        await websocket.send_bytes(encode_message(MESSAGE_SYNC, Y.encode_state_vector(room.doc), SYNC_STEP1))
+        return room
+
+    async def leave(self, room: CollabRoom, websocket: WebSocket) -> None:
+        """离开章节协作，最后一个连接离开时写回并释放文档"""
+        room.connections.discard(websocket)
+        if room.connections:
+            return
+
+        # 写回完成后再释放文档，写回期间重新连入的客户端继续使用当前文档
+        await self.flush([room])
+        if room.connections or self.rooms.get(room.key) is not room:
+            return
+        del self.rooms[room.key]
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(room.channel)
+            except RedisError as e:
+                print(f"取消订阅协作频道失败: {str(e)}")
+
+    async def handle_message(self, room: CollabRoom, websocket: WebSocket, data: bytes) -> None:
+        """处理客户端发来的y-websocket消息"""
+        message_type, pos = _read_var_uint(data, 0)
+
+        if message_type == MESSAGE_AWARENESS:
+            await self._broadcast(room, data, exclude=websocket)
+            await self._relay(room, RELAY_AWARENESS, data)
+            return
+
+        if message_type != MESSAGE_SYNC:
+            return
+
+        sync_type, pos = _read_var_uint(data, pos)
+        payload, _ = _read_var_bytes(data, pos)
+        if sync_type == SYNC_STEP1:
+            update = Y.encode_state_as_update(room.doc, payload)
+            await websocket.send_bytes(encode_message(MESSAGE_SYNC, update, SYNC_STEP2))
+        elif sync_type in (SYNC_STEP2, SYNC_UPDATE) and payload != EMPTY_UPDATE:
+            await self._apply_update(room, payload, exclude=websocket)
+
+    async def _apply_update(self, room: CollabRoom, update: bytes, exclude: Optional[WebSocket] = None) -> None:
+        """应用本进程产生的更新：广播给其他连接，写入更新日志并扇出到其他进程"""
+        Y.apply_update(room.doc, update)
+        room.dirty = True
+        await self._broadcast(room, encode_message(MESSAGE_SYNC, update, SYNC_UPDATE), exclude=exclude)
+
+        if redis_configured():
+            try:
+                await get_redis(decode_responses=False).rpush(room.log_key, update)
+            except RedisError as e:
+                print(f"写入协作更新日志失败: {str(e)}")
+        await self._relay(room, RELAY_UPDATE, update)
+
+    async def _broadcast(self, room: CollabRoom, message: bytes, exclude: Optional[WebSocket] = None) -> None:
+        for connection in list(room.connections):
+            if connection is exclude:
+                continue
+            try:
+                await connection.send_bytes(message)
+            except Exception:
+                room.connections.discard(connection)
+
+    async def _relay(self, room: CollabRoom, kind: bytes, payload: bytes) -> None:
+        if not redis_configured():
+            return
+        try:
+            await get_redis(decode_responses=False).publish(room.channel, self.node_id + kind + payload)
+        except RedisError as e:
+            print(f"协作消息扇出失败: {str(e)}")
+
+    async def _load(self, room: CollabRoom) -> None:
+        """由数据库中的压缩状态(没有时由章节正文)和Redis更新日志恢复文档"""
+        db = SessionLocal()
+        try:
+            report = db.query(ReportDraft).filter(ReportDraft.id == room.report_id).first()
+            chapter_text = (getattr(report, room.chapter_type) if report else None) or ""
+            document = db.query(CollabDocument).filter(
+                CollabDocument.report_id == room.report_id,
+                CollabDocument.chapter_type == room.chapter_type
+            ).first()
+            state = document.state if document else None
+            state_hash = document.content_hash if document else None
+        finally:
+            db.close()
+
+        if state:
+            Y.apply_update(room.doc, state)
+            if report is not None and content_hash(chapter_text) != state_hash:
+                # 上次写回后章节在协作之外被修改，合并修改后再提供给客户端
+                await self._merge_external_edit(room, state, chapter_text)
+        else:
+            Y.apply_update(room.doc, _seed_update(chapter_text))
+            room.base_text = chapter_text
+
+        if not redis_configured():
+            return
+        try:
+            # 先订阅再读取日志，避免漏掉两者之间其他进程产生的更新(重复应用不影响结果)
+            await self._subscribe(room)
+            for update in await get_redis(decode_responses=False).lrange(room.log_key, 0, -1):
+                Y.apply_update(room.doc, update)
+        except RedisError as e:
+            print(f"加载协作更新日志失败: {str(e)}")
+
+    async def _subscribe(self, room: CollabRoom) -> None:
+        if self._pubsub is None:
+            self._pubsub = get_redis(decode_responses=False).pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(room.channel)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        """接收其他进程的更新和感知状态，转发给本进程的连接，没有文档时退出"""
+        channel_prefix = f"{_KEY_PREFIX}channel:".encode()
+        while self.rooms:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=LISTEN_TIMEOUT)
+            except RedisError as e:
+                print(f"读取协作消息失败: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            if not message or message["type"] != "message":
+                continue
+            data = message["data"]
+            node_id, kind, payload = data[:16], data[16:17], data[17:]
+            room = self.rooms.get(message["channel"][len(channel_prefix):].decode())
+            if node_id == self.node_id or room is None or not room.ready.is_set():
+                continue
+
+            if kind == RELAY_UPDATE:
+                Y.apply_update(room.doc, payload)
+                await self._broadcast(room, encode_message(MESSAGE_SYNC, payload, SYNC_UPDATE))
+            elif kind == RELAY_AWARENESS:
+                await self._broadcast(room, payload)
+
+    async def _merge_external_edit(self, room: CollabRoom, base_state: bytes, text: str) -> None:
+        """把协作之外对章节的修改作为一次普通编辑合并进文档并同步给所有客户端"""
+        update = external_edit_update(base_state, text)
+        if update != EMPTY_UPDATE:
+            await self._apply_update(room, update)
+
+    async def _acquire(self, room: CollabRoom) -> Optional[int]:
+        """获取章节的压缩锁并合并尚未收到的更新，返回本次可压缩的日志条数(未获取到锁时为None)"""
+        if not redis_configured():
+            return 0
+        redis = get_redis(decode_responses=False)
+        try:
+            if not await redis.set(room.lock_key, self.node_id, nx=True, ex=COLLAB_LOCK_TTL):
+                return None
+            updates = await redis.lrange(room.log_key, 0, -1)
+        except RedisError as e:
+            print(f"获取协作压缩锁失败: {str(e)}")
+            return None
+        for update in updates:
+            Y.apply_update(room.doc, update)
+        return len(updates)
+
+    async def _release(self, room: CollabRoom, compacted: int) -> None:
+        if not redis_configured():
+            return
+        redis = get_redis(decode_responses=False)
+        try:
+            if compacted:
+                await redis.ltrim(room.log_key, compacted, -1)
+            await redis.delete(room.lock_key)
+        except RedisError as e:
+            print(f"压缩协作更新日志失败: {str(e)}")
+
+    async def flush(self, rooms: List[CollabRoom]) -> None:
+        """批量写回章节正文和压缩状态
+
+        章节在协作之外被修改(如AI生成、PUT章节接口)时，把新正文相对上次写回正文的差异作为一次编辑合并进文档
+        """
+        acquired: Dict[str, Tuple[CollabRoom, int]] = {}
+        for room in rooms:
+            if not room.ready.is_set():
+                continue
+            compacted = await self._acquire(room)
+            if compacted is not None:
+                acquired[room.key] = (room, compacted)
+        if not acquired:
+            return
+
+        db = SessionLocal()
+        written: List[Tuple[CollabRoom, int]] = []
+        updated_reports: Set[int] = set()
+        try:
+            report_ids = {room.report_id for room, _ in acquired.values()}
+            reports = {
+                report.id: report
+                for report in db.query(ReportDraft).options(undefer_group("content")).filter(
+                    ReportDraft.id.in_(report_ids)
+                ).all()
+            }
+            documents = {
+                f"{document.report_id}:{document.chapter_type}": document
+                for document in db.query(CollabDocument).filter(CollabDocument.report_id.in_(report_ids)).all()
+            }
+
+            for room, compacted in acquired.values():
+                report = reports.get(room.report_id)
+                if report is None:
+                    continue
+                document = documents.get(room.key)
+                chapter_text = getattr(report, room.chapter_type) or ""
+                # 与上次写回的正文比较，只把两者之间的差异合并进文档
+                if document is not None and document.state:
+                    base_state, base_hash = document.state, document.content_hash
+                else:
+                    base_state, base_hash = _seed_update(room.base_text), content_hash(room.base_text)
+                changed_outside = content_hash(chapter_text) != base_hash
+                if changed_outside:
+                    await self._merge_external_edit(room, base_state, chapter_text)
+                if not (room.dirty or compacted or changed_outside):
+                    continue
+
+                room.dirty = False
+                text = room.text()
+                state = Y.encode_state_as_update(room.doc)
+                if document is None:
+                    document = CollabDocument(report_id=room.report_id, chapter_type=room.chapter_type)
+                    db.add(document)
+                document.state = state
+                document.content_hash = content_hash(text)
+                if text != chapter_text:
+                    setattr(report, room.chapter_type, text)
+                    report.updated_at = datetime.utcnow()
+                    SearchService().index_report(db, report, [room.chapter_type])
+                    updated_reports.add(report.id)
+                written.append((room, compacted))
+
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for room, _ in written:
+                room.dirty = True
+            written = []
+            updated_reports.clear()
+            print(f"协作文档写回失败: {str(e)}")
+        finally:
+            db.close()
+
+        for report_id in updated_reports:
+            await report_cache.invalidate(report_id)
+
+        compacted_by_key = {room.key: compacted for room, compacted in written}
+        for room, _ in acquired.values():
+            await self._release(room, compacted_by_key.get(room.key, 0))
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(COLLAB_FLUSH_INTERVAL)
+            try:
+                await self.flush(list(self.rooms.values()))
+            except Exception as e:
+                print(f"协作文档写回失败: {str(e)}")
+
+
+collab_service = CollabService()
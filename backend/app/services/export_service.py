@@ -0,0 +1,371 @@
+"""
+报告导出服务
+
+基于python-docx渲染Word文档，通过本地LibreOffice转换PDF，
+渲染在进程池中执行，产物按报告内容哈希缓存在磁盘
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from app.core.metrics import register_cache
+
+# 导出配置；缓存目录未配置时为backend/exports，与工作目录无关
+EXPORT_CACHE_DIR = Path(
+    os.getenv("EXPORT_CACHE_DIR", str(Path(__file__).resolve().parents[2] / "exports"))
+).resolve()
+# 缓存淘汰：超过保留天数的产物删除，总大小超过上限时按最近使用时间从旧到新删除
+EXPORT_CACHE_MAX_MB = int(os.getenv("EXPORT_CACHE_MAX_MB", "2048"))
+EXPORT_CACHE_MAX_AGE_DAYS = float(os.getenv("EXPORT_CACHE_MAX_AGE_DAYS", "30"))
+EXPORT_CACHE_PRUNE_INTERVAL = float(os.getenv("EXPORT_CACHE_PRUNE_INTERVAL", "300"))
+# 最近使用过的产物可能正在下载或写入批量归档，不参与淘汰
+EXPORT_CACHE_GRACE_SECONDS = 600
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+LIBREOFFICE_BIN = os.getenv("LIBREOFFICE_BIN", "soffice")
+PDF_CONVERT_TIMEOUT = int(os.getenv("PDF_CONVERT_TIMEOUT", "120"))
+
+# 渲染逻辑变更时递增，使旧缓存失效
+RENDERER_VERSION = "1"
+
+EXPORT_FORMATS = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+
+# 报告章节及导出顺序
+REPORT_CHAPTERS = (
+    ("accident_details", "事故经过及索赔"),
+    ("policy_summary", "保单内容摘要"),
+    ("site_investigation", "现场查勘情况"),
+    ("cause_analysis", "事故原因分析"),
+    ("loss_assessment", "损失核定"),
+    ("conclusion", "公估结论"),
+)
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+_BULLET_PATTERN = re.compile(r"^\s*[-*•]\s+(.*)$")
+_NUMBERED_PATTERN = re.compile(r"^\s*\d+[.、]\s*(.*)$")
+_BOLD_PATTERN = re.compile(r"\*\*(.+?)\*\*")
+_TABLE_SEPARATOR_PATTERN = re.compile(r"^\s*\|?\s*:?-{2,}")
+
+
+class ExportError(Exception):
+    """报告导出失败"""
+
+
+class ExportArtifact(NamedTuple):
+    """导出产物"""
+    path: Path
+    content_hash: str
+    media_type: str
+
+
+def build_payload(report) -> Dict[str, Optional[str]]:
+    """提取渲染所需的报告内容快照(可跨进程传递)"""
+    payload = {
+        "id": report.id,
+        "title": report.title,
+        "insurance_type": report.insurance_type.value if report.insurance_type else None,
+        "status": report.status.value if report.status else None,
+    }
+    for field, _ in REPORT_CHAPTERS:
+        payload[field] = getattr(report, field)
+    return payload
+
+
+def content_hash(payload: Dict[str, Optional[str]], export_format: str) -> str:
+    """按报告内容、导出格式和渲染器版本计算缓存键"""
+    digest = hashlib.sha256()
+    digest.update(f"{RENDERER_VERSION}:{export_format}:".encode())
+    digest.update(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _add_rich_paragraph(document, text: str, style: Optional[str] = None):
+    """添加段落，支持**加粗**标记"""
+    paragraph = document.add_paragraph(style=style)
+    position = 0
+    for match in _BOLD_PATTERN.finditer(text):
+        if match.start() > position:
+            paragraph.add_run(text[position:match.start()])
+        paragraph.add_run(match.group(1)).bold = True
+        position = match.end()
+    if position < len(text):
+        paragraph.add_run(text[position:])
+    return paragraph
+
+
+def _add_markdown(document, content: str, base_level: int):
+    """将章节中的简单Markdown转换为Word段落"""
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped or _TABLE_SEPARATOR_PATTERN.match(stripped):
+            continue
+
+        heading = _HEADING_PATTERN.match(stripped)
+        if heading:
+            level = min(base_level + len(heading.group(1)) - 2, 9)
+            document.add_heading(heading.group(2).replace("**", ""), level=max(level, base_level))
+            continue
+
+        if stripped.startswith("|"):
+            cells = [cell.strip() for cell in stripped.strip("|").split("|")]
+            _add_rich_paragraph(document, "\t".join(cells))
+            continue
+
+        bullet = _BULLET_PATTERN.match(stripped)
+        if bullet:
+            _add_rich_paragraph(document, bullet.group(1), style="List Bullet")
+            continue
+
+        numbered = _NUMBERED_PATTERN.match(stripped)
+        if numbered:
+            _add_rich_paragraph(document, numbered.group(1), style="List Number")
+            continue
+
+        _add_rich_paragraph(document, stripped)
+
+
+def preload_renderer() -> None:
+    """在渲染进程中导入python-docx"""
+    import docx  # noqa: F401
+
+
+def render_docx(payload: Dict[str, Optional[str]], output_path: Path) -> None:
+    """渲染Word文档"""
+    from docx import Document
+    from docx.oxml.ns import qn
+    from docx.shared import Pt
+
+    document = Document()
+
+    # 中文字体
+    normal_style = document.styles["Normal"]
+    normal_style.font.name = "宋体"
+    normal_style.font.size = Pt(11)
+    normal_style.element.rPr.rFonts.set(qn("w:eastAsia"), "宋体")
+
+    document.add_heading(payload["title"] or "公估报告", level=0)
+    meta = [
+        ("保险类型", payload.get("insurance_type")),
+        ("报告状态", payload.get("status")),
+    ]
+    for label, value in meta:
+        if value:
+            document.add_paragraph(f"{label}：{value}")
+
+    for index, (field, title) in enumerate(REPORT_CHAPTERS, 1):
+        document.add_heading(f"{index}. {title}", level=1)
+        content = payload.get(field)
+        if content:
+            _add_markdown(document, content, base_level=2)
+        else:
+            document.add_paragraph("（暂无内容）")
+
+    document.save(str(output_path))
+
+
+def convert_to_pdf(docx_path: Path, output_path: Path) -> None:
+    """调用本地LibreOffice将Word文档转换为PDF"""
+    if shutil.which(LIBREOFFICE_BIN) is None:
+        raise ExportError(f"未找到PDF转换程序: {LIBREOFFICE_BIN}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 每次转换使用独立的用户配置目录，避免并发转换互相锁定
+        profile = Path(work_dir) / "profile"
+        try:
+            result = subprocess.run(
+                [
+                    LIBREOFFICE_BIN,
+                    f"-env:UserInstallation=file://{profile}",
+                    "--headless",
+                    "--convert-to", "pdf",
+                    "--outdir", work_dir,
+                    str(docx_path),
+                ],
+                capture_output=True,
+                timeout=PDF_CONVERT_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            raise ExportError(f"PDF转换超时({PDF_CONVERT_TIMEOUT}秒)")
+        converted = Path(work_dir) / f"{docx_path.stem}.pdf"
+        if result.returncode != 0 or not converted.exists():
+            raise ExportError(f"PDF转换失败: {result.stderr.decode(errors='ignore')[:500]}")
+        shutil.move(str(converted), str(output_path))
+
+
+def render_to_cache(payload: Dict[str, Optional[str]], export_format: str, output_path: str) -> str:
+    """在工作进程中渲染报告并原子写入缓存路径"""
+    target = Path(output_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=target.parent) as work_dir:
+        docx_path = Path(work_dir) / f"report_{payload['id']}.docx"
+        render_docx(payload, docx_path)
+
+        if export_format == "pdf":
+            rendered = Path(work_dir) / f"report_{payload['id']}.pdf"
+            convert_to_pdf(docx_path, rendered)
+        else:
+            rendered = docx_path
+
+        os.replace(rendered, target)
+
+    return str(target)
+
+
+def prune_cache(
+    root: Optional[Path] = None,
+    max_bytes: Optional[int] = None,
+    max_age: Optional[float] = None,
+    now: Optional[float] = None
+) -> int:
+    """淘汰缓存产物，返回删除的文件数；只处理哈希分目录下的产物，不涉及批量导出归档"""
+    root = root or EXPORT_CACHE_DIR
+    max_bytes = EXPORT_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    max_age = EXPORT_CACHE_MAX_AGE_DAYS * 86400 if max_age is None else max_age
+    now = time.time() if now is None else now
+
+    entries = []
+    for path in root.glob("??/*"):
+        if path.suffix[1:] not in EXPORT_FORMATS:
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    entries.sort(key=lambda entry: entry[0])
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        age = now - mtime
+        if age < EXPORT_CACHE_GRACE_SECONDS or (age <= max_age and total <= max_bytes):
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+class ExportService:
+    """报告导出服务类"""
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _inflight: Dict[str, "asyncio.Future"] = {}
+    # 磁盘缓存命中统计
+    hits = 0
+    misses = 0
+    evictions = 0
+    _pruned_at: Optional[float] = None
+
+    @classmethod
+    def executor(cls) -> ProcessPoolExecutor:
+        """获取渲染进程池(首次使用时创建)"""
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(max_workers=EXPORT_WORKERS)
+        return cls._executor
+
+    @classmethod
+    def warm_up(cls) -> None:
+        """启动全部渲染进程并预先导入python-docx，避免首次导出时承担进程启动和导入耗时；同时淘汰一次过期缓存"""
+        executor = cls.executor()
+        for future in [executor.submit(preload_renderer) for _ in range(EXPORT_WORKERS)]:
+            future.result()
+        cls.prune()
+
+    @classmethod
+    def prune(cls) -> None:
+        """淘汰缓存产物，失败时只记录日志"""
+        cls._pruned_at = time.monotonic()
+        try:
+            cls.evictions += prune_cache()
+        except OSError as e:
+            print(f"导出缓存清理失败: {str(e)}")
+
+    @classmethod
+    def _schedule_prune(cls) -> None:
+        """距上次淘汰超过间隔时在线程中执行一次，不阻塞当前导出"""
+        if cls._pruned_at is not None and time.monotonic() - cls._pruned_at < EXPORT_CACHE_PRUNE_INTERVAL:
+            return
+        cls._pruned_at = time.monotonic()
+        asyncio.get_running_loop().run_in_executor(None, cls.prune)
+
+    @classmethod
+    def _reset_executor(cls, executor: ProcessPoolExecutor) -> None:
+        """渲染进程异常退出后进程池不可再用，丢弃后下次使用时重建"""
+        if cls._executor is executor:
+            cls._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def shutdown(cls):
+        """关闭渲染进程池"""
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    def cache_path(self, digest: str, export_format: str) -> Path:
+        """缓存产物路径，按哈希前两位分目录"""
+        return EXPORT_CACHE_DIR / digest[:2] / f"{digest}.{export_format}"
+
+    async def export(self, payload: Dict[str, Optional[str]], export_format: str) -> ExportArtifact:
+        """导出报告，内容未变化时直接返回磁盘缓存"""
+        if export_format not in EXPORT_FORMATS:
+            raise ExportError(f"不支持的导出格式: {export_format}")
+
+        digest = content_hash(payload, export_format)
+        path = self.cache_path(digest, export_format)
+        artifact = ExportArtifact(path=path, content_hash=digest, media_type=EXPORT_FORMATS[export_format])
+
+        if path.exists():
+            # 命中时更新修改时间，淘汰按最近使用时间排序
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            ExportService.hits += 1
+            return artifact
+
+        ExportService.misses += 1
+
+        # 同一内容的并发导出只渲染一次
+        future = self._inflight.get(digest)
+        executor = self.executor()
+        if future is None:
+            loop = asyncio.get_running_loop()
+            try:
+                future = loop.run_in_executor(
+                    executor, render_to_cache, payload, export_format, str(path)
+                )
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+                raise ExportError("渲染进程异常退出，请重试")
+            self._inflight[digest] = future
+            future.add_done_callback(lambda _: self._inflight.pop(digest, None))
+
+        try:
+            await asyncio.shield(future)
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            raise ExportError("渲染进程异常退出，请重试")
+        self._schedule_prune()
+        return artifact
+
+
+register_cache("export", ExportService)
@@ -0,0 +1,265 @@
+"""
+结构化字段抽取服务
+
+使用预编译的规则集从OCR文本中抽取保单号、事故时间、地点、车牌、金额等字段，
+规则文件修改后自动热加载
+"""
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db.models import ExtractedField, UploadedFile
+
+# 规则文件配置
+RULES_PATH = Path(os.getenv(
+    "EXTRACTION_RULES_PATH",
+    str(Path(__file__).parent / "rules" / "insurance_fields.json")
+))
+
+_MACRO_PATTERN = re.compile(r"<<([A-Z_]+)>>")
+_DATETIME_PATTERN = re.compile(
+    r"(\d{4})[年/.-](\d{1,2})[月/.-](\d{1,2})日?"
+    r"(?:\s*(上午|下午|凌晨|早上|中午|晚上)?\s*(\d{1,2})(?:[时点:：](\d{1,2})?)?)?"
+)
+
+
+class ExtractedValue(NamedTuple):
+    """抽取结果"""
+    name: str
+    label: str
+    value_type: str
+    value: str
+    raw_text: str
+    start: int
+    end: int
+
+
+class _CompiledRuleSet(NamedTuple):
+    """编译后的规则集：所有规则合并为一个正则，单次扫描完成抽取"""
+    version: str
+    pattern: "re.Pattern"
+    rules: Dict[str, Tuple[str, str, str]]  # 分组名 -> (字段标识, 中文名, 值类型)
+    mtime: float
+
+
+def _normalize_money(raw: str) -> str:
+    """金额规范化为元，保留两位小数"""
+    text = raw.replace("￥", "").replace("¥", "").replace(",", "").replace("，", "").strip()
+    multiplier = Decimal(1)
+    if text.endswith("万元") or text.endswith("万"):
+        multiplier = Decimal(10000)
+    text = text.rstrip("万元").strip()
+    try:
+        return str((Decimal(text) * multiplier).quantize(Decimal("0.01")))
+    except InvalidOperation:
+        return raw.strip()
+
+
+def _normalize_datetime(raw: str) -> str:
+    """日期时间规范化为ISO格式，仅有日期时输出日期"""
+    match = _DATETIME_PATTERN.search(raw)
+    if not match:
+        return raw.strip()
+
+    year, month, day, period, hour, minute = match.groups()
+    date_part = f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
+    if hour is None:
+        return date_part
+
+    hour_value = int(hour)
+    if period in ("下午", "晚上") and hour_value < 12:
+        hour_value += 12
+    elif period == "中午" and hour_value < 11:
+        hour_value += 12
+    return f"{date_part}T{hour_value:02d}:{int(minute or 0):02d}"
+
+
+def _normalize_plate(raw: str) -> str:
+    """车牌号去除分隔符并转大写"""
+    return re.sub(r"[\s·]", "", raw).upper()
+
+
+_NORMALIZERS: Dict[str, Callable[[str], str]] = {
+    "string": lambda raw: raw.strip(),
+    "money": _normalize_money,
+    "datetime": _normalize_datetime,
+    "plate": _normalize_plate,
+}
+
+
+def compile_rules(config: dict, mtime: float = 0.0) -> _CompiledRuleSet:
+    """将规则配置编译为单个合并正则"""
+    macros = config.get("macros", {})
+
+    def expand(pattern: str) -> str:
+        # 宏可以嵌套引用其他宏
+        for _ in range(5):
+            expanded = _MACRO_PATTERN.sub(lambda m: macros[m.group(1)], pattern)
+            if expanded == pattern:
+                break
+            pattern = expanded
+        return pattern
+
+    alternatives = []
+    rules = {}
+    for i, rule in enumerate(config["rules"]):
+        value_type = rule.get("type", "string")
+        if value_type not in _NORMALIZERS:
+            raise ValueError(f"未知的字段类型: {value_type}")
+
+        group = f"r{i}"
+        pattern = expand(rule["pattern"]).replace("(?P<value>", f"(?P<{group}_value>")
+        # 校验单条规则可独立编译，便于定位错误
+        re.compile(pattern)
+        alternatives.append(f"(?P<{group}>{pattern})")
+        rules[group] = (rule["name"], rule.get("label", rule["name"]), value_type)
+
+    return _CompiledRuleSet(
+        version=str(config.get("version", "")),
+        pattern=re.compile("|".join(alternatives)),
+        rules=rules,
+        mtime=mtime
+    )
+
+
+class _RuleSetLoader:
+    """规则集加载器，按文件修改时间热加载"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._ruleset: Optional[_CompiledRuleSet] = None
+        # 加载失败的文件修改时间，文件再次修改前不重复加载
+        self._failed_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> _CompiledRuleSet:
+        ruleset = self._ruleset
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            # 规则文件替换过程中可能短暂不存在
+            if ruleset is None:
+                raise
+            return ruleset
+        if ruleset is not None and mtime in (ruleset.mtime, self._failed_mtime):
+            return ruleset
+
+        with self._lock:
+            if self._ruleset is None or mtime not in (self._ruleset.mtime, self._failed_mtime):
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        config = json.load(f)
+                    self._ruleset = compile_rules(config, mtime)
+                    self._failed_mtime = None
+                except (OSError, KeyError, TypeError, ValueError, re.error) as e:
+                    # 规则文件写入未完成或新规则无效时继续使用旧规则
+                    if self._ruleset is None:
+                        raise
+                    self._failed_mtime = mtime
+                    print(f"抽取规则加载失败，继续使用版本{self._ruleset.version}: {str(e)}")
+            return self._ruleset
+
+
+_loader = _RuleSetLoader(RULES_PATH)
+
+
+class ExtractionService:
+    """结构化字段抽取服务类"""
+
+    def extract(self, text: str) -> List[ExtractedValue]:
+        """
+        单次扫描文本抽取全部字段
+
+        所有规则合并为一个交替正则，每个位置只尝试一次匹配，
+        耗时与文本长度成线性关系
+        """
+        if not text:
+            return []
+
+        ruleset = _loader.get()
+        results: List[ExtractedValue] = []
+        for match in ruleset.pattern.finditer(text):
+            group = match.lastgroup
+            name, label, value_type = ruleset.rules[group]
+            value_group = f"{group}_value"
+            raw = match.group(value_group)
+            if not raw or not raw.strip():
+                continue
+            results.append(ExtractedValue(
+                name=name,
+                label=label,
+                value_type=value_type,
+                value=_NORMALIZERS[value_type](raw),
+                raw_text=raw.strip(),
+                start=match.start(value_group),
+                end=match.end(value_group)
+            ))
+        return results
+
+    def extract_file(self, db: Session, db_file: UploadedFile) -> int:
+        """抽取文件OCR文本中的字段并保存(不提交事务)，返回字段数；抽取失败时不修改已有结果"""
+        values = self.extract(db_file.ocr_text or "")
+        version = _loader.get().version
+        self.remove_file(db, db_file.id)
+        for item in values:
+            db.add(ExtractedField(
+                file_id=db_file.id,
+                report_id=db_file.report_id,
+                name=item.name,
+                label=item.label,
+                value_type=item.value_type,
+                value=item.value[:255],
+                raw_text=item.raw_text[:255],
+                start_offset=item.start,
+                end_offset=item.end,
+                rule_version=version
+            ))
+        return len(values)
+
+    def remove_file(self, db: Session, file_id: int) -> None:
+        """删除文件的抽取结果(不提交事务)"""
+        db.query(ExtractedField).filter(
+            ExtractedField.file_id == file_id
+        ).delete(synchronize_session=False)
+
+    def get_report_facts(self, db: Session, report_id: int) -> "OrderedDict[str, str]":
+        """
+        汇总报告关联文件中抽取出的事实，键为字段中文名
+
+        同一字段出现多次时取最早上传文件中的第一次出现
+        """
+        return self.get_facts_for_reports(db, [report_id]).get(report_id, OrderedDict())
+
+    def get_facts_for_reports(
+        self,
+        db: Session,
+        report_ids: List[int]
+    ) -> Dict[int, "OrderedDict[str, str]"]:
+        """一次查询汇总多个报告的事实，供批量填充使用"""
+        if not report_ids:
+            return {}
+
+        rows = db.query(
+            ExtractedField.report_id,
+            ExtractedField.label,
+            ExtractedField.value
+        ).filter(
+            ExtractedField.report_id.in_(report_ids)
+        ).order_by(
+            ExtractedField.report_id.asc(),
+            ExtractedField.file_id.asc(),
+            ExtractedField.start_offset.asc()
+        ).all()
+
+        facts: Dict[int, "OrderedDict[str, str]"] = {}
+        for report_id, label, value in rows:
+            facts.setdefault(report_id, OrderedDict()).setdefault(label, value)
+        return facts
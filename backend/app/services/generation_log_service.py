@@ -0,0 +1,337 @@
+"""
+AI生成日志服务
+
+生成接口提交章节后只把日志放入内存缓冲，后台任务按批写入数据库，请求耗时不包括日志写入。
+Postgres中日志表按created_at按月分区，生成历史只查询最近AI_LOG_HISTORY_DAYS天的分区；
+超过保留期的日志按月归档到AIGenerationStat汇总后删除(整月分区直接删除)，提示词统计合并两者
+
+用法(在backend目录下，建议由定时任务每天执行maintain)：
+    python -m app.services.generation_log_service partition
+    python -m app.services.generation_log_service maintain --retention-days 180
+"""
+
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import func, insert, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, undefer
+
+from app.db.config import SessionLocal, engine
+from app.db.models import AIGenerationLog, AIGenerationStat
+from app.db.partitions import (
+    add_months,
+    drop_partitions_before,
+    ensure_monthly_partitions,
+    month_start,
+    partition_by_month,
+    supports_partitions
+)
+from app.services.stats_service import generation_deltas, increment_counters
+
+# 后写缓冲配置：缓冲达到批量大小或到达刷新间隔时写入
+AI_LOG_FLUSH_INTERVAL = float(os.getenv("AI_LOG_FLUSH_INTERVAL", "2"))
+AI_LOG_BATCH_SIZE = int(os.getenv("AI_LOG_BATCH_SIZE", "100"))
+# 数据库不可用时缓冲的最大条数，超出后丢弃最早的日志
+AI_LOG_MAX_PENDING = int(os.getenv("AI_LOG_MAX_PENDING", "10000"))
+# 生成历史查询的时间范围(天)
+AI_LOG_HISTORY_DAYS = int(os.getenv("AI_LOG_HISTORY_DAYS", "90"))
+# 明细日志保留期(天)，早于保留期所在月份的日志归档为月度汇总
+AI_LOG_RETENTION_DAYS = int(os.getenv("AI_LOG_RETENTION_DAYS", "180"))
+# 提前创建的分区月数
+AI_LOG_PARTITIONS_AHEAD = int(os.getenv("AI_LOG_PARTITIONS_AHEAD", "2"))
+
+AI_LOG_TABLE = AIGenerationLog.__tablename__
+# 归档任务的Postgres咨询锁，防止多个任务同时归档重复计数
+ROLLUP_LOCK_KEY = 4801
+
+# 月度汇总的分组列
+STAT_KEYS = ("report_id", "user_id", "prompt_version_id", "chapter_type", "model_name")
+
+
+class GenerationTotals(NamedTuple):
+    """生成日志汇总值"""
+    generation_count: int = 0
+    tokens_used: int = 0
+    prompt_tokens: int = 0
+    prompt_tokens_rows: int = 0
+    completion_tokens: int = 0
+    completion_tokens_rows: int = 0
+    generation_time: float = 0.0
+
+    def __add__(self, other: "GenerationTotals") -> "GenerationTotals":
+        return GenerationTotals(*(a + b for a, b in zip(self, other)))
+
+
+class RollupResult(NamedTuple):
+    """归档结果"""
+    cutoff: datetime
+    months: int
+    rows: int
+    dropped_partitions: List[str]
+
+
+def write_logs(rows: List[Dict[str, Any]]) -> int:
+    """批量写入日志并累加用户AI用量计数，返回写入条数；批量写入违反约束(如报告已删除)时逐条写入并跳过失败的日志"""
+    db = SessionLocal()
+    try:
+        try:
+            db.execute(insert(AIGenerationLog), rows)
+            increment_counters(db.connection(), generation_deltas(rows))
+            db.commit()
+            return len(rows)
+        except IntegrityError:
+            db.rollback()
+
+        written = 0
+        for row in rows:
+            try:
+                db.execute(insert(AIGenerationLog), [row])
+                increment_counters(db.connection(), generation_deltas([row]))
+                db.commit()
+                written += 1
+            except IntegrityError as e:
+                db.rollback()
+                print(f"丢弃无法写入的AI生成日志(报告{row.get('report_id')}): {str(e.orig)}")
+        return written
+    finally:
+        db.close()
+
+
+class GenerationLogWriter:
+    """AI生成日志后写缓冲"""
+
+    def __init__(self, batch_size: int = AI_LOG_BATCH_SIZE, interval: float = AI_LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending: List[Dict[str, Any]] = []
+        self.written = 0
+        self.dropped = 0
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, **fields: Any) -> None:
+        """放入一条日志(AIGenerationLog的列)，created_at默认为当前时间"""
+        fields.setdefault("created_at", datetime.now(timezone.utc))
+        self.pending.append(fields)
+        self._trim()
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _trim(self) -> None:
+        overflow = len(self.pending) - AI_LOG_MAX_PENDING
+        if overflow > 0:
+            del self.pending[:overflow]
+            self.dropped += overflow
+            print(f"AI生成日志缓冲已满，丢弃最早的{overflow}条")
+
+    def start(self) -> None:
+        """启动定期写入任务"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        """停止后台任务并写入缓冲中的全部日志"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """写入缓冲中的日志，写入失败时放回缓冲等待下次重试"""
+        async with self._lock:
+            written = 0
+            while self.pending:
+                batch = self.pending[:self.batch_size]
+                del self.pending[:len(batch)]
+                try:
+                    written += await asyncio.to_thread(write_logs, batch)
+                except Exception as e:
+                    self.pending[:0] = batch
+                    self._trim()
+                    print(f"AI生成日志写入失败: {str(e)}")
+                    break
+            self.written += written
+            return written
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"AI生成日志写入失败: {str(e)}")
+
+
+generation_log_writer = GenerationLogWriter()
+
+
+def ensure_partitions() -> List[str]:
+    """创建当月及之后AI_LOG_PARTITIONS_AHEAD个月的分区(日志表未分区时不处理)"""
+    with engine.begin() as connection:
+        return ensure_monthly_partitions(
+            connection, AI_LOG_TABLE, "created_at", datetime.now(timezone.utc), AI_LOG_PARTITIONS_AHEAD + 1
+        )
+
+
+def partition_table() -> bool:
+    """把Postgres中的普通日志表改为按月分区表，已分区或非Postgres时返回False"""
+    with engine.begin() as connection:
+        return partition_by_month(connection, AIGenerationLog.__table__, "created_at", AI_LOG_PARTITIONS_AHEAD)
+
+
+class GenerationLogService:
+    """AI生成日志查询和归档服务类"""
+
+    def history(self, db: Session, report_id: int, skip: int = 0, limit: int = 10) -> List[AIGenerationLog]:
+        """报告最近AI_LOG_HISTORY_DAYS天的生成日志，按时间倒序"""
+        since = datetime.now(timezone.utc) - timedelta(days=AI_LOG_HISTORY_DAYS)
+        return db.query(AIGenerationLog).options(undefer(AIGenerationLog.generated_content)).filter(
+            AIGenerationLog.report_id == report_id,
+            AIGenerationLog.created_at >= since
+        ).order_by(AIGenerationLog.created_at.desc()).offset(skip).limit(limit).all()
+
+    def prompt_totals(self, db: Session, prompt_ids: Sequence[int]) -> Dict[int, GenerationTotals]:
+        """按提示词版本合计明细日志和月度汇总"""
+        if not prompt_ids:
+            return {}
+
+        log_rows = db.query(
+            AIGenerationLog.prompt_version_id,
+            func.count(AIGenerationLog.id),
+            func.sum(AIGenerationLog.tokens_used),
+            func.sum(AIGenerationLog.prompt_tokens),
+            func.count(AIGenerationLog.prompt_tokens),
+            func.sum(AIGenerationLog.completion_tokens),
+            func.count(AIGenerationLog.completion_tokens),
+            func.sum(AIGenerationLog.generation_time)
+        ).filter(
+            AIGenerationLog.prompt_version_id.in_(prompt_ids)
+        ).group_by(AIGenerationLog.prompt_version_id).all()
+
+        stat_rows = db.query(
+            AIGenerationStat.prompt_version_id,
+            func.sum(AIGenerationStat.generation_count),
+            func.sum(AIGenerationStat.tokens_used),
+            func.sum(AIGenerationStat.prompt_tokens),
+            func.sum(AIGenerationStat.prompt_tokens_rows),
+            func.sum(AIGenerationStat.completion_tokens),
+            func.sum(AIGenerationStat.completion_tokens_rows),
+            func.sum(AIGenerationStat.generation_time)
+        ).filter(
+            AIGenerationStat.prompt_version_id.in_(prompt_ids)
+        ).group_by(AIGenerationStat.prompt_version_id).all()
+
+        totals: Dict[int, GenerationTotals] = {}
+        for row in list(log_rows) + list(stat_rows):
+            values = GenerationTotals(*(int(value or 0) for value in row[1:7]), float(row[7] or 0))
+            totals[row[0]] = totals.get(row[0], GenerationTotals()) + values
+        return totals
+
+    def rollup(self, db: Session, retention_days: int = AI_LOG_RETENTION_DAYS) -> RollupResult:
+        """把早于保留期所在月份的日志按月归档为汇总并删除，整月分区直接删除"""
+        cutoff = month_start(datetime.now(timezone.utc) - timedelta(days=retention_days))
+        connection = db.connection()
+        if supports_partitions(connection):
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY})
+
+        oldest = db.query(func.min(AIGenerationLog.created_at)).scalar()
+        month = month_start(oldest) if oldest is not None else cutoff
+        months = rows = 0
+        while month < cutoff:
+            next_month = add_months(month, 1)
+            rolled = self._rollup_month(db, month, next_month)
+            if rolled:
+                months += 1
+                rows += rolled
+            month = next_month
+
+        dropped = drop_partitions_before(connection, AI_LOG_TABLE, cutoff)
+        db.query(AIGenerationLog).filter(
+            AIGenerationLog.created_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return RollupResult(cutoff, months, rows, dropped)
+
+    def _rollup_month(self, db: Session, start: datetime, end: datetime) -> int:
+        key_columns = [getattr(AIGenerationLog, key) for key in STAT_KEYS]
+        groups = db.query(
+            *key_columns,
+            func.count(AIGenerationLog.id),
+            func.sum(AIGenerationLog.tokens_used),
+            func.sum(AIGenerationLog.prompt_tokens),
+            func.count(AIGenerationLog.prompt_tokens),
+            func.sum(AIGenerationLog.completion_tokens),
+            func.count(AIGenerationLog.completion_tokens),
+            func.sum(AIGenerationLog.generation_time)
+        ).filter(
+            AIGenerationLog.created_at >= start,
+            AIGenerationLog.created_at < end
+        ).group_by(*key_columns).all()
+        if not groups:
+            return 0
+
+        month = start.date()
+        stats = {
+            tuple(getattr(stat, key) for key in STAT_KEYS): stat
+            for stat in db.query(AIGenerationStat).filter(AIGenerationStat.month == month).all()
+        }
+        rows = 0
+        for group in groups:
+            key = tuple(group[:len(STAT_KEYS)])
+            totals = GenerationTotals(
+                *(int(value or 0) for value in group[len(STAT_KEYS):-1]), float(group[-1] or 0)
+            )
+            stat = stats.get(key)
+            if stat is None:
+                stat = AIGenerationStat(month=month, **dict(zip(STAT_KEYS, key)), **GenerationTotals()._asdict())
+                db.add(stat)
+                stats[key] = stat
+            for field, value in totals._asdict().items():
+                setattr(stat, field, getattr(stat, field) + value)
+            rows += totals.generation_count
+        db.flush()
+        return rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="AI生成日志分区和归档")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("partition", help="把日志表改为按月分区表(Postgres)")
+    maintain_parser = subparsers.add_parser("maintain", help="创建后续月份的分区并归档过期日志")
+    maintain_parser.add_argument("--retention-days", type=int, default=AI_LOG_RETENTION_DAYS, help="明细日志保留天数")
+    args = parser.parse_args(argv)
+
+    if args.command == "partition":
+        if partition_table():
+            print(f"已把 {AI_LOG_TABLE} 改为按月分区表")
+        else:
+            print(f"{AI_LOG_TABLE} 已是分区表或数据库不支持分区")
+        return
+
+    for name in ensure_partitions():
+        print(f"已创建分区: {name}")
+    db = SessionLocal()
+    try:
+        result = GenerationLogService().rollup(db, args.retention_days)
+    finally:
+        db.close()
+    print(f"已把 {result.cutoff:%Y-%m} 之前 {result.months} 个月的 {result.rows} 条日志归档为月度汇总")
+    for name in result.dropped_partitions:
+        print(f"已删除分区: {name}")
+
+
+if __name__ == "__main__":
+    main()
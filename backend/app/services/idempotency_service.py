@@ -0,0 +1,158 @@
+"""
+幂等键服务
+
+客户端为生成、上传等请求附带Idempotency-Key头，重试时使用同一个键：首个请求登记键并在成功后保存响应，
+之后相同键的请求直接重放保存的响应，不再重复调用模型或创建文件。
+同一个键只能用于内容相同的请求；首个请求失败时删除登记，允许用同一个键重试
+"""
+
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models import IdempotencyRecord
+
+# 保存响应的时长(秒)
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+# 处理中的登记超过该时长(秒)视为首个请求已中断，由重试接管
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "600"))
+# 清理过期记录的最小间隔(秒)
+IDEMPOTENCY_PURGE_INTERVAL = 3600
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class IdempotencyInProgressError(Exception):
+    """相同幂等键的请求仍在处理中"""
+
+
+class IdempotencyKeyMismatchError(Exception):
+    """幂等键已用于内容不同的请求"""
+
+
+class StoredResponse(NamedTuple):
+    """保存的响应"""
+    status_code: int
+    body: bytes
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """请求内容摘要，parts需可JSON序列化(bytes按摘要计入)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(hashlib.sha256(part).digest())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite返回不带时区的时间
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+class IdempotencyService:
+    """幂等键服务类"""
+
+    _last_purge = 0.0
+
+    def begin(self, db: Session, user_id: int, scope: str, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """登记幂等键：首次请求返回None，由调用方执行后调用complete或release；已完成的请求返回保存的响应"""
+        self._purge_expired(db)
+        now = datetime.now(timezone.utc)
+        try:
+            db.add(IdempotencyRecord(
+                user_id=user_id,
+                scope=scope,
+                key=key,
+                fingerprint=fingerprint,
+                created_at=now,
+                expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL)
+            ))
+            db.commit()
+            return None
+        except IntegrityError:
+            db.rollback()
+
+        record = self._get(db, user_id, scope, key)
+        if record is None:
+            # 并发的首个请求失败后已删除登记，按首次请求重新登记
+            return self.begin(db, user_id, scope, key, fingerprint)
+
+        if _as_utc(record.expires_at) <= now:
+            # 过期记录按新请求处理
+            self._restart(db, record, fingerprint, now)
+            return None
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyMismatchError(key)
+        if record.status_code is not None:
+            return StoredResponse(record.status_code, record.response_body or b"")
+        if _as_utc(record.created_at) <= now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT):
+            self._restart(db, record, fingerprint, now)
+            return None
+        raise IdempotencyInProgressError(key)
+
+    def complete(self, db: Session, user_id: int, scope: str, key: str, status_code: int, body: bytes) -> None:
+        """保存首个请求的响应"""
+        record = self._get(db, user_id, scope, key)
+        if record is None:
+            return
+        record.status_code = status_code
+        record.response_body = body
+        db.commit()
+
+    def release(self, db: Session, user_id: int, scope: str, key: str) -> None:
+        """首个请求失败时删除登记，允许用同一个键重试"""
+        try:
+            db.rollback()
+            db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.user_id == user_id,
+                IdempotencyRecord.scope == scope,
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code.is_(None)
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"释放幂等键失败: {str(e)}")
+
+    def _get(self, db: Session, user_id: int, scope: str, key: str) -> Optional[IdempotencyRecord]:
+        return db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.user_id == user_id,
+            IdempotencyRecord.scope == scope,
+            IdempotencyRecord.key == key
+        ).first()
+
+    def _restart(self, db: Session, record: IdempotencyRecord, fingerprint: str, now: datetime) -> None:
+        """接管过期或中断的登记，按登记时间条件更新，并发的重试只有一个能接管"""
+        updated = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.id == record.id,
+            IdempotencyRecord.created_at == record.created_at
+        ).update({
+            IdempotencyRecord.fingerprint: fingerprint,
+            IdempotencyRecord.status_code: None,
+            IdempotencyRecord.response_body: None,
+            IdempotencyRecord.created_at: now,
+            IdempotencyRecord.expires_at: now + timedelta(seconds=IDEMPOTENCY_TTL),
+        }, synchronize_session=False)
+        db.commit()
+        if not updated:
+            raise IdempotencyInProgressError(record.key)
+
+    def _purge_expired(self, db: Session) -> None:
+        """按间隔删除过期记录"""
+        if time.monotonic() - IdempotencyService._last_purge < IDEMPOTENCY_PURGE_INTERVAL:
+            return
+        IdempotencyService._last_purge = time.monotonic()
+        db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.expires_at <= datetime.now(timezone.utc)
+        ).delete(synchronize_session=False)
+        db.commit()
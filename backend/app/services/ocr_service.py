@@ -5,7 +5,18 @@ OCR服务
 """
 
 import asyncio
-from typing import NamedTuple
+import re
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from app.core.tracing import traced
+
+# PDF页对象标记(不匹配页树节点/Pages)
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?!s)")
+
+# 每识别完一页后的回调: (已完成页数, 总页数)
+PageCallback = Callable[[int, int], Awaitable[None]]
 
 
 class OCRResult(NamedTuple):
@@ -14,16 +25,10 @@ class OCRResult(NamedTuple):
     confidence: float
 
 
-class OCRService:
-    """OCR服务类"""
-    
-    async def process_file(self, file_path: str) -> OCRResult:
-        """处理文件OCR识别"""
-        # 模拟OCR处理
-        await asyncio.sleep(2)  # 模拟处理时间
-        
-        # 模拟OCR结果
-        mock_text = """
+class _RecognitionEngine:
+    """识别引擎(模拟)，模型在首次使用或预热时加载一次，各请求共享"""
+
+    text = """
         保险理赔申请书
         
         申请人：张三
@@ -42,5 +47,53 @@ class OCRService:
         
         总计损失：5000元
         """
+
+    async def recognize_page(self, page: int, pages: int) -> None:
+        # 模拟OCR处理
+        await asyncio.sleep(2 / pages)  # 模拟处理时间
+
+    def result(self) -> OCRResult:
+        # 模拟OCR结果
+        return OCRResult(text=self.text.strip(), confidence=0.95)
+
+
+_engine: Optional[_RecognitionEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> _RecognitionEngine:
+    """加载并缓存识别引擎"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _RecognitionEngine()
+    return _engine
+
+
+class OCRService:
+    """OCR服务类"""
+    
+    @staticmethod
+    def warm_up() -> None:
+        """提前加载识别引擎，避免首个OCR任务承担模型加载耗时"""
+        get_engine()
+    
+    @staticmethod
+    def count_pages(filename: str, content: bytes) -> int:
+        """文件页数(PDF按页对象计数，图片为1页)"""
+        if Path(filename).suffix.lower() != ".pdf":
+            return 1
+        return max(len(PDF_PAGE_PATTERN.findall(content)), 1)
+
+    @traced("OCRService.process_file")
+    async def process_file(self, filename: str, content: bytes, on_page: Optional[PageCallback] = None) -> OCRResult:
+        """处理文件OCR识别，逐页识别并通过on_page报告进度"""
+        engine = get_engine()
+        pages = self.count_pages(filename, content)
+        for page in range(1, pages + 1):
+            await engine.recognize_page(page, pages)
+            if on_page is not None:
+                await on_page(page, pages)
         
-        return OCRResult(text=mock_text.strip(), confidence=0.95) 
\ No newline at end of file
+        return engine.result()
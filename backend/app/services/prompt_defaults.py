@@ -0,0 +1,147 @@
+"""
+默认提示词
+
+系统内置的章节提示词，首次解析提示词时作为各章节的第1版写入数据库。
+占位符：{context}上下文、{facts}已知事实、{references}参考资料、{chapter_title}章节名称
+"""
+
+DEFAULT_PROMPTS = [
+    {
+        "chapter_type": "accident_details",
+        "insurance_type": "default",
+        "content": """请根据以下信息生成事故经过及索赔章节：
+
+上下文信息：
+{context}
+
+请包括以下要点：
+1. 事故发生的时间、地点、经过
+2. 当事人信息
+3. 损失情况概述
+4. 索赔申请情况
+
+要求：
+- 语言专业、客观
+- 逻辑清晰、条理分明
+- 篇幅适中（300-500字）
+"""
+    },
+    {
+        "chapter_type": "accident_details",
+        "insurance_type": "车险",
+        "content": """请根据以下信息生成车险事故经过及索赔章节：
+
+上下文信息：
+{context}
+
+请重点描述：
+1. 交通事故发生经过
+2. 车辆损坏情况
+3. 人员伤亡情况（如有）
+4. 交警处理情况
+5. 保险报案及理赔申请
+
+格式要求：
+- 时间线清晰
+- 责任认定明确
+- 损失描述详细
+"""
+    },
+    {
+        "chapter_type": "policy_summary",
+        "insurance_type": "default",
+        "content": """请根据以下信息生成保单内容摘要章节：
+
+上下文信息：
+{context}
+
+请包括以下要点：
+1. 保险单号、被保险人、保险期间
+2. 保险标的及保险金额
+3. 承保险种及免赔约定
+4. 与本次事故相关的条款要点
+
+要求：
+- 以保单原文为准，不做推测
+- 金额、日期准确
+"""
+    },
+    {
+        "chapter_type": "site_investigation",
+        "insurance_type": "default",
+        "content": """请根据以下信息生成现场查勘情况章节：
+
+上下文信息：
+{context}
+
+请详细描述：
+1. 查勘时间、地点、参与人员
+2. 现场环境和条件
+3. 损失标的查勘情况
+4. 现场拍照和取证
+5. 相关人员询问记录
+
+要求：
+- 客观真实、详实准确
+- 重点突出、条理清晰
+- 为后续定损提供依据
+"""
+    },
+    {
+        "chapter_type": "cause_analysis",
+        "insurance_type": "default",
+        "content": """请根据以下信息生成事故原因分析章节：
+
+上下文信息：
+{context}
+
+请分析：
+1. 事故直接原因
+2. 人为、环境、设备等间接因素
+3. 责任认定情况
+4. 是否属于保险责任范围
+
+要求：
+- 论据充分，引用查勘事实
+- 结论明确
+"""
+    },
+    {
+        "chapter_type": "loss_assessment",
+        "insurance_type": "default",
+        "content": """请根据以下信息生成损失核定章节：
+
+上下文信息：
+{context}
+
+请包括：
+1. 核损时间、地点、人员
+2. 损失项目明细及费用
+3. 费用汇总
+4. 免赔额扣除及赔偿计算
+
+要求：
+- 金额计算准确，列明计算过程
+- 费用标准有据可查
+"""
+    },
+    {
+        "chapter_type": "conclusion",
+        "insurance_type": "default",
+        "content": """请根据以下信息生成公估结论章节：
+
+上下文信息：
+{context}
+
+请包括：
+1. 事故性质及保险责任认定
+2. 损失金额确认
+3. 赔偿金额及理赔建议
+4. 结案条件
+
+要求：
+- 与前文章节保持一致
+- 用语规范、结论明确
+"""
+    },
+]
@@ -0,0 +1,324 @@
+"""
+提示词服务
+
+按章节类型和保险类型管理版本化的提示词，预编译为文本片段与占位符，
+当前生效版本缓存在进程内并定期从数据库热加载
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.config import SessionLocal
+from app.db.models import PromptTemplate
+from app.services.generation_log_service import GenerationLogService, GenerationTotals
+from app.services.prompt_defaults import DEFAULT_PROMPTS
+from app.services.template_service import CompiledTemplate, compile_template
+
+# 热加载间隔：本进程的修改立即生效，其他进程的修改在该间隔后生效
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "30"))
+
+# 新增版本时版本号冲突(其他请求同时新增)的重试次数
+PROMPT_VERSION_RETRIES = 3
+
+# 通用提示词对应的保险类型
+DEFAULT_INSURANCE_TYPE = "default"
+
+CHAPTER_TITLES = {
+    "accident_details": "事故经过及索赔",
+    "policy_summary": "保单内容摘要",
+    "site_investigation": "现场查勘情况",
+    "cause_analysis": "事故原因分析",
+    "loss_assessment": "损失核定",
+    "conclusion": "公估结论",
+}
+
+
+class ActivePrompt(NamedTuple):
+    """当前生效的提示词版本"""
+    id: int
+    chapter_type: str
+    insurance_type: str
+    version: int
+    content: str
+    compiled: CompiledTemplate
+
+
+class PromptVersionStats(NamedTuple):
+    """提示词版本的生成统计"""
+    id: int
+    chapter_type: str
+    insurance_type: str
+    version: int
+    is_active: bool
+    generation_count: int
+    avg_prompt_tokens: float
+    avg_completion_tokens: float
+    avg_tokens: float
+    avg_generation_time: float
+
+
+def format_facts(facts: Optional[Mapping[str, str]]) -> str:
+    """已知事实格式化为列表文本"""
+    return "\n".join(f"- {label}：{value}" for label, value in (facts or {}).items())
+
+
+def format_references(passages: Optional[Sequence[str]]) -> str:
+    """参考段落格式化为编号文本"""
+    return "\n\n".join(f"[资料{i}]\n{passage}" for i, passage in enumerate(passages or [], 1))
+
+
+def assemble_prompt(
+    compiled: CompiledTemplate,
+    chapter_type: str,
+    context: Optional[str] = None,
+    facts: Optional[Mapping[str, str]] = None,
+    reference_passages: Optional[Sequence[str]] = None
+) -> str:
+    """
+    按预编译的提示词一次拼接出完整提示
+
+    模板中没有{facts}、{references}占位符时，已知事实和参考资料追加在末尾
+    """
+    fact_text = format_facts(facts)
+    reference_text = format_references(reference_passages)
+    values = {
+        "context": context or "无",
+        "facts": fact_text or "无",
+        "references": reference_text or "无",
+        "chapter_title": CHAPTER_TITLES.get(chapter_type, chapter_type),
+    }
+
+    parts = [compiled.render(values)]
+    if fact_text and "facts" not in compiled.slots:
+        parts.append(f"已知事实：\n{fact_text}")
+    if reference_text and "references" not in compiled.slots:
+        parts.append(f"参考资料：\n{reference_text}")
+    return "\n\n".join(part.strip("\n") for part in parts)
+
+
+class _PromptRegistry:
+    """进程内的生效提示词表"""
+
+    def __init__(self, reload_interval: float):
+        self.reload_interval = reload_interval
+        self._active: Dict[Tuple[str, str], ActivePrompt] = {}
+        # 版本内容不可修改，编译结果按版本ID缓存，热加载时无需重新编译
+        self._compiled: Dict[int, CompiledTemplate] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def _is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reload_interval
+
+    def reload(self, db: Session) -> None:
+        """从数据库加载全部生效版本"""
+        rows = db.query(PromptTemplate).filter(PromptTemplate.is_active.is_(True)).all()
+
+        active: Dict[Tuple[str, str], ActivePrompt] = {}
+        for row in rows:
+            compiled = self._compiled.get(row.id)
+            if compiled is None:
+                compiled = compile_template(row.content)
+            active[(row.chapter_type, row.insurance_type)] = ActivePrompt(
+                id=row.id,
+                chapter_type=row.chapter_type,
+                insurance_type=row.insurance_type,
+                version=row.version,
+                content=row.content,
+                compiled=compiled
+            )
+
+        with self._lock:
+            self._active = active
+            self._compiled = {prompt.id: prompt.compiled for prompt in active.values()}
+            self._loaded_at = time.monotonic()
+
+    def get(self, db: Session, chapter_type: str, insurance_type: Optional[str]) -> Optional[ActivePrompt]:
+        """查找生效版本：优先匹配保险类型，其次使用通用版本"""
+        if self._is_stale():
+            self.reload(db)
+
+        active = self._active
+        if insurance_type:
+            prompt = active.get((chapter_type, insurance_type))
+            if prompt is not None:
+                return prompt
+        return active.get((chapter_type, DEFAULT_INSURANCE_TYPE))
+
+    def insurance_types(self, chapter_type: str) -> List[str]:
+        """章节已配置提示词的保险类型"""
+        return [key[1] for key in self._active if key[0] == chapter_type]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+
+prompt_registry = _PromptRegistry(PROMPT_RELOAD_INTERVAL)
+
+
+class PromptService:
+    """提示词服务类"""
+
+    def ensure_default_prompts(self, db: Session) -> None:
+        """写入内置提示词(已有提示词时跳过)；多个进程同时写入时唯一约束冲突的一方回滚，以先写入的为准"""
+        exists = db.query(PromptTemplate.id).first()
+        if exists:
+            return
+
+        for item in DEFAULT_PROMPTS:
+            db.add(PromptTemplate(
+                chapter_type=item["chapter_type"],
+                insurance_type=item["insurance_type"],
+                version=1,
+                content=item["content"],
+                description="系统内置版本",
+                is_active=True
+            ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        prompt_registry.invalidate()
+
+    def resolve(self, db: Session, chapter_type: str, insurance_type: Optional[str] = None) -> Optional[ActivePrompt]:
+        """获取章节当前生效的提示词"""
+        if not prompt_registry.loaded:
+            self.ensure_default_prompts(db)
+        return prompt_registry.get(db, chapter_type, insurance_type)
+
+    def list_versions(
+        self,
+        db: Session,
+        chapter_type: str,
+        insurance_type: Optional[str] = None
+    ) -> List[PromptTemplate]:
+        """列出章节的全部提示词版本"""
+        query = db.query(PromptTemplate).filter(PromptTemplate.chapter_type == chapter_type)
+        if insurance_type:
+            query = query.filter(PromptTemplate.insurance_type == insurance_type)
+        return query.order_by(
+            PromptTemplate.insurance_type.asc(),
+            PromptTemplate.version.desc()
+        ).all()
+
+    def get_version(self, db: Session, version_id: int) -> Optional[PromptTemplate]:
+        """按ID获取提示词版本"""
+        return db.query(PromptTemplate).filter(PromptTemplate.id == version_id).first()
+
+    def create_version(
+        self,
+        db: Session,
+        chapter_type: str,
+        content: str,
+        insurance_type: Optional[str] = None,
+        description: Optional[str] = None,
+        user_id: Optional[int] = None,
+        activate: bool = True
+    ) -> PromptTemplate:
+        """新增提示词版本，版本号在同一章节和保险类型内递增；版本号被其他请求占用时重新取号，重试仍冲突时抛出IntegrityError"""
+        insurance_type = insurance_type or DEFAULT_INSURANCE_TYPE
+
+        for attempt in range(PROMPT_VERSION_RETRIES):
+            latest = db.query(func.max(PromptTemplate.version)).filter(
+                PromptTemplate.chapter_type == chapter_type,
+                PromptTemplate.insurance_type == insurance_type
+            ).scalar()
+
+            prompt = PromptTemplate(
+                chapter_type=chapter_type,
+                insurance_type=insurance_type,
+                version=(latest or 0) + 1,
+                content=content,
+                description=description,
+                is_active=False,
+                created_by=user_id
+            )
+            db.add(prompt)
+            try:
+                db.flush()
+                break
+            except IntegrityError:
+                db.rollback()
+                if attempt == PROMPT_VERSION_RETRIES - 1:
+                    raise
+
+        if activate:
+            return self.activate_version(db, prompt)
+
+        db.commit()
+        db.refresh(prompt)
+        return prompt
+
+    def activate_version(self, db: Session, prompt: PromptTemplate) -> PromptTemplate:
+        """将指定版本设为生效版本(同一章节和保险类型只有一个生效版本)"""
+        db.query(PromptTemplate).filter(
+            PromptTemplate.chapter_type == prompt.chapter_type,
+            PromptTemplate.insurance_type == prompt.insurance_type,
+            PromptTemplate.id != prompt.id
+        ).update({PromptTemplate.is_active: False}, synchronize_session=False)
+        prompt.is_active = True
+
+        db.commit()
+        db.refresh(prompt)
+        prompt_registry.invalidate()
+        return prompt
+
+    def version_stats(self, db: Session, chapter_type: Optional[str] = None) -> List[PromptVersionStats]:
+        """按提示词版本汇总生成日志的token用量和耗时(包括已归档为月度汇总的日志)"""
+        query = db.query(
+            PromptTemplate.id,
+            PromptTemplate.chapter_type,
+            PromptTemplate.insurance_type,
+            PromptTemplate.version,
+            PromptTemplate.is_active
+        )
+        if chapter_type:
+            query = query.filter(PromptTemplate.chapter_type == chapter_type)
+
+        rows = query.order_by(
+            PromptTemplate.chapter_type.asc(),
+            PromptTemplate.insurance_type.asc(),
+            PromptTemplate.version.desc()
+        ).all()
+        totals = GenerationLogService().prompt_totals(db, [row[0] for row in rows])
+
+        stats = []
+        for row in rows:
+            total = totals.get(row[0], GenerationTotals())
+            count = total.generation_count
+            stats.append(PromptVersionStats(
+                id=row[0],
+                chapter_type=row[1],
+                insurance_type=row[2],
+                version=row[3],
+                is_active=bool(row[4]),
+                generation_count=count,
+                avg_prompt_tokens=total.prompt_tokens / total.prompt_tokens_rows if total.prompt_tokens_rows else 0.0,
+                avg_completion_tokens=(
+                    total.completion_tokens / total.completion_tokens_rows if total.completion_tokens_rows else 0.0
+                ),
+                avg_tokens=total.tokens_used / count if count else 0.0,
+                avg_generation_time=total.generation_time / count if count else 0.0
+            ))
+        return stats
+
+
+def seed_default_prompts() -> None:
+    """启动时写入内置提示词并加载当前生效版本"""
+    db = SessionLocal()
+    try:
+        PromptService().ensure_default_prompts(db)
+        prompt_registry.reload(db)
+    finally:
+        db.close()
@@ -0,0 +1,110 @@
+"""
+报告详情缓存服务
+
+按(报告ID, 版本号)缓存序列化后的ReportResponse JSON。配置Redis时缓存在Redis中由各worker共享，
+否则使用进程内LRU缓存。报告每次更新时版本号在数据库中递增，旧版本的缓存不会再被命中；
+各写入路径在提交后调用invalidate清除该报告的全部缓存
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from app.core.metrics import register_cache
+from app.core.redis import get_redis, redis_configured
+
+# 缓存配置
+REPORT_CACHE_ENABLED = os.getenv("REPORT_CACHE_ENABLED", "true").lower() == "true"
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "3600"))
+# 未配置Redis时进程内缓存的报告数
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+
+# Redis哈希键，字段为版本号，值为序列化后的报告
+REPORT_CACHE_KEY = "report:cache:{report_id}"
+
+
+def report_etag(report_id: int, version: int) -> str:
+    """报告详情的ETag值(不含引号)"""
+    return f"report-{report_id}-v{version}"
+
+
+class ReportCache:
+    """报告详情读穿缓存"""
+
+    def __init__(self, max_size: int = REPORT_CACHE_SIZE, ttl: int = REPORT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[int, Tuple[int, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, report_id: int, version: int) -> Optional[bytes]:
+        """读取指定版本的缓存，未命中或Redis不可用时返回None"""
+        if not REPORT_CACHE_ENABLED:
+            return None
+
+        body = None
+        if redis_configured():
+            try:
+                body = await get_redis(decode_responses=False).hget(
+                    REPORT_CACHE_KEY.format(report_id=report_id), str(version)
+                )
+            except RedisError as e:
+                print(f"读取报告缓存失败: {str(e)}")
+        else:
+            with self._lock:
+                item = self._items.get(report_id)
+                if item is not None and item[0] == version:
+                    self._items.move_to_end(report_id)
+                    body = item[1]
+
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    async def put(self, report_id: int, version: int, body: bytes) -> None:
+        """写入指定版本的缓存"""
+        if not REPORT_CACHE_ENABLED:
+            return
+
+        if redis_configured():
+            key = REPORT_CACHE_KEY.format(report_id=report_id)
+            try:
+                async with get_redis(decode_responses=False).pipeline(transaction=False) as pipe:
+                    pipe.hset(key, str(version), body)
+                    pipe.expire(key, self.ttl)
+                    await pipe.execute()
+            except RedisError as e:
+                print(f"写入报告缓存失败: {str(e)}")
+            return
+
+        with self._lock:
+            current = self._items.get(report_id)
+            # 并发请求可能晚于新版本写入，不用旧版本覆盖
+            if current is not None and current[0] > version:
+                return
+            self._items[report_id] = (version, body)
+            self._items.move_to_end(report_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    async def invalidate(self, report_id: int) -> None:
+        """清除报告的全部缓存版本"""
+        with self._lock:
+            self._items.pop(report_id, None)
+
+        if redis_configured():
+            try:
+                await get_redis(decode_responses=False).delete(REPORT_CACHE_KEY.format(report_id=report_id))
+            except RedisError as e:
+                print(f"清除报告缓存失败: {str(e)}")
+
+
+report_cache = ReportCache()
+register_cache("report", report_cache)
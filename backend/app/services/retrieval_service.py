@@ -0,0 +1,310 @@
+"""
+报告检索服务
+
+将报告关联文件的OCR文本分块并建立BM25索引，
+为章节生成挑选最相关的若干段落，控制提示词规模
+"""
+
+import json
+import math
+import os
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.metrics import register_cache
+from app.db.models import OCRTextChunk, UploadedFile
+from app.services.token_service import count_tokens, split_to_tokens
+from app.utils.text import split_paragraphs, split_sentences, tokenize
+
+# 检索配置
+CHUNK_MAX_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "300"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+RETRIEVAL_MAX_TOKENS = int(os.getenv("RETRIEVAL_MAX_TOKENS", "1500"))
+INDEX_CACHE_SIZE = int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", "256"))
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 各章节的检索关键词，与用户提供的上下文一起组成查询
+CHAPTER_QUERIES = {
+    "accident_details": "事故经过 事故时间 事故地点 报案 索赔 当事人 损失情况",
+    "policy_summary": "保险单号 保单 被保险人 保险期间 保险金额 险种 免赔额 保费",
+    "site_investigation": "现场查勘 查勘时间 查勘地点 现场环境 损失部位 痕迹",
+    "cause_analysis": "事故原因 责任认定 交警 驾驶 违反 分析",
+    "loss_assessment": "损失 核定 维修 更换 费用 金额 总计 元",
+    "conclusion": "赔偿 金额 结论 责任 免赔额 赔款",
+}
+
+
+class RetrievedPassage(NamedTuple):
+    """检索到的段落"""
+    chunk_id: int
+    file_id: int
+    content: str
+    score: float
+    token_count: int
+
+
+class _IndexedChunk(NamedTuple):
+    """索引中的分块"""
+    chunk_id: int
+    file_id: int
+    content: str
+    token_count: int
+    length: int
+
+
+class ReportIndex:
+    """单个报告的内存BM25倒排索引，支持按文件增量增删"""
+
+    def __init__(self):
+        self.chunks: Dict[int, _IndexedChunk] = {}
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.total_length = 0
+        self.max_chunk_id = 0
+
+    def add(self, chunk_id: int, file_id: int, content: str, token_count: int, term_freqs: Dict[str, int]):
+        """加入一个分块"""
+        if chunk_id in self.chunks:
+            return
+        length = sum(term_freqs.values())
+        self.chunks[chunk_id] = _IndexedChunk(chunk_id, file_id, content, token_count, length)
+        for term, tf in term_freqs.items():
+            self.postings[term][chunk_id] = tf
+        self.total_length += length
+        self.max_chunk_id = max(self.max_chunk_id, chunk_id)
+
+    def remove_file(self, file_id: int):
+        """移除某个文件的全部分块"""
+        removed = {cid for cid, chunk in self.chunks.items() if chunk.file_id == file_id}
+        if not removed:
+            return
+        for chunk_id in removed:
+            self.total_length -= self.chunks.pop(chunk_id).length
+        for term in list(self.postings):
+            postings = self.postings[term]
+            for chunk_id in removed & postings.keys():
+                del postings[chunk_id]
+            if not postings:
+                del self.postings[term]
+
+    def signature(self) -> Tuple[int, int]:
+        """索引签名(分块数, 最大分块ID)，用于与数据库校验是否过期"""
+        return len(self.chunks), self.max_chunk_id
+
+    def search(self, query_terms: List[str], top_k: int) -> List[Tuple[int, float]]:
+        """BM25打分，返回(分块ID, 分数)列表"""
+        n = len(self.chunks)
+        if n == 0 or not query_terms:
+            return []
+
+        avgdl = self.total_length / n or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term, qtf in Counter(query_terms).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                length = self.chunks[chunk_id].length
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl))
+                scores[chunk_id] += idf * norm * qtf
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+class _IndexCache:
+    """进程内报告索引LRU缓存"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[int, ReportIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, report_id: int) -> Optional[ReportIndex]:
+        with self._lock:
+            index = self._items.get(report_id)
+            if index is not None:
+                self._items.move_to_end(report_id)
+            return index
+
+    def put(self, report_id: int, index: ReportIndex):
+        with self._lock:
+            self._items[report_id] = index
+            self._items.move_to_end(report_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def discard(self, report_id: int):
+        with self._lock:
+            self._items.pop(report_id, None)
+
+
+_index_cache = _IndexCache(INDEX_CACHE_SIZE)
+register_cache("retrieval_index", _index_cache)
+
+
+def _split_long_line(line: str, max_tokens: int) -> List[str]:
+    """把超过max_tokens的行按句切分并聚合，单句仍超长时按token窗口切分"""
+    pieces: List[str] = []
+    current = ""
+    for sentence in split_sentences(line):
+        if count_tokens(current + sentence) <= max_tokens:
+            current += sentence
+            continue
+        if current:
+            pieces.append(current.strip())
+        if count_tokens(sentence) <= max_tokens:
+            current = sentence
+        else:
+            *windows, current = split_to_tokens(sentence, max_tokens)
+            pieces.extend(window.strip() for window in windows)
+    if current:
+        pieces.append(current.strip())
+    return [piece for piece in pieces if piece]
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[Tuple[str, int]]:
+    """按行聚合文本为不超过max_tokens的分块，超长的行(如无换行的OCR文本)先按句切分，返回(分块文本, token数)列表"""
+    chunks: List[Tuple[str, int]] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for paragraph in split_paragraphs(text):
+        lines = [paragraph] if count_tokens(paragraph) <= max_tokens else _split_long_line(paragraph, max_tokens)
+        for line in lines:
+            line_tokens = count_tokens(line)
+            # 行间换行符按1个token计入
+            if current and current_tokens + 1 + line_tokens > max_tokens:
+                chunks.append(_join_chunk(current))
+                # 保留上一块末行作为重叠，避免跨块信息被截断；重叠会使分块超长时不保留
+                overlap_tokens = count_tokens(current[-1])
+                if overlap_tokens + 1 + line_tokens <= max_tokens:
+                    current, current_tokens = [current[-1]], overlap_tokens
+                else:
+                    current, current_tokens = [], 0
+            current_tokens += line_tokens + (1 if current else 0)
+            current.append(line)
+
+    if current:
+        chunks.append(_join_chunk(current))
+    return chunks
+
+
+def _join_chunk(lines: List[str]) -> Tuple[str, int]:
+    content = "\n".join(lines)
+    return content, count_tokens(content)
+
+
+class RetrievalService:
+    """报告检索服务类"""
+
+    def index_file(self, db: Session, db_file: UploadedFile) -> int:
+        """OCR完成后为文件建立分块索引(不提交事务)，返回分块数"""
+        self.remove_file(db, db_file.id, db_file.report_id)
+
+        if not db_file.ocr_text:
+            return 0
+
+        rows = []
+        for chunk_index, (content, token_count) in enumerate(chunk_text(db_file.ocr_text)):
+            term_freqs = Counter(tokenize(content))
+            if not term_freqs:
+                continue
+            row = OCRTextChunk(
+                file_id=db_file.id,
+                report_id=db_file.report_id,
+                chunk_index=chunk_index,
+                content=content,
+                token_count=token_count,
+                term_freqs=json.dumps(term_freqs, ensure_ascii=False)
+            )
+            db.add(row)
+            rows.append((row, term_freqs))
+
+        db.flush()
+
+        # 增量更新已缓存的报告索引
+        if db_file.report_id is not None:
+            index = _index_cache.get(db_file.report_id)
+            if index is not None:
+                for row, term_freqs in rows:
+                    index.add(row.id, row.file_id, row.content, row.token_count, term_freqs)
+
+        return len(rows)
+
+    def remove_file(self, db: Session, file_id: int, report_id: Optional[int] = None):
+        """删除文件的分块索引(不提交事务)"""
+        db.query(OCRTextChunk).filter(
+            OCRTextChunk.file_id == file_id
+        ).delete(synchronize_session=False)
+
+        if report_id is not None:
+            index = _index_cache.get(report_id)
+            if index is not None:
+                index.remove_file(file_id)
+
+    def _load_index(self, db: Session, report_id: int) -> ReportIndex:
+        """获取报告索引，缓存与数据库不一致时重建"""
+        count, max_id = db.query(
+            func.count(OCRTextChunk.id),
+            func.max(OCRTextChunk.id)
+        ).filter(OCRTextChunk.report_id == report_id).one()
+        signature = (count or 0, max_id or 0)
+
+        index = _index_cache.get(report_id)
+        if index is not None and index.signature() == signature:
+            _index_cache.hits += 1
+            return index
+
+        _index_cache.misses += 1
+        index = ReportIndex()
+        chunks = db.query(
+            OCRTextChunk.id,
+            OCRTextChunk.file_id,
+            OCRTextChunk.content,
+            OCRTextChunk.token_count,
+            OCRTextChunk.term_freqs
+        ).filter(OCRTextChunk.report_id == report_id).all()
+        for chunk_id, file_id, content, token_count, term_freqs in chunks:
+            index.add(chunk_id, file_id, content, token_count, json.loads(term_freqs))
+
+        _index_cache.put(report_id, index)
+        return index
+
+    def retrieve(
+        self,
+        db: Session,
+        report_id: int,
+        chapter_type: str,
+        context: Optional[str] = None,
+        top_k: int = RETRIEVAL_TOP_K,
+        max_tokens: int = RETRIEVAL_MAX_TOKENS
+    ) -> List[RetrievedPassage]:
+        """检索与章节最相关的段落，总token数不超过max_tokens"""
+        query = " ".join(filter(None, [CHAPTER_QUERIES.get(chapter_type, ""), context]))
+        index = self._load_index(db, report_id)
+
+        passages: List[RetrievedPassage] = []
+        used_tokens = 0
+        for chunk_id, score in index.search(tokenize(query), top_k):
+            chunk = index.chunks[chunk_id]
+            if used_tokens + chunk.token_count > max_tokens:
+                continue
+            passages.append(RetrievedPassage(
+                chunk_id=chunk_id,
+                file_id=chunk.file_id,
+                content=chunk.content,
+                score=score,
+                token_count=chunk.token_count
+            ))
+            used_tokens += chunk.token_count
+
+        return passages
@@ -0,0 +1,332 @@
+"""
+全文检索服务
+
+维护报告标题、章节内容和OCR文本的倒排索引，
+写入时按字段增量更新，查询时按词项交集召回并生成高亮摘要
+"""
+
+import html
+import os
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, exists, func, insert, select
+from sqlalchemy.orm import Session, aliased, undefer, undefer_group
+
+from app.db.models import ReportDraft, SearchPosting, UploadedFile
+from app.utils.text import index_terms, tokenize
+
+DOC_TYPE_REPORT = "report"
+DOC_TYPE_FILE = "file"
+
+# 报告的可检索字段
+REPORT_FIELDS = (
+    "title",
+    "accident_details",
+    "policy_summary",
+    "site_investigation",
+    "cause_analysis",
+    "loss_assessment",
+    "conclusion",
+)
+# 文件的可检索字段
+FILE_FIELDS = ("original_filename", "ocr_text")
+
+SNIPPET_RADIUS = int(os.getenv("SEARCH_SNIPPET_RADIUS", "40"))
+MAX_QUERY_TERMS = 32
+# 参与排序的候选文档上限：最稀有词项命中的文档超过该数时只检索其中最新的部分，命中总数为估计值
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "10000"))
+
+
+class SearchHit(NamedTuple):
+    """检索命中"""
+    doc_type: str
+    doc_id: int
+    report_id: Optional[int]
+    title: str
+    field: str
+    snippet: str
+    score: float
+
+
+class SearchResult(NamedTuple):
+    """检索结果"""
+    total: int
+    hits: List[SearchHit]
+    # 候选文档达到上限时total只统计已检索的部分
+    estimated: bool = False
+
+
+def _term_frequencies(text: Optional[str]) -> Counter:
+    """统计字段文本的词频"""
+    return Counter(index_terms(text or ""))
+
+
+def build_snippet(text: str, query: str, terms: List[str], radius: int = SNIPPET_RADIUS) -> Tuple[str, bool]:
+    """
+    截取命中位置附近的文本并用<mark>标记高亮
+
+    优先匹配完整查询串，其次匹配最长的词项。返回(摘要HTML, 是否整串命中)
+    """
+    lowered = text.lower()
+    needle = query.strip().lower()
+    position = lowered.find(needle) if needle else -1
+    exact = position >= 0
+
+    if not exact:
+        for term in sorted(set(terms), key=len, reverse=True):
+            position = lowered.find(term)
+            if position >= 0:
+                needle = term
+                break
+
+    if position < 0:
+        return html.escape(text[: radius * 2]), False
+
+    start = max(0, position - radius)
+    end = min(len(text), position + len(needle) + radius)
+    window = text[start:end]
+
+    # 在窗口内标记所有词项出现位置
+    marks = [False] * len(window)
+    lowered_window = window.lower()
+    for term in [needle, *terms]:
+        offset = lowered_window.find(term)
+        while offset >= 0:
+            for i in range(offset, offset + len(term)):
+                marks[i] = True
+            offset = lowered_window.find(term, offset + 1)
+
+    parts: List[str] = []
+    in_mark = False
+    for char, marked in zip(window, marks):
+        if marked and not in_mark:
+            parts.append("<mark>")
+        elif not marked and in_mark:
+            parts.append("</mark>")
+        in_mark = marked
+        parts.append(html.escape(char))
+    if in_mark:
+        parts.append("</mark>")
+
+    snippet = "".join(parts)
+    if start > 0:
+        snippet = "…" + snippet
+    if end < len(text):
+        snippet += "…"
+    return snippet, exact
+
+
+class SearchService:
+    """全文检索服务类"""
+
+    def index_fields(
+        self,
+        db: Session,
+        doc_type: str,
+        doc_id: int,
+        owner_id: int,
+        fields: Dict[str, Optional[str]]
+    ) -> None:
+        """重建文档指定字段的倒排记录(不提交事务)"""
+        if not fields:
+            return
+
+        db.query(SearchPosting).filter(
+            SearchPosting.doc_type == doc_type,
+            SearchPosting.doc_id == doc_id,
+            SearchPosting.field.in_(list(fields))
+        ).delete(synchronize_session=False)
+
+        rows = [
+            {
+                "term": term,
+                "doc_type": doc_type,
+                "doc_id": doc_id,
+                "field": field,
+                "owner_id": owner_id,
+                "tf": tf,
+            }
+            for field, text in fields.items()
+            for term, tf in _term_frequencies(text).items()
+            if len(term) <= 64
+        ]
+        if rows:
+            db.execute(insert(SearchPosting), rows)
+
+    def index_report(self, db: Session, report: ReportDraft, fields: Optional[List[str]] = None) -> None:
+        """索引报告，fields为空时重建全部字段"""
+        self.index_fields(
+            db,
+            DOC_TYPE_REPORT,
+            report.id,
+            report.owner_id,
+            {field: getattr(report, field) for field in (fields or REPORT_FIELDS)}
+        )
+
+    def index_file(self, db: Session, db_file: UploadedFile) -> None:
+        """索引上传文件的文件名和OCR文本"""
+        self.index_fields(
+            db,
+            DOC_TYPE_FILE,
+            db_file.id,
+            db_file.uploader_id,
+            {field: getattr(db_file, field) for field in FILE_FIELDS}
+        )
+
+    def remove_document(self, db: Session, doc_type: str, doc_id: int) -> None:
+        """删除文档的全部倒排记录(不提交事务)"""
+        db.query(SearchPosting).filter(
+            SearchPosting.doc_type == doc_type,
+            SearchPosting.doc_id == doc_id
+        ).delete(synchronize_session=False)
+
+    def _document_frequency(self, db: Session, conditions: list, term: str, cap: int) -> int:
+        """词项命中的文档数，最多统计到cap(沿索引顺序读取，达到cap即停止)"""
+        documents = select(SearchPosting.doc_type, SearchPosting.doc_id).where(
+            *conditions,
+            SearchPosting.term == term
+        ).distinct().limit(cap).subquery()
+        return db.execute(select(func.count()).select_from(documents)).scalar()
+
+    def search(
+        self,
+        db: Session,
+        owner_id: int,
+        query: str,
+        doc_type: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 20
+    ) -> SearchResult:
+        """
+        检索当前用户的报告和文件，返回命中总数和当前页命中列表
+
+        从命中文档最少的词项取候选文档，再按文档数从少到多逐个词项求交集，
+        查询耗时取决于最稀有词项的文档数而不是常见词项的倒排长度；命中总数与当前页在同一查询中用窗口函数统计
+        """
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return SearchResult(0, [])
+
+        conditions = [SearchPosting.owner_id == owner_id]
+        if doc_type:
+            conditions.append(SearchPosting.doc_type == doc_type)
+
+        frequencies = {term: self._document_frequency(db, conditions, term, SEARCH_MAX_CANDIDATES) for term in terms}
+        ordered = sorted(terms, key=frequencies.get)
+        if frequencies[ordered[0]] == 0:
+            return SearchResult(0, [])
+
+        # 最稀有词项命中的文档为候选(超过上限时取最新的部分)，其余词项逐个过滤
+        candidates = select(SearchPosting.doc_type, SearchPosting.doc_id).where(
+            *conditions,
+            SearchPosting.term == ordered[0]
+        ).distinct().order_by(
+            SearchPosting.doc_type.desc(),
+            SearchPosting.doc_id.desc()
+        ).limit(SEARCH_MAX_CANDIDATES).subquery("candidates")
+        matched = select(candidates.c.doc_type, candidates.c.doc_id)
+        for term in ordered[1:]:
+            posting = aliased(SearchPosting)
+            matched = matched.where(exists().where(
+                posting.owner_id == owner_id,
+                posting.term == term,
+                posting.doc_type == candidates.c.doc_type,
+                posting.doc_id == candidates.c.doc_id
+            ))
+        matched = matched.subquery("matched")
+
+        # 命中文档按词频之和排序
+        score = func.sum(SearchPosting.tf)
+        page = db.execute(
+            select(
+                matched.c.doc_type,
+                matched.c.doc_id,
+                score.label("score"),
+                func.count().over().label("total")
+            ).select_from(matched).join(SearchPosting, and_(
+                SearchPosting.owner_id == owner_id,
+                SearchPosting.term.in_(terms),
+                SearchPosting.doc_type == matched.c.doc_type,
+                SearchPosting.doc_id == matched.c.doc_id
+            )).group_by(
+                matched.c.doc_type,
+                matched.c.doc_id
+            ).order_by(
+                score.desc(),
+                matched.c.doc_id.desc()
+            ).offset(skip).limit(limit)
+        ).all()
+        if page:
+            total = page[0].total
+        elif skip:
+            # 页码超出范围时单独统计命中数
+            total = db.execute(select(func.count()).select_from(matched)).scalar()
+        else:
+            total = 0
+        estimated = frequencies[ordered[0]] >= SEARCH_MAX_CANDIDATES
+        page = [(row.doc_type, row.doc_id, row.score) for row in page]
+
+        report_ids = [doc_id for kind, doc_id, _ in page if kind == DOC_TYPE_REPORT]
+        file_ids = [doc_id for kind, doc_id, _ in page if kind == DOC_TYPE_FILE]
+
+        reports = {
+            report.id: report
+            for report in db.query(ReportDraft).options(undefer_group("content")).filter(
+                ReportDraft.id.in_(report_ids)
+            ).all()
+        } if report_ids else {}
+        files = {
+            db_file.id: db_file
+            for db_file in db.query(UploadedFile).options(undefer(UploadedFile.ocr_text)).filter(
+                UploadedFile.id.in_(file_ids)
+            ).all()
+        } if file_ids else {}
+
+        hits: List[SearchHit] = []
+        for kind, doc_id, score in page:
+            if kind == DOC_TYPE_REPORT and doc_id in reports:
+                doc = reports[doc_id]
+                hit = self._build_hit(kind, doc_id, doc.id, doc.title, doc, REPORT_FIELDS, query, terms, score)
+            elif kind == DOC_TYPE_FILE and doc_id in files:
+                doc = files[doc_id]
+                hit = self._build_hit(kind, doc_id, doc.report_id, doc.original_filename, doc, FILE_FIELDS, query, terms, score)
+            else:
+                continue
+            hits.append(hit)
+
+        return SearchResult(total, hits, estimated)
+
+    def _build_hit(
+        self,
+        doc_type: str,
+        doc_id: int,
+        report_id: Optional[int],
+        title: str,
+        doc,
+        fields: Tuple[str, ...],
+        query: str,
+        terms: List[str],
+        score: float
+    ) -> SearchHit:
+        """选出最佳命中字段并生成高亮摘要"""
+        best_field, best_snippet = fields[0], ""
+        for field in fields:
+            text = getattr(doc, field) or ""
+            if not text:
+                continue
+            snippet, exact = build_snippet(text, query, terms)
+            if "<mark>" in snippet and (exact or not best_snippet):
+                best_field, best_snippet = field, snippet
+                if exact:
+                    break
+
+        return SearchHit(
+            doc_type=doc_type,
+            doc_id=doc_id,
+            report_id=report_id,
+            title=title,
+            field=best_field,
+            snippet=best_snippet,
+            score=float(score)
+        )
@@ -0,0 +1,294 @@
+"""
+用户统计服务
+
+仪表盘需要的报告状态/险种分布、文件OCR状态分布和AI用量按用户保存在UserStatCounter计数器中，
+随写入在同一事务内增量维护，查询只读取该用户的少量计数器，不扫描报告、文件和生成日志：
+  - 报告和文件：会话flush前按新增、删除和状态字段的修改计算增量(导入本模块即注册监听)
+  - AI生成日志：由后写缓冲批量写入时一并累加
+
+计数器上线前已有的数据或出现偏差时，用源表重新计算(在backend目录下)：
+    python -m app.services.stats_service rebuild
+"""
+
+import argparse
+import enum
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.db.config import SessionLocal
+from app.db.models import (
+    AIGenerationLog,
+    AIGenerationStat,
+    InsuranceType,
+    OCRStatus,
+    ReportDraft,
+    ReportStatus,
+    UploadedFile,
+    UserStatCounter
+)
+
+# 字段为空时的计数项后缀
+UNSET_KEY = "unset"
+
+# 计数项名称
+REPORT_STATUS_PREFIX = "reports.status"
+REPORT_INSURANCE_PREFIX = "reports.insurance_type"
+FILE_OCR_PREFIX = "files.ocr_status"
+AI_GENERATION_COUNT = "ai.generation_count"
+AI_TOKENS_USED = "ai.tokens_used"
+AI_PROMPT_TOKENS = "ai.prompt_tokens"
+AI_COMPLETION_TOKENS = "ai.completion_tokens"
+AI_GENERATION_TIME_MS = "ai.generation_time_ms"
+
+# 计数增量：(用户ID, 计数项) -> 增量
+CounterDeltas = Dict[Tuple[int, str], int]
+
+
+class TrackedField(NamedTuple):
+    """按字段值计数的字段，default为新建对象未赋值时的列默认值"""
+    prefix: str
+    attr: str
+    default: Any = None
+
+
+class TrackedModel(NamedTuple):
+    """增量维护计数的模型"""
+    user_attr: str
+    fields: Tuple[TrackedField, ...]
+
+
+TRACKED_MODELS: Dict[type, TrackedModel] = {
+    ReportDraft: TrackedModel("owner_id", (
+        TrackedField(REPORT_STATUS_PREFIX, "status", ReportStatus.DRAFT),
+        TrackedField(REPORT_INSURANCE_PREFIX, "insurance_type"),
+    )),
+    UploadedFile: TrackedModel("uploader_id", (
+        TrackedField(FILE_OCR_PREFIX, "ocr_status", OCRStatus.PENDING),
+    )),
+}
+
+
+class UserStats(NamedTuple):
+    """用户仪表盘统计"""
+    reports_by_status: Dict[str, int]
+    reports_by_insurance_type: Dict[str, int]
+    files_by_ocr_status: Dict[str, int]
+    generation_count: int
+    tokens_used: int
+    prompt_tokens: int
+    completion_tokens: int
+    generation_time: float
+
+
+def counter_name(prefix: str, value: Any) -> str:
+    if isinstance(value, enum.Enum):
+        value = value.value
+    return f"{prefix}.{UNSET_KEY if value is None else value}"
+
+
+def _field_value(state, attr: str, old: bool) -> Any:
+    """字段修改前(old)或修改后的值，未加载时按需加载"""
+    history = state.attrs[attr].history
+    if old:
+        if history.deleted:
+            return history.deleted[0]
+        if history.added:
+            # 修改前为空
+            return None
+    elif history.added:
+        return history.added[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), attr)
+
+
+def _add_object(deltas: CounterDeltas, obj: Any, tracked: TrackedModel, sign: int, old: bool, pending: bool = False) -> None:
+    state = inspect(obj)
+    user_id = _field_value(state, tracked.user_attr, old)
+    if user_id is None:
+        return
+    for field in tracked.fields:
+        value = _field_value(state, field.attr, old)
+        if value is None and pending:
+            value = field.default
+        deltas[(user_id, counter_name(field.prefix, value))] += sign
+
+
+def collect_deltas(session: Session) -> CounterDeltas:
+    """会话中待写入的新增、修改、删除对象对应的计数增量"""
+    deltas: CounterDeltas = defaultdict(int)
+    with session.no_autoflush:
+        for obj in session.new:
+            tracked = TRACKED_MODELS.get(type(obj))
+            if tracked is not None:
+                _add_object(deltas, obj, tracked, 1, old=False, pending=True)
+
+        for obj in session.dirty:
+            tracked = TRACKED_MODELS.get(type(obj))
+            if tracked is None:
+                continue
+            state = inspect(obj)
+            attrs = [tracked.user_attr] + [field.attr for field in tracked.fields]
+            if not any(state.attrs[attr].history.has_changes() for attr in attrs):
+                continue
+            _add_object(deltas, obj, tracked, -1, old=True)
+            _add_object(deltas, obj, tracked, 1, old=False)
+
+        for obj in session.deleted:
+            tracked = TRACKED_MODELS.get(type(obj))
+            if tracked is not None:
+                _add_object(deltas, obj, tracked, -1, old=True)
+    return deltas
+
+
+def generation_deltas(rows: Iterable[Mapping[str, Any]]) -> CounterDeltas:
+    """AI生成日志对应的计数增量"""
+    deltas: CounterDeltas = defaultdict(int)
+    for row in rows:
+        user_id = row.get("user_id")
+        if user_id is None:
+            continue
+        deltas[(user_id, AI_GENERATION_COUNT)] += 1
+        deltas[(user_id, AI_TOKENS_USED)] += row.get("tokens_used") or 0
+        deltas[(user_id, AI_PROMPT_TOKENS)] += row.get("prompt_tokens") or 0
+        deltas[(user_id, AI_COMPLETION_TOKENS)] += row.get("completion_tokens") or 0
+        deltas[(user_id, AI_GENERATION_TIME_MS)] += round((row.get("generation_time") or 0) * 1000)
+    return deltas
+
+
+def increment_counters(connection: Connection, deltas: CounterDeltas) -> None:
+    """在当前事务中累加计数器，按(用户, 计数项)排序加锁避免并发事务死锁"""
+    rows = [
+        {"user_id": user_id, "name": name, "value": value}
+        for (user_id, name), value in sorted(deltas.items())
+        if value
+    ]
+    if not rows:
+        return
+
+    table = UserStatCounter.__table__
+    dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(connection.dialect.name)
+    if dialect is not None:
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.name],
+            set_={"value": table.c.value + statement.excluded.value, "updated_at": func.now()}
+        )
+        connection.execute(statement, rows)
+        return
+
+    for row in rows:
+        updated = connection.execute(
+            table.update()
+            .where(table.c.user_id == row["user_id"], table.c.name == row["name"])
+            .values(value=table.c.value + row["value"])
+        )
+        if not updated.rowcount:
+            connection.execute(table.insert(), row)
+
+
+@event.listens_for(Session, "before_flush")
+def _maintain_counters(session: Session, flush_context, instances) -> None:
+    deltas = collect_deltas(session)
+    if any(deltas.values()):
+        increment_counters(session.connection(), deltas)
+
+
+class StatsService:
+    """用户统计服务类"""
+
+    def get_user_stats(self, db: Session, user_id: int) -> UserStats:
+        """读取用户的统计计数器"""
+        counters = dict(
+            db.query(UserStatCounter.name, UserStatCounter.value).filter(
+                UserStatCounter.user_id == user_id
+            ).all()
+        )
+
+        def breakdown(prefix: str, values: Iterable[enum.Enum], include_unset: bool = False) -> Dict[str, int]:
+            keys = [value.value for value in values] + ([UNSET_KEY] if include_unset else [])
+            return {key: counters.get(f"{prefix}.{key}", 0) for key in keys}
+
+        return UserStats(
+            reports_by_status=breakdown(REPORT_STATUS_PREFIX, ReportStatus),
+            reports_by_insurance_type=breakdown(REPORT_INSURANCE_PREFIX, InsuranceType, include_unset=True),
+            files_by_ocr_status=breakdown(FILE_OCR_PREFIX, OCRStatus),
+            generation_count=counters.get(AI_GENERATION_COUNT, 0),
+            tokens_used=counters.get(AI_TOKENS_USED, 0),
+            prompt_tokens=counters.get(AI_PROMPT_TOKENS, 0),
+            completion_tokens=counters.get(AI_COMPLETION_TOKENS, 0),
+            generation_time=counters.get(AI_GENERATION_TIME_MS, 0) / 1000
+        )
+
+    def rebuild(self, db: Session, user_id: Optional[int] = None) -> int:
+        """按报告、文件、生成日志和月度汇总重新计算计数器(不指定用户时重算全部)，返回计数项数"""
+        counts: CounterDeltas = defaultdict(int)
+
+        for model, tracked in TRACKED_MODELS.items():
+            user_column = getattr(model, tracked.user_attr)
+            for field in tracked.fields:
+                column = getattr(model, field.attr)
+                query = db.query(user_column, column, func.count()).filter(user_column.isnot(None))
+                if user_id is not None:
+                    query = query.filter(user_column == user_id)
+                for owner, value, count in query.group_by(user_column, column):
+                    counts[(owner, counter_name(field.prefix, value))] += count
+
+        log_query = db.query(
+            AIGenerationLog.user_id,
+            func.count(AIGenerationLog.id),
+            func.sum(AIGenerationLog.tokens_used),
+            func.sum(AIGenerationLog.prompt_tokens),
+            func.sum(AIGenerationLog.completion_tokens),
+            func.sum(AIGenerationLog.generation_time)
+        ).filter(AIGenerationLog.user_id.isnot(None))
+        stat_query = db.query(
+            AIGenerationStat.user_id,
+            func.sum(AIGenerationStat.generation_count),
+            func.sum(AIGenerationStat.tokens_used),
+            func.sum(AIGenerationStat.prompt_tokens),
+            func.sum(AIGenerationStat.completion_tokens),
+            func.sum(AIGenerationStat.generation_time)
+        ).filter(AIGenerationStat.user_id.isnot(None))
+        if user_id is not None:
+            log_query = log_query.filter(AIGenerationLog.user_id == user_id)
+            stat_query = stat_query.filter(AIGenerationStat.user_id == user_id)
+        for query, user_column in ((log_query, AIGenerationLog.user_id), (stat_query, AIGenerationStat.user_id)):
+            for owner, count, tokens, prompt, completion, seconds in query.group_by(user_column):
+                counts[(owner, AI_GENERATION_COUNT)] += int(count or 0)
+                counts[(owner, AI_TOKENS_USED)] += int(tokens or 0)
+                counts[(owner, AI_PROMPT_TOKENS)] += int(prompt or 0)
+                counts[(owner, AI_COMPLETION_TOKENS)] += int(completion or 0)
+                counts[(owner, AI_GENERATION_TIME_MS)] += round(float(seconds or 0) * 1000)
+
+        existing = db.query(UserStatCounter)
+        if user_id is not None:
+            existing = existing.filter(UserStatCounter.user_id == user_id)
+        existing.delete(synchronize_session=False)
+        increment_counters(db.connection(), counts)
+        db.commit()
+        return sum(1 for value in counts.values() if value)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="用户统计计数器维护")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="按源表重新计算计数器")
+    rebuild_parser.add_argument("--user-id", type=int, default=None, help="只重算该用户")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        count = StatsService().rebuild(db, args.user_id)
+    finally:
+        db.close()
+    print(f"已重新计算 {count} 个计数项")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+文件存储服务
+
+上传文件的存储抽象，支持本地磁盘和S3兼容对象存储(AWS S3、MinIO等)。
+两种后端都能签发直传凭证：客户端按凭证把文件直接POST到存储(本地后端为带签名的API地址)，
+再通知API登记文件并触发OCR，文件内容不再经过API进程中转
+"""
+
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from app.core.security import SECRET_KEY
+
+# 存储配置
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+LOCAL_STORAGE_ROOT = Path(os.getenv("LOCAL_STORAGE_ROOT", "."))
+# 本地后端直传地址(需客户端可访问)
+LOCAL_UPLOAD_URL = os.getenv("LOCAL_UPLOAD_URL", "/api/v1/files/direct-upload")
+S3_BUCKET = os.getenv("S3_BUCKET", "pila-agent")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+# 服务端访问地址(如http://minio:9000)，为空时使用AWS默认地址
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+# 签发给客户端的直传地址(如http://localhost:9000)，为空时与S3_ENDPOINT_URL相同
+S3_PUBLIC_ENDPOINT_URL = os.getenv("S3_PUBLIC_ENDPOINT_URL") or S3_ENDPOINT_URL
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID") or None
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY") or None
+S3_AUTO_CREATE_BUCKET = os.getenv("S3_AUTO_CREATE_BUCKET", "false").lower() == "true"
+# 直传凭证有效期(秒)
+PRESIGNED_UPLOAD_TTL = int(os.getenv("PRESIGNED_UPLOAD_TTL", "900"))
+
+# 上传文件的对象键前缀，本地后端下即相对LOCAL_STORAGE_ROOT的路径
+UPLOAD_KEY_PREFIX = "uploads/"
+
+
+class PresignedUpload(NamedTuple):
+    """直传凭证：客户端以multipart/form-data把fields和file字段POST到url"""
+    url: str
+    fields: Dict[str, str]
+    expires_in: int
+
+
+class StorageError(Exception):
+    """存储操作失败"""
+
+
+class InvalidUploadSignatureError(Exception):
+    """本地直传签名无效或已过期"""
+
+
+class LocalStorage:
+    """本地磁盘存储"""
+
+    name = "local"
+
+    def __init__(self, root: Path = LOCAL_STORAGE_ROOT):
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise StorageError(f"非法的对象键: {key}")
+        return path
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def _size(self, key: str) -> Optional[int]:
+        path = self._path(key)
+        return path.stat().st_size if path.is_file() else None
+
+    async def save(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        await asyncio.to_thread(self._write, key, data)
+
+    async def read(self, key: str) -> bytes:
+        try:
+            return await asyncio.to_thread(self._path(key).read_bytes)
+        except OSError as e:
+            raise StorageError(f"读取文件失败: {str(e)}")
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._path(key).unlink, True)
+
+    async def size(self, key: str) -> Optional[int]:
+        """对象大小，不存在时为None"""
+        return await asyncio.to_thread(self._size, key)
+
+    @staticmethod
+    def _signature(key: str, expires: int, max_size: int) -> str:
+        message = f"{key}:{expires}:{max_size}".encode("utf-8")
+        return hmac.new(SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+    def presign_upload(self, key: str, content_type: str, max_size: int) -> PresignedUpload:
+        expires = int(time.time()) + PRESIGNED_UPLOAD_TTL
+        return PresignedUpload(
+            url=LOCAL_UPLOAD_URL,
+            fields={
+                "key": key,
+                "Content-Type": content_type,
+                "expires": str(expires),
+                "max_size": str(max_size),
+                "signature": self._signature(key, expires, max_size),
+            },
+            expires_in=PRESIGNED_UPLOAD_TTL
+        )
+
+    def verify_upload(self, key: str, expires: int, max_size: int, signature: str) -> None:
+        """校验本地直传签名"""
+        if expires < time.time():
+            raise InvalidUploadSignatureError("上传凭证已过期")
+        if not hmac.compare_digest(self._signature(key, expires, max_size), signature):
+            raise InvalidUploadSignatureError("上传凭证无效")
+
+
+class S3Storage:
+    """S3兼容对象存储(boto3同步客户端在线程中调用)"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET):
+        import boto3
+        from botocore.config import Config
+
+        self.bucket = bucket
+        options = dict(
+            region_name=S3_REGION,
+            aws_access_key_id=S3_ACCESS_KEY_ID,
+            aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path"})
+        )
+        self.client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, **options)
+        self.presign_client = (
+            boto3.client("s3", endpoint_url=S3_PUBLIC_ENDPOINT_URL, **options)
+            if S3_PUBLIC_ENDPOINT_URL != S3_ENDPOINT_URL else self.client
+        )
+
+    async def _call(self, method: str, **kwargs):
+        from botocore.exceptions import BotoCoreError, ClientError
+        try:
+            return await asyncio.to_thread(getattr(self.client, method), Bucket=self.bucket, **kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(kwargs.get("Key"))
+            raise StorageError(str(e))
+        except BotoCoreError as e:
+            raise StorageError(str(e))
+
+    async def ensure_bucket(self) -> None:
+        """存储桶不存在时创建(用于MinIO等本地环境)"""
+        try:
+            await self._call("head_bucket")
+        except (FileNotFoundError, StorageError):
+            await self._call("create_bucket")
+
+    async def save(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        extra = {"ContentType": content_type} if content_type else {}
+        await self._call("put_object", Key=key, Body=data, **extra)
+
+    async def read(self, key: str) -> bytes:
+        try:
+            response = await self._call("get_object", Key=key)
+        except FileNotFoundError:
+            raise StorageError(f"文件不存在: {key}")
+        return await asyncio.to_thread(response["Body"].read)
+
+    async def delete(self, key: str) -> None:
+        await self._call("delete_object", Key=key)
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            response = await self._call("head_object", Key=key)
+        except FileNotFoundError:
+            return None
+        return response["ContentLength"]
+
+    def presign_upload(self, key: str, content_type: str, max_size: int) -> PresignedUpload:
+        post = self.presign_client.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, max_size],
+            ],
+            ExpiresIn=PRESIGNED_UPLOAD_TTL
+        )
+        return PresignedUpload(url=post["url"], fields=post["fields"], expires_in=PRESIGNED_UPLOAD_TTL)
+
+
+_storage = None
+
+
+def get_storage():
+    """按STORAGE_BACKEND返回进程内共享的存储后端"""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "s3":
+            _storage = S3Storage()
+        elif STORAGE_BACKEND == "local":
+            _storage = LocalStorage()
+        else:
+            raise StorageError(f"未知的存储后端: {STORAGE_BACKEND}")
+    return _storage
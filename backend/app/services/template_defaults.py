@@ -0,0 +1,75 @@
+"""
+默认报告模板
+
+系统内置的章节模板，首次访问模板列表时写入数据库
+"""
+
+DEFAULT_TEMPLATES = [
+    {
+        "type": "accident_details",
+        "title": "车辆事故经过模板",
+        "content": """根据现场勘查和当事人陈述，事故发生经过如下：
+
+1. 事故发生时间：{事故时间}
+2. 事故发生地点：{事故地点}
+3. 天气条件：{天气情况}
+4. 道路状况：{道路状况}
+5. 事故经过：{详细经过}
+
+当事人陈述：
+- 投保人陈述：{投保人陈述}
+- 第三方陈述：{第三方陈述}
+
+证据材料：
+- 现场照片：{照片数量}张
+- 交警认定书：{是否有}
+- 其他证据：{其他证据}"""
+    },
+    {
+        "type": "loss_assessment",
+        "title": "财产损失核定模板", 
+        "content": """根据现场查勘和相关资料，损失核定情况如下：
+
+一、受损财产清单
+{财产清单}
+
+二、损失程度评估
+1. 完全损毁：{完全损毁项目}
+2. 部分损坏：{部分损坏项目}
+3. 可修复项目：{可修复项目}
+
+三、损失金额核定
+1. 直接损失：￥{直接损失金额}
+2. 间接损失：￥{间接损失金额}
+3. 合计损失：￥{总损失金额}
+
+四、核定依据
+- 市场价格调研：{价格依据}
+- 专业评估报告：{评估报告}
+- 维修报价单：{维修报价}"""
+    },
+    {
+        "type": "conclusion",
+        "title": "公估结论标准模板",
+        "content": """综合本次事故的调查情况，现作出如下公估结论：
+
+一、事故责任认定
+{责任认定结果}
+
+二、保险责任分析
+1. 保险标的：{保险标的}
+2. 承保风险：{承保风险}
+3. 免责条款：{免责条款分析}
+4. 责任结论：{责任结论}
+
+三、损失核定结论
+1. 认定损失：￥{认定损失}
+2. 免赔额：￥{免赔额}
+3. 赔偿金额：￥{赔偿金额}
+
+四、处理建议
+{处理建议}
+
+以上结论供保险公司理赔参考。"""
+    }
+]
@@ -0,0 +1,234 @@
+"""
+模板填充服务
+
+用OCR抽取的事实和报告字段一次性渲染{占位符}模板，
+仅对无法确定性填充的占位符回退到AI
+"""
+
+import asyncio
+import json
+import os
+from typing import Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db.models import ReportDraft
+from app.services.ai_service import AIService, build_fill_prompt
+from app.services.extraction_service import ExtractionService
+from app.services.template_service import CompiledTemplate
+from app.services.token_service import count_message_tokens
+
+# 批量填充时AI回退的并发数
+AI_FILL_CONCURRENCY = int(os.getenv("AI_FILL_CONCURRENCY", "4"))
+
+# AI回退前的预算校验：(提示词token合计, 调用次数)，超出预算时抛出异常
+BudgetCheck = Callable[[int, int], None]
+
+# 模板占位符与抽取字段名不一致时的别名
+SLOT_ALIASES = {
+    "事故发生时间": "事故时间",
+    "出险时间": "事故时间",
+    "事故发生地点": "事故地点",
+    "出险地点": "事故地点",
+    "保单号": "保险单号",
+    "保单号码": "保险单号",
+    "车牌": "车牌号",
+    "车牌号码": "车牌号",
+    "总损失": "总损失金额",
+    "合计损失": "总损失金额",
+    "认定损失": "总损失金额",
+    "投保人": "被保险人",
+}
+
+# 报告字段对应的占位符
+REPORT_FIELD_SLOTS = {
+    "报告标题": "title",
+    "事故经过及索赔": "accident_details",
+    "保单内容摘要": "policy_summary",
+    "现场查勘情况": "site_investigation",
+    "事故原因分析": "cause_analysis",
+    "损失核定": "loss_assessment",
+    "公估结论": "conclusion",
+}
+
+# 章节正文较长，不作为事实发送给AI
+CHAPTER_SLOTS = frozenset(slot for slot, field in REPORT_FIELD_SLOTS.items() if field != "title")
+
+
+class FillResult(NamedTuple):
+    """填充结果"""
+    content: str
+    filled: Dict[str, str]
+    missing: List[str]
+    ai_filled: List[str]
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+def build_facts(
+    report: Optional[ReportDraft],
+    extracted: Mapping[str, str],
+    overrides: Optional[Mapping[str, str]] = None
+) -> Dict[str, str]:
+    """合并事实来源，优先级：调用方传入 > OCR抽取 > 报告字段"""
+    facts: Dict[str, str] = {}
+    if report is not None:
+        for slot, field in REPORT_FIELD_SLOTS.items():
+            value = getattr(report, field, None)
+            if value:
+                facts[slot] = value
+        if report.insurance_type:
+            facts["保险类型"] = report.insurance_type.value
+    facts.update(extracted)
+    if overrides:
+        facts.update({key: str(value) for key, value in overrides.items() if value is not None})
+    return facts
+
+
+def prompt_facts(facts: Mapping[str, str]) -> Dict[str, str]:
+    """AI回退使用的精简事实：抽取字段和简短的报告字段，不含章节正文"""
+    return {label: value for label, value in facts.items() if label not in CHAPTER_SLOTS}
+
+
+def resolve_slots(slots: Iterable[str], facts: Mapping[str, str]) -> Dict[str, str]:
+    """按占位符名或其别名查找事实值"""
+    values: Dict[str, str] = {}
+    for slot in slots:
+        value = facts.get(slot)
+        if value is None and slot in SLOT_ALIASES:
+            value = facts.get(SLOT_ALIASES[slot])
+        if value is not None and value != "":
+            values[slot] = value
+    return values
+
+
+def fill_compiled(compiled: CompiledTemplate, facts: Mapping[str, str]) -> FillResult:
+    """确定性填充：一次遍历模板片段，返回渲染结果和未填充的占位符"""
+    slot_names = compiled.slot_names
+    values = resolve_slots(slot_names, facts)
+    return FillResult(
+        content=compiled.render(values),
+        filled=values,
+        missing=[slot for slot in slot_names if slot not in values],
+        ai_filled=[]
+    )
+
+
+def estimate_fill_tokens(
+    compiled: CompiledTemplate,
+    result: FillResult,
+    facts: Mapping[str, str],
+    context: Optional[str]
+) -> int:
+    """AI回退实际发送的提示词token数"""
+    return count_message_tokens([build_fill_prompt(result.missing, compiled.render({}), prompt_facts(facts), context)])
+
+
+class TemplateFillService:
+    """模板填充服务类"""
+
+    async def _ai_fill(
+        self,
+        compiled: CompiledTemplate,
+        result: FillResult,
+        facts: Mapping[str, str],
+        context: Optional[str]
+    ) -> FillResult:
+        """对未填充的占位符调用AI补全，事实只发送抽取字段等简短内容"""
+        template_content = compiled.render({})
+        ai_result = await AIService().fill_slots(
+            result.missing,
+            template_content,
+            facts=prompt_facts(facts),
+            context=context
+        )
+        try:
+            suggestions = json.loads(ai_result.content)
+        except ValueError:
+            suggestions = {}
+
+        ai_values = {
+            slot: str(suggestions[slot])
+            for slot in result.missing
+            if suggestions.get(slot) not in (None, "")
+        }
+        values = {**result.filled, **ai_values}
+        return FillResult(
+            content=compiled.render(values),
+            filled=values,
+            missing=[slot for slot in result.missing if slot not in ai_values],
+            ai_filled=list(ai_values),
+            prompt_tokens=ai_result.prompt_tokens,
+            completion_tokens=ai_result.completion_tokens
+        )
+
+    async def fill_report(
+        self,
+        db: Session,
+        compiled: CompiledTemplate,
+        report: ReportDraft,
+        overrides: Optional[Mapping[str, str]] = None,
+        use_ai: bool = False,
+        context: Optional[str] = None,
+        budget_check: Optional[BudgetCheck] = None
+    ) -> FillResult:
+        """为单个报告填充模板"""
+        extracted = ExtractionService().get_report_facts(db, report.id)
+        facts = build_facts(report, extracted, overrides)
+        result = fill_compiled(compiled, facts)
+
+        if use_ai and result.missing:
+            if budget_check is not None:
+                budget_check(estimate_fill_tokens(compiled, result, facts, context), 1)
+            result = await self._ai_fill(compiled, result, facts, context)
+        return result
+
+    async def fill_reports(
+        self,
+        db: Session,
+        compiled: CompiledTemplate,
+        reports: List[ReportDraft],
+        use_ai: bool = False,
+        budget_check: Optional[BudgetCheck] = None
+    ) -> Dict[int, FillResult]:
+        """
+        批量填充：一次查询取全部事实，确定性渲染后仅对缺失项并发调用AI
+
+        单个报告的AI调用失败时保留该报告的确定性填充结果，不影响其他报告，
+        已完成调用的token消耗随结果返回
+        """
+        extracted = ExtractionService().get_facts_for_reports(db, [report.id for report in reports])
+
+        facts_by_report = {
+            report.id: build_facts(report, extracted.get(report.id, {}))
+            for report in reports
+        }
+        results = {
+            report_id: fill_compiled(compiled, facts)
+            for report_id, facts in facts_by_report.items()
+        }
+
+        pending = [report_id for report_id, result in results.items() if result.missing]
+        if use_ai and pending:
+            if budget_check is not None:
+                budget_check(
+                    sum(
+                        estimate_fill_tokens(compiled, results[report_id], facts_by_report[report_id], None)
+                        for report_id in pending
+                    ),
+                    len(pending)
+                )
+            semaphore = asyncio.Semaphore(AI_FILL_CONCURRENCY)
+
+            async def complete(report_id: int) -> None:
+                async with semaphore:
+                    results[report_id] = await self._ai_fill(
+                        compiled, results[report_id], facts_by_report[report_id], None
+                    )
+
+            outcomes = await asyncio.gather(*(complete(report_id) for report_id in pending), return_exceptions=True)
+            for report_id, outcome in zip(pending, outcomes):
+                if isinstance(outcome, Exception):
+                    print(f"模板AI补全失败(报告{report_id}): {str(outcome)}")
+
+        return results
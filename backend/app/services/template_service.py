@@ -0,0 +1,321 @@
+"""
+模板服务
+
+负责报告模板的持久化、{占位符}模板的编译与进程内缓存
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from sqlalchemy import or_, text
+from sqlalchemy.orm import Session
+
+from app.core.metrics import register_cache
+from app.db.config import SessionLocal
+from app.db.models import ReportTemplate
+from app.services.template_defaults import DEFAULT_TEMPLATES
+
+# 缓存配置：本进程更新时立即失效，其他进程的更新在TTL后可见
+TEMPLATE_CACHE_TTL = float(os.getenv("TEMPLATE_CACHE_TTL", "60"))
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "1024"))
+# 多个worker同时启动时串行写入默认模板
+DEFAULT_TEMPLATES_LOCK_KEY = 4702
+
+_PLACEHOLDER_PATTERN = re.compile(r"\{([^{}\n]+)\}")
+
+
+class CompiledTemplate(NamedTuple):
+    """
+    编译后的模板
+
+    literals比slots多一项，渲染时按literals[0] slots[0] literals[1] ... 交替拼接
+    """
+    literals: Tuple[str, ...]
+    slots: Tuple[str, ...]
+
+    @property
+    def slot_names(self) -> List[str]:
+        """去重后的占位符名称(保持出现顺序)"""
+        return list(dict.fromkeys(self.slots))
+
+    def render(self, values: Mapping[str, str], keep_missing: bool = True) -> str:
+        """按值字典渲染，缺失的占位符默认保留原样"""
+        parts = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            value = values.get(slot)
+            if value is None:
+                value = "{" + slot + "}" if keep_missing else ""
+            parts.append(str(value))
+            parts.append(literal)
+        return "".join(parts)
+
+
+class CachedTemplate(NamedTuple):
+    """缓存的模板"""
+    id: int
+    version: int
+    is_default: bool
+    created_by: Optional[int]
+    data: dict
+    compiled: CompiledTemplate
+    cached_at: float
+
+
+def compile_template(content: str) -> CompiledTemplate:
+    """将{占位符}模板解析为文本片段与占位符列表"""
+    literals: List[str] = []
+    slots: List[str] = []
+    position = 0
+    for match in _PLACEHOLDER_PATTERN.finditer(content or ""):
+        literals.append(content[position:match.start()])
+        slots.append(match.group(1).strip())
+        position = match.end()
+    literals.append((content or "")[position:])
+    return CompiledTemplate(literals=tuple(literals), slots=tuple(slots))
+
+
+def dump_structure(compiled: CompiledTemplate) -> str:
+    """编译结果序列化为模板结构JSON"""
+    return json.dumps(
+        {"literals": list(compiled.literals), "slots": list(compiled.slots)},
+        ensure_ascii=False
+    )
+
+
+def load_structure(structure: Optional[str], content: Optional[str]) -> CompiledTemplate:
+    """从模板结构JSON恢复编译结果，结构缺失或损坏时重新编译"""
+    try:
+        data = json.loads(structure or "")
+        literals, slots = tuple(data["literals"]), tuple(data["slots"])
+        if len(literals) == len(slots) + 1:
+            return CompiledTemplate(literals=literals, slots=slots)
+    except (ValueError, KeyError, TypeError):
+        pass
+    return compile_template(content or "")
+
+
+def serialize_template(template: ReportTemplate, compiled: Optional[CompiledTemplate] = None) -> dict:
+    """模板转换为API响应格式"""
+    compiled = compiled or load_structure(template.template_structure, template.content)
+    return {
+        "id": template.id,
+        "type": template.chapter_type,
+        "title": template.name,
+        "description": template.description,
+        "insuranceType": template.insurance_type.value if template.insurance_type else None,
+        "content": template.content,
+        "slots": compiled.slot_names,
+        "version": template.version,
+        "isDefault": bool(template.is_default),
+        "createdAt": template.created_at.isoformat() if template.created_at else None,
+        "updatedAt": (template.updated_at or template.created_at).isoformat()
+        if (template.updated_at or template.created_at) else None,
+    }
+
+
+class _TemplateCache:
+    """进程内模板缓存"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: Dict[int, CachedTemplate] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_id: int) -> Optional[CachedTemplate]:
+        cached = self._items.get(template_id)
+        if cached is not None and time.monotonic() - cached.cached_at < self.ttl:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        return None
+
+    def put(self, template: ReportTemplate, compiled: CompiledTemplate) -> CachedTemplate:
+        cached = CachedTemplate(
+            id=template.id,
+            version=template.version,
+            is_default=bool(template.is_default),
+            created_by=template.created_by,
+            data=serialize_template(template, compiled),
+            compiled=compiled,
+            cached_at=time.monotonic()
+        )
+        with self._lock:
+            if len(self._items) >= self.max_size and template.id not in self._items:
+                # 淘汰最早缓存的一项
+                oldest = min(self._items.values(), key=lambda item: item.cached_at)
+                self._items.pop(oldest.id, None)
+            self._items[template.id] = cached
+        return cached
+
+    def invalidate(self, template_id: int) -> None:
+        with self._lock:
+            self._items.pop(template_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+template_cache = _TemplateCache(TEMPLATE_CACHE_SIZE, TEMPLATE_CACHE_TTL)
+register_cache("template", template_cache)
+
+
+class TemplateService:
+    """模板服务类"""
+
+    def ensure_default_templates(self, db: Session) -> None:
+        """写入缺少的系统默认模板(按章节类型和名称判断)；Postgres中持有事务级咨询锁，多个进程同时写入时不会重复"""
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": DEFAULT_TEMPLATES_LOCK_KEY})
+
+        existing = set(
+            db.query(ReportTemplate.chapter_type, ReportTemplate.name).filter(
+                ReportTemplate.is_default.is_(True)
+            ).all()
+        )
+        for item in DEFAULT_TEMPLATES:
+            if (item["type"], item["title"]) in existing:
+                continue
+            compiled = compile_template(item["content"])
+            db.add(ReportTemplate(
+                name=item["title"],
+                chapter_type=item["type"],
+                content=item["content"],
+                template_structure=dump_structure(compiled),
+                is_default=True,
+                is_active=True,
+                created_by=None
+            ))
+        db.commit()
+
+    def _visible_query(self, db: Session, user_id: int):
+        """当前用户可见的模板：系统默认模板和自己创建的模板"""
+        return db.query(ReportTemplate).filter(
+            ReportTemplate.is_active.is_(True),
+            or_(ReportTemplate.is_default.is_(True), ReportTemplate.created_by == user_id)
+        )
+
+    def list_templates(
+        self,
+        db: Session,
+        user_id: int,
+        chapter_type: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> Tuple[int, List[dict]]:
+        """分页获取模板列表"""
+        query = self._visible_query(db, user_id)
+        if chapter_type:
+            query = query.filter(ReportTemplate.chapter_type == chapter_type)
+
+        total = query.count()
+        templates = query.order_by(
+            ReportTemplate.is_default.desc(),
+            ReportTemplate.id.asc()
+        ).offset(skip).limit(limit).all()
+
+        items = []
+        for template in templates:
+            cached = template_cache.get(template.id)
+            if cached is None or cached.version != template.version:
+                cached = template_cache.put(
+                    template,
+                    load_structure(template.template_structure, template.content)
+                )
+            items.append(cached.data)
+        return total, items
+
+    def get_cached(self, db: Session, template_id: int, user_id: int) -> Optional[CachedTemplate]:
+        """获取编译后的模板，缓存命中时不访问数据库"""
+        cached = template_cache.get(template_id)
+        if cached is not None:
+            if cached.is_default or cached.created_by == user_id:
+                return cached
+            return None
+
+        template = self._visible_query(db, user_id).filter(ReportTemplate.id == template_id).first()
+        if not template:
+            return None
+
+        return template_cache.put(
+            template,
+            load_structure(template.template_structure, template.content)
+        )
+
+    def create_template(
+        self,
+        db: Session,
+        user_id: int,
+        chapter_type: str,
+        title: str,
+        content: str,
+        description: Optional[str] = None,
+        insurance_type=None
+    ) -> ReportTemplate:
+        """创建模板并预编译"""
+        compiled = compile_template(content)
+        template = ReportTemplate(
+            name=title,
+            description=description,
+            insurance_type=insurance_type,
+            chapter_type=chapter_type,
+            content=content,
+            template_structure=dump_structure(compiled),
+            version=1,
+            is_default=False,
+            is_active=True,
+            created_by=user_id
+        )
+        db.add(template)
+        db.commit()
+        db.refresh(template)
+        return template
+
+    def get_editable(self, db: Session, template_id: int, user_id: int) -> Optional[ReportTemplate]:
+        """获取当前用户自己创建的模板和默认模板，默认模板的修改权限由调用方校验"""
+        return self._visible_query(db, user_id).filter(ReportTemplate.id == template_id).first()
+
+    def update_template(self, db: Session, template: ReportTemplate, changes: dict) -> ReportTemplate:
+        """更新模板，内容变化时重新编译，并使缓存失效"""
+        field_map = {
+            "type": "chapter_type",
+            "title": "name",
+            "description": "description",
+            "insurance_type": "insurance_type",
+            "content": "content",
+        }
+        for key, value in changes.items():
+            if key in field_map:
+                setattr(template, field_map[key], value)
+
+        if "content" in changes:
+            template.template_structure = dump_structure(compile_template(template.content))
+        template.version = (template.version or 1) + 1
+
+        db.commit()
+        db.refresh(template)
+        template_cache.invalidate(template.id)
+        return template
+
+    def delete_template(self, db: Session, template: ReportTemplate) -> None:
+        """停用模板(软删除)并使缓存失效"""
+        template.is_active = False
+        template.version = (template.version or 1) + 1
+        db.commit()
+        template_cache.invalidate(template.id)
+
+
+def seed_default_templates() -> None:
+    """启动时写入系统默认模板"""
+    db = SessionLocal()
+    try:
+        TemplateService().ensure_default_templates(db)
+    finally:
+        db.close()
@@ -0,0 +1,150 @@
+"""
+Token计数服务
+
+基于本地缓存的tokenizer统计提示词与生成内容的真实token数
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# tokenizer配置
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+# tiktoken从该目录读取BPE文件，避免每个进程启动时联网下载(镜像构建时已下载到TIKTOKEN_CACHE_DIR)
+TOKENIZER_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR") or os.getenv("TOKENIZER_CACHE_DIR", "/tmp/tiktoken_cache")
+os.environ["TIKTOKEN_CACHE_DIR"] = TOKENIZER_CACHE_DIR
+# 加载失败后重新尝试的间隔(秒)，期间使用近似估算
+TOKENIZER_RETRY_INTERVAL = float(os.getenv("TOKENIZER_RETRY_INTERVAL", "60"))
+
+# 每条聊天消息的固定开销(角色标记等)
+TOKENS_PER_MESSAGE = 4
+
+# tokenizer不可用时的近似估算规则
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9]+")
+# 英文等ASCII文本平均每个token约4个字符
+_CHARS_PER_TOKEN = 4
+
+# 已加载的编码；加载失败只记录时间，超过重试间隔后再次尝试
+_encodings: Dict[str, Any] = {}
+_load_failed_at: Dict[str, float] = {}
+_load_lock = threading.Lock()
+
+
+def _import_encoding(name: str):
+    """导入tiktoken并读取BPE文件，失败时抛出异常"""
+    import tiktoken
+
+    try:
+        return tiktoken.get_encoding(name)
+    except ValueError:
+        # 编码名称可能是模型名
+        return tiktoken.encoding_for_model(name)
+
+
+def _load_encoding(name: str, retry: bool = False):
+    """加载并缓存tokenizer编码，进程内只初始化一次；不可用时返回None并记录警告"""
+    encoding = _encodings.get(name)
+    if encoding is not None:
+        return encoding
+
+    with _load_lock:
+        encoding = _encodings.get(name)
+        if encoding is not None:
+            return encoding
+        failed_at = _load_failed_at.get(name)
+        if not retry and failed_at is not None and time.monotonic() - failed_at < TOKENIZER_RETRY_INTERVAL:
+            return None
+        try:
+            encoding = _import_encoding(name)
+        except Exception as e:
+            _load_failed_at[name] = time.monotonic()
+            print(f"Warning: tokenizer {name} 加载失败，token数改用近似估算: {str(e)}")
+            return None
+        _encodings[name] = encoding
+        _load_failed_at.pop(name, None)
+        return encoding
+
+
+def preload_encoding(encoding_name: str = TOKENIZER_ENCODING) -> None:
+    """提前加载tokenizer(导入tiktoken并读取BPE文件)，不可用时抛出RuntimeError"""
+    if _load_encoding(encoding_name, retry=True) is None:
+        raise RuntimeError(f"tokenizer {encoding_name} 不可用(BPE文件目录: {TOKENIZER_CACHE_DIR})")
+
+
+def _estimate_tokens(text: str) -> int:
+    """近似估算token数：中文字符约1 token/字，英文等ASCII文本约4字符/token"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    words = _WORD_PATTERN.findall(text)
+    word_tokens = sum(-(-len(w) // _CHARS_PER_TOKEN) for w in words)
+    other_count = len(text) - cjk_count - sum(len(w) for w in words)
+    return cjk_count + word_tokens + max(other_count, 0) // _CHARS_PER_TOKEN
+
+
+def count_tokens(text: Optional[str], encoding_name: str = TOKENIZER_ENCODING) -> int:
+    """统计单段文本的token数"""
+    if not text:
+        return 0
+
+    encoding = _load_encoding(encoding_name)
+    if encoding is None:
+        return _estimate_tokens(text)
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(
+    messages: Iterable[str],
+    encoding_name: str = TOKENIZER_ENCODING
+) -> int:
+    """统计聊天消息列表的token数(含每条消息的格式开销)"""
+    total = 3  # 回复起始标记
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + count_tokens(message, encoding_name)
+    return total
+
+
+def truncate_to_tokens(
+    text: str,
+    max_tokens: int,
+    encoding_name: str = TOKENIZER_ENCODING
+) -> str:
+    """将文本截断到不超过max_tokens个token"""
+    if max_tokens <= 0 or not text:
+        return ""
+
+    encoding = _load_encoding(encoding_name)
+    if encoding is None:
+        # 近似截断：按估算比例裁剪字符
+        estimated = _estimate_tokens(text)
+        if estimated <= max_tokens:
+            return text
+        return text[: max(1, len(text) * max_tokens // estimated)]
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def split_to_tokens(
+    text: str,
+    max_tokens: int,
+    encoding_name: str = TOKENIZER_ENCODING
+) -> List[str]:
+    """将文本按顺序切分为每段不超过max_tokens个token的片段"""
+    pieces: List[str] = []
+    rest = text
+    while rest:
+        piece = truncate_to_tokens(rest, max_tokens, encoding_name).rstrip("\ufffd")
+        if not rest.startswith(piece):
+            # 截断位置落在多字节字符中间时解码结果与原文不一致，按字符回退
+            piece = rest[:len(piece)]
+        while len(piece) > 1 and count_tokens(piece, encoding_name) > max_tokens:
+            piece = piece[:-1]
+        piece = piece or rest[:1]
+        pieces.append(piece)
+        rest = rest[len(piece):]
+    return pieces
@@ -0,0 +1,132 @@
+"""
+Token用量与预算服务
+
+按用户/日汇总token用量，并在调用AI前校验每日预算
+"""
+
+import os
+from datetime import date, datetime, timezone
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models import UserTokenUsage
+
+# 每用户每日token预算，0表示不限制
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", "200000"))
+# 单次调用生成内容的最大token数，用于调用前的预算预估
+MAX_COMPLETION_TOKENS = int(os.getenv("MAX_COMPLETION_TOKENS", "2000"))
+
+
+class BudgetExceededError(Exception):
+    """超出每日token预算"""
+
+    def __init__(self, used: int, requested: int, budget: int):
+        self.used = used
+        self.requested = requested
+        self.budget = budget
+        super().__init__(
+            f"今日token预算不足: 已用{used}, 本次预计{requested}, 预算{budget}"
+        )
+
+
+class UsageSummary(NamedTuple):
+    """用量汇总"""
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    request_count: int
+
+
+def utc_today() -> date:
+    """当前UTC日期，用量按UTC自然日汇总"""
+    return datetime.now(timezone.utc).date()
+
+
+class UsageService:
+    """Token用量服务类"""
+
+    def get_daily_usage(self, db: Session, user_id: int, usage_date: Optional[date] = None) -> int:
+        """获取用户某日已用token总数"""
+        usage = db.query(UserTokenUsage.total_tokens).filter(
+            UserTokenUsage.user_id == user_id,
+            UserTokenUsage.usage_date == (usage_date or utc_today())
+        ).first()
+        return usage[0] if usage else 0
+
+    def check_budget(self, db: Session, user_id: int, prompt_tokens: int, calls: int = 1) -> int:
+        """调用前校验预算，prompt_tokens为calls次调用的提示词合计，每次调用按回复上限计入，返回今日剩余额度(不限制时返回-1)"""
+        if DAILY_TOKEN_BUDGET <= 0:
+            return -1
+
+        used = self.get_daily_usage(db, user_id)
+        requested = prompt_tokens + MAX_COMPLETION_TOKENS * calls
+        if used + requested > DAILY_TOKEN_BUDGET:
+            raise BudgetExceededError(used, requested, DAILY_TOKEN_BUDGET)
+
+        return DAILY_TOKEN_BUDGET - used
+
+    def record_usage(
+        self,
+        db: Session,
+        user_id: int,
+        prompt_tokens: int,
+        completion_tokens: int
+    ) -> None:
+        """累加用户当日用量(不提交事务，由调用方统一提交)"""
+        today = utc_today()
+        increments = {
+            UserTokenUsage.prompt_tokens: UserTokenUsage.prompt_tokens + prompt_tokens,
+            UserTokenUsage.completion_tokens: UserTokenUsage.completion_tokens + completion_tokens,
+            UserTokenUsage.total_tokens: UserTokenUsage.total_tokens + prompt_tokens + completion_tokens,
+            UserTokenUsage.request_count: UserTokenUsage.request_count + 1,
+        }
+
+        updated = db.query(UserTokenUsage).filter(
+            UserTokenUsage.user_id == user_id,
+            UserTokenUsage.usage_date == today
+        ).update(increments, synchronize_session=False)
+
+        if updated:
+            return
+
+        # 当日首条记录，并发插入冲突时退回到累加
+        try:
+            with db.begin_nested():
+                db.add(UserTokenUsage(
+                    user_id=user_id,
+                    usage_date=today,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    total_tokens=prompt_tokens + completion_tokens,
+                    request_count=1
+                ))
+        except IntegrityError:
+            db.query(UserTokenUsage).filter(
+                UserTokenUsage.user_id == user_id,
+                UserTokenUsage.usage_date == today
+            ).update(increments, synchronize_session=False)
+
+    def get_usage(
+        self,
+        db: Session,
+        user_id: int,
+        start_date: date,
+        end_date: date
+    ) -> List[UserTokenUsage]:
+        """获取日期区间内的每日用量汇总"""
+        return db.query(UserTokenUsage).filter(
+            UserTokenUsage.user_id == user_id,
+            UserTokenUsage.usage_date >= start_date,
+            UserTokenUsage.usage_date <= end_date
+        ).order_by(UserTokenUsage.usage_date.asc()).all()
+
+    def summarize(self, rows: List[UserTokenUsage]) -> UsageSummary:
+        """汇总多日用量"""
+        return UsageSummary(
+            prompt_tokens=sum(row.prompt_tokens for row in rows),
+            completion_tokens=sum(row.completion_tokens for row in rows),
+            total_tokens=sum(row.total_tokens for row in rows),
+            request_count=sum(row.request_count for row in rows)
+        )
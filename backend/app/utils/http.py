@@ -0,0 +1,118 @@
+"""
+HTTP工具
+
+提供支持Range断点续传和条件请求的文件流式响应
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def content_disposition(filename: str) -> str:
+    """生成兼容中文文件名的Content-Disposition头"""
+    ascii_name = filename.encode("ascii", "ignore").decode() or "download"
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """请求的If-None-Match是否包含该ETag(弱比较)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or f'"{etag}"' in tags
+
+
+def parse_range(header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """解析单区间Range头，返回闭区间(start, end)；多区间等不支持的格式返回None"""
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+
+    start_text, end_text = match.groups()
+    if not start_text and not end_text:
+        return None
+
+    if not start_text:
+        # 后缀区间: bytes=-500 表示最后500字节
+        length = int(end_text)
+        if length == 0:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={"Content-Range": f"bytes */{file_size}"}
+            )
+        return max(file_size - length, 0), file_size - 1
+
+    start = int(start_text)
+    end = int(end_text) if end_text else file_size - 1
+    if start >= file_size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    return start, min(end, file_size - 1)
+
+
+def _iter_file(path: Path, start: int, end: int) -> Iterator[bytes]:
+    """按块读取文件的[start, end]区间"""
+    remaining = end - start + 1
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    filename: str,
+    etag: Optional[str] = None
+) -> Response:
+    """流式返回磁盘文件，支持Range和If-None-Match"""
+    file_size = os.stat(path).st_size
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(filename),
+    }
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get("range")
+    # If-Range与当前ETag不一致时返回完整内容
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or not etag or if_range.strip() == f'"{etag}"'):
+        byte_range = parse_range(range_header, file_size)
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_file(path, start, end),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=media_type,
+                headers=headers
+            )
+
+    headers["Content-Length"] = str(file_size)
+    return StreamingResponse(
+        _iter_file(path, 0, file_size - 1),
+        media_type=media_type,
+        headers=headers
+    )
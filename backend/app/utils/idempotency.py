@@ -0,0 +1,90 @@
+"""
+幂等请求
+
+按Idempotency-Key执行接口处理函数：首次请求执行并保存成功的响应，重试时重放保存的响应
+"""
+
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy.orm import Session
+
+from app.core.metrics import IDEMPOTENT_REPLAYS
+from app.services.idempotency_service import (
+    IdempotencyInProgressError,
+    IdempotencyKeyMismatchError,
+    IdempotencyService
+)
+from app.utils.serialization import FastJSONResponse, json_dumps
+
+# 重放的响应带有该响应头
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+@lru_cache(maxsize=32)
+def _adapter(response_model: Any) -> TypeAdapter:
+    return TypeAdapter(response_model)
+
+
+def serialize_response(result: Any, response_model: Any = None) -> Any:
+    """按接口的响应模型校验和过滤结果，输出与FastAPI序列化response_model一致的JSON数据"""
+    if response_model is None:
+        return jsonable_encoder(result)
+    adapter = _adapter(response_model)
+    content = result.model_dump(by_alias=True) if isinstance(result, BaseModel) else result
+    return adapter.dump_python(adapter.validate_python(content, from_attributes=True), mode="json", by_alias=True)
+
+
+async def run_idempotent(
+    db: Session,
+    user_id: int,
+    scope: str,
+    key: Optional[str],
+    fingerprint: str,
+    handler: Callable[[], Awaitable[Any]],
+    response_model: Any = None,
+    status_code: int = status.HTTP_200_OK
+) -> Any:
+    """
+    执行handler；带幂等键时首次请求保存响应，重复的键重放响应，未带键时直接返回handler的结果
+
+    response_model和status_code与接口声明一致，带键和不带键的请求返回相同的响应
+    """
+    if not key:
+        return await handler()
+
+    service = IdempotencyService()
+    try:
+        stored = service.begin(db, user_id, scope, key, fingerprint)
+    except IdempotencyKeyMismatchError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="幂等键已用于内容不同的请求"
+        )
+    except IdempotencyInProgressError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="相同幂等键的请求正在处理中，请稍后重试",
+            headers={"Retry-After": "1"}
+        )
+
+    if stored is not None:
+        IDEMPOTENT_REPLAYS.labels(scope).inc()
+        return FastJSONResponse(
+            stored.body,
+            status_code=stored.status_code,
+            headers={IDEMPOTENT_REPLAYED_HEADER: "true"}
+        )
+
+    try:
+        result = await handler()
+        body = json_dumps(serialize_response(result, response_model))
+    except BaseException:
+        service.release(db, user_id, scope, key)
+        raise
+
+    service.complete(db, user_id, scope, key, status_code, body)
+    return FastJSONResponse(body, status_code=status_code)
@@ -0,0 +1,50 @@
+"""
+快速JSON序列化
+
+用orjson把查询结果行直接编码为JSON字节，跳过ORM对象→Pydantic模型→字典的中间拷贝；
+查询只选取响应模型中的字段对应的列，输出与响应模型序列化结果一致，响应模型仍用于接口文档
+"""
+
+import enum
+from typing import Any, Dict, Iterable, List, Type
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+# 与Pydantic一致：UTC时间输出为Z后缀，非字符串键转为字符串
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def json_dumps(content: Any) -> bytes:
+    """编码为UTF-8 JSON字节"""
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def model_columns(model: Type[BaseModel], entity: Any) -> List[Any]:
+    """响应模型各字段在ORM实体上对应的列，用于只查询需要的列"""
+    return [getattr(entity, name) for name in model.model_fields]
+
+
+def row_to_dict(row: Any) -> Dict[str, Any]:
+    """把按model_columns查询的结果行转为响应字典(枚举取值)"""
+    return {
+        key: value.value if isinstance(value, enum.Enum) else value
+        for key, value in row._mapping.items()
+    }
+
+
+def rows_to_list(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """批量转换结果行"""
+    return [row_to_dict(row) for row in rows]
+
+
+class FastJSONResponse(Response):
+    """orjson编码的JSON响应，content为已编码的bytes时直接输出"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return json_dumps(content)
@@ -0,0 +1,64 @@
+"""
+文本处理工具
+
+提供适用于中英文混排文本的分词与切分功能
+"""
+
+import re
+from typing import List
+
+# 句末标点(连同其后的引号、括号)
+_SENTENCE_END_PATTERN = re.compile(r"[^。！？；!?;]*[。！？；!?;]+[”’」』）)]*|[^。！？；!?;]+$")
+
+# 连续的英文/数字串或连续的中日韩汉字串
+_TERM_PATTERN = re.compile(r"[A-Za-z0-9]+|[㐀-䶿一-鿿豈-﫿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为检索词项
+
+    英文和数字按整词切分并转小写，汉字按二元组(bigram)切分，
+    单个汉字保留为一元词项，无需依赖分词词典即可覆盖中文检索。
+    """
+    if not text:
+        return []
+
+    terms: List[str] = []
+    for match in _TERM_PATTERN.finditer(text):
+        run = match.group()
+        if run.isascii():
+            terms.append(run.lower())
+        elif len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def index_terms(text: str) -> List[str]:
+    """
+    生成用于倒排索引的词项
+
+    在tokenize的基础上额外为每个汉字生成一元词项，
+    使单字查询(如车牌前缀"京")也能命中处于二元组中间的汉字
+    """
+    if not text:
+        return []
+
+    terms = tokenize(text)
+    for match in _TERM_PATTERN.finditer(text):
+        run = match.group()
+        if not run.isascii() and len(run) > 1:
+            terms.extend(run)
+    return terms
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """按行切分文本，去除空行和首尾空白"""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def split_sentences(text: str) -> List[str]:
+    """按句末标点切分文本，标点保留在句尾，各句拼接后与原文一致"""
+    return [match.group() for match in _SENTENCE_END_PATTERN.finditer(text) if match.group()]
@@ -0,0 +1,95 @@
+"""
+压测结果对比
+
+对比两次压测的JSON结果，RPS下降或p95/p99延迟上升超过阈值时以非零状态退出，
+可在部署前的流水线中用于发现性能回退
+
+用法(在backend目录下)：
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# (指标名, 取值路径, 越大越好)
+METRICS = [
+    ("rps", ("rps",), True),
+    ("p50", ("latency_ms", "p50"), False),
+    ("p95", ("latency_ms", "p95"), False),
+    ("p99", ("latency_ms", "p99"), False),
+]
+
+# 参与回退判定的指标
+GATED_METRICS = {"rps", "p95", "p99"}
+
+
+def _value(result: Dict, path: Tuple[str, ...]) -> float:
+    for key in path:
+        result = result[key]
+    return float(result)
+
+
+def _change(base: float, new: float) -> float:
+    """相对变化百分比"""
+    if base == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - base) / base * 100
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> Tuple[List[str], List[str]]:
+    """返回(对比表各行, 回退项)"""
+    lines = [f"{'场景':<10}{'指标':<6}{'基线':>12}{'本次':>12}{'变化':>10}"]
+    regressions = []
+
+    for name, new_result in new["results"].items():
+        base_result = base["results"].get(name)
+        if base_result is None:
+            lines.append(f"{name:<10}(基线中无此场景)")
+            continue
+
+        for metric, path, higher_is_better in METRICS:
+            base_value = _value(base_result, path)
+            new_value = _value(new_result, path)
+            change = _change(base_value, new_value)
+            worse = -change if higher_is_better else change
+
+            flag = ""
+            if metric in GATED_METRICS and worse > threshold:
+                flag = "  <-- 回退"
+                regressions.append(f"{name}.{metric} {change:+.1f}%")
+            lines.append(f"{name:<10}{metric:<6}{base_value:>12.2f}{new_value:>12.2f}{change:>+9.1f}%{flag}")
+
+        if new_result.get("errors", 0) > base_result.get("errors", 0):
+            regressions.append(f"{name}.errors {base_result.get('errors', 0)} -> {new_result['errors']}")
+
+    return lines, regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="对比两次压测结果")
+    parser.add_argument("base", help="基线结果JSON")
+    parser.add_argument("new", help="本次结果JSON")
+    parser.add_argument("--threshold", type=float, default=10.0, help="允许的最大退化百分比")
+    args = parser.parse_args(argv)
+
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+
+    for key in ("concurrency", "requests", "database", "ai_latency_s", "ocr_latency_s"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"注意: 两次运行的{key}不同({base['meta'].get(key)} vs {new['meta'].get(key)})")
+
+    lines, regressions = compare(base, new, args.threshold)
+    print("\n".join(lines))
+
+    if regressions:
+        print(f"\n发现性能回退(阈值{args.threshold}%): " + "，".join(regressions))
+        sys.exit(1)
+    print("\n未发现性能回退")
+
+
+if __name__ == "__main__":
+    main()
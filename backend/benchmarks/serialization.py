@@ -0,0 +1,139 @@
+"""
+报告序列化微基准
+
+对比报告详情的两种序列化路径，并统计典型报告在不同压缩编码下的传输字节数：
+  - pydantic: ORM对象 → ReportResponse.from_orm → jsonable_encoder → json.dumps(原JSONResponse路径)
+  - orjson:   按响应字段查询的结果行 → row_to_dict → orjson
+
+用法(在backend目录下)：
+    python -m benchmarks.serialization --chapter-chars 3000 --iterations 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+# 章节正文按这段样本的字频随机生成(直接重复样本会严重高估压缩效果)
+_SAMPLE_TEXT = (
+    "2024年12月1日上午10时30分许，被保险人驾驶京A12345号小型轿车沿建国路由西向东行驶，"
+    "因跟车距离过近与前方车辆发生追尾碰撞，交警认定被保险人承担全部责任。"
+    "经现场查勘，标的车前保险杠、左前大灯、发动机舱盖受损，第三者车辆后保险杠及行李箱盖变形，"
+    "双方车辆均无人员伤亡。根据保单约定及定损清单，核定标的车损失金额为人民币18,600元。"
+)
+
+CHAPTER_TYPES = [
+    "accident_details",
+    "policy_summary",
+    "site_investigation",
+    "cause_analysis",
+    "loss_assessment",
+    "conclusion",
+]
+
+
+def chapter_text(chars: int, seed: int = 0) -> str:
+    return "".join(random.Random(seed).choices(_SAMPLE_TEXT, k=chars))
+
+
+def measure(func: Callable[[], object], iterations: int) -> float:
+    """平均每次耗时(微秒)"""
+    func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def run(chapter_chars: int, iterations: int) -> List[str]:
+    from fastapi.encoders import jsonable_encoder
+
+    from app.api.v1.reports import REPORT_DETAIL_COLUMNS
+    from app.core.compression import BROTLI_QUALITY, GZIP_LEVEL, brotli, compress
+    from app.db.config import SessionLocal, create_tables
+    from app.db.models import InsuranceType, ReportDraft, User
+    from app.schemas.reports import ReportResponse
+    from app.utils.serialization import json_dumps, row_to_dict
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", is_active=True)
+        db.add(user)
+        db.flush()
+        report = ReportDraft(
+            title="京A12345追尾事故公估报告",
+            insurance_type=InsuranceType.AUTO,
+            owner_id=user.id,
+            updated_at=datetime.utcnow(),
+            **{chapter: chapter_text(chapter_chars, i) for i, chapter in enumerate(CHAPTER_TYPES)}
+        )
+        db.add(report)
+        db.commit()
+        report_id = report.id
+        db.expunge_all()
+
+        def query_orm():
+            db.expire_all()
+            return db.query(ReportDraft).filter(ReportDraft.id == report_id).first()
+
+        def query_row():
+            return db.query(*REPORT_DETAIL_COLUMNS).filter(ReportDraft.id == report_id).first()
+
+        def pydantic_path(obj) -> bytes:
+            content = jsonable_encoder(ReportResponse.from_orm(obj))
+            return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        def orjson_path(row) -> bytes:
+            return json_dumps(row_to_dict(row))
+
+        obj, row = query_orm(), query_row()
+        old_body, new_body = pydantic_path(obj), orjson_path(row)
+        if json.loads(old_body) != json.loads(new_body):
+            raise SystemExit("两种序列化结果不一致")
+
+        timings = [
+            ("pydantic 序列化", measure(lambda: pydantic_path(obj), iterations)),
+            ("orjson 序列化", measure(lambda: orjson_path(row), iterations)),
+            ("pydantic 查询+序列化", measure(lambda: pydantic_path(query_orm()), iterations)),
+            ("orjson 查询+序列化", measure(lambda: orjson_path(query_row()), iterations)),
+        ]
+    finally:
+        db.close()
+
+    lines = [f"报告: 6个章节 x {chapter_chars}字，JSON {len(new_body)}字节", ""]
+    lines.append(f"{'路径':<24}{'耗时(us)':>12}")
+    lines.extend(f"{name:<24}{value:>12.1f}" for name, value in timings)
+
+    lines.extend(["", f"{'编码':<24}{'字节数':>12}{'压缩率':>10}{'耗时(us)':>12}"])
+    lines.append(f"{'identity':<24}{len(new_body):>12}{'100.0%':>10}{0.0:>12.1f}")
+    encodings = [("gzip", f"gzip (level {GZIP_LEVEL})")]
+    if brotli is not None:
+        encodings.append(("br", f"br (quality {BROTLI_QUALITY})"))
+    for encoding, label in encodings:
+        size = len(compress(new_body, encoding))
+        elapsed = measure(lambda: compress(new_body, encoding), max(iterations // 10, 10))
+        lines.append(f"{label:<24}{size:>12}{size / len(new_body):>10.1%}{elapsed:>12.1f}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="报告序列化微基准")
+    parser.add_argument("--chapter-chars", type=int, default=3000, help="每个章节的字数")
+    parser.add_argument("--iterations", type=int, default=2000, help="每项的执行次数")
+    args = parser.parse_args(argv)
+
+    # 使用临时SQLite，不影响开发库
+    workdir = tempfile.mkdtemp(prefix="pila_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}"
+    os.environ.setdefault("ALLOW_INSECURE_SECRET_KEY", "true")
+
+    print("\n".join(run(args.chapter_chars, args.iterations)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+外部服务桩
+
+AI和OCR服务中只有模拟的外部调用耗时(asyncio.sleep)，这里把它替换为可配置的固定耗时，
+其余代码路径(提示词拼接、token统计、字段抽取、索引等)保持不变
+"""
+
+import asyncio
+from typing import Any
+
+
+class _LatencyAsyncio:
+    """代理asyncio模块，仅替换sleep的时长"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(asyncio, name)
+
+    async def sleep(self, delay: float, result: Any = None) -> Any:
+        return await asyncio.sleep(self.latency, result)
+
+
+def install_stubs(ai_latency: float, ocr_latency: float) -> None:
+    """设置AI和OCR服务的模拟耗时(秒)"""
+    from app.services import ai_service, ocr_service
+
+    ai_service.asyncio = _LatencyAsyncio(ai_latency)
+    ocr_service.asyncio = _LatencyAsyncio(ocr_latency)
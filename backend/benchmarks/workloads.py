@@ -0,0 +1,149 @@
+"""
+压测场景
+
+每个场景是一个协程函数，接收客户端、压测上下文和请求序号，发出一个请求并返回响应
+"""
+
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, NamedTuple
+
+import httpx
+
+CHAPTER_TYPES = [
+    "accident_details",
+    "policy_summary",
+    "site_investigation",
+    "cause_analysis",
+    "loss_assessment",
+    "conclusion",
+]
+
+# 1x1像素PNG，足以通过上传接口的类型校验
+_PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+_CHAPTER_TEXT = (
+    "2024年12月1日上午10时30分许，被保险人驾驶京A12345号小型轿车沿建国路由西向东行驶，"
+    "因跟车距离过近与前方车辆发生追尾碰撞，交警认定被保险人承担全部责任。"
+)
+
+
+class BenchContext(NamedTuple):
+    """压测上下文"""
+    headers: Dict[str, str]
+    report_ids: List[int]
+
+    def report_id(self, index: int) -> int:
+        return self.report_ids[index % len(self.report_ids)]
+
+
+Workload = Callable[[httpx.AsyncClient, BenchContext, int], Awaitable[httpx.Response]]
+
+
+async def upload(client: httpx.AsyncClient, ctx: BenchContext, index: int) -> httpx.Response:
+    """上传文件(含OCR、字段抽取和索引)"""
+    return await client.post(
+        "/api/v1/files/upload",
+        params={"report_id": ctx.report_id(index)},
+        files={"file": (f"bench_{index}.png", _PNG_BYTES, "image/png")},
+        headers=ctx.headers
+    )
+
+
+async def list_reports(client: httpx.AsyncClient, ctx: BenchContext, index: int) -> httpx.Response:
+    """报告列表"""
+    return await client.get("/api/v1/reports/", params={"limit": 20}, headers=ctx.headers)
+
+
+async def get_report(client: httpx.AsyncClient, ctx: BenchContext, index: int) -> httpx.Response:
+    """报告详情"""
+    return await client.get(f"/api/v1/reports/{ctx.report_id(index)}", headers=ctx.headers)
+
+
+async def autosave(client: httpx.AsyncClient, ctx: BenchContext, index: int) -> httpx.Response:
+    """章节自动保存"""
+    chapter_type = CHAPTER_TYPES[index % len(CHAPTER_TYPES)]
+    return await client.put(
+        f"/api/v1/reports/{ctx.report_id(index)}/chapters/{chapter_type}",
+        json={"content": f"{_CHAPTER_TEXT}（第{index}次保存）"},
+        headers=ctx.headers
+    )
+
+
+async def generate(client: httpx.AsyncClient, ctx: BenchContext, index: int) -> httpx.Response:
+    """AI章节生成"""
+    return await client.post(
+        f"/api/v1/ai/generate/{ctx.report_id(index)}",
+        json={
+            "chapter_type": CHAPTER_TYPES[index % len(CHAPTER_TYPES)],
+            "context": _CHAPTER_TEXT
+        },
+        headers=ctx.headers
+    )
+
+
+async def chat(client: httpx.AsyncClient, ctx: BenchContext, index: int) -> httpx.Response:
+    """AI对话"""
+    return await client.post(
+        "/api/v1/ai/chat",
+        params={"message": "车险追尾事故的理赔流程是什么？"},
+        headers=ctx.headers
+    )
+
+
+WORKLOADS: Dict[str, Workload] = {
+    "upload": upload,
+    "list": list_reports,
+    "get": get_report,
+    "autosave": autosave,
+    "generate": generate,
+    "chat": chat,
+}
+
+
+def seed(report_count: int) -> BenchContext:
+    """写入压测用户和报告，返回压测上下文
+
+    报告直接写库而不经过创建接口，使各场景只测量自身的接口
+    """
+    from app.core.security import create_access_token, hash_password
+    from app.db.config import SessionLocal, create_tables
+    from app.db.models import InsuranceType, ReportDraft, User
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        suffix = uuid.uuid4().hex[:8]
+        user = User(
+            username=f"bench_{suffix}",
+            email=f"bench_{suffix}@example.com",
+            hashed_password=hash_password(suffix),
+            is_active=True
+        )
+        db.add(user)
+        db.flush()
+
+        now = datetime.utcnow()
+        reports = [
+            ReportDraft(
+                title=f"压测报告{i}",
+                insurance_type=InsuranceType.AUTO,
+                accident_details=_CHAPTER_TEXT,
+                owner_id=user.id,
+                updated_at=now
+            )
+            for i in range(report_count)
+        ]
+        db.add_all(reports)
+        db.commit()
+
+        token, _ = create_access_token(user.id)
+        return BenchContext(
+            headers={"Authorization": f"Bearer {token}"},
+            report_ids=[report.id for report in reports]
+        )
+    finally:
+        db.close()
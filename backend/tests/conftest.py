@@ -0,0 +1,34 @@
+"""
+测试配置
+
+使用临时SQLite数据库，每个测试重建全部表
+"""
+
+import os
+import tempfile
+
+# 导入app模块前设置，数据库引擎和密钥在导入时读取
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pila_test_'), 'test.sqlite')}"
+os.environ.setdefault("ALLOW_INSECURE_SECRET_KEY", "true")
+
+import pytest
+
+from app.db.config import SessionLocal, engine
+from app.db.models import Base, User
+
+
+@pytest.fixture
+def db():
+    """空数据库会话，预置用户1和用户2"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    session.add_all([
+        User(id=1, username="alice", email="alice@example.com", hashed_password="x"),
+        User(id=2, username="bob", email="bob@example.com", hashed_password="x"),
+    ])
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,59 @@
+"""批量导出失败清理测试"""
+
+import asyncio
+
+import pytest
+
+from app.db.models import ExportJob, ExportJobStatus, ReportDraft
+from app.services import batch_export_service
+from app.services.batch_export_service import BatchExportService
+from app.services.export_service import ExportArtifact, ExportService
+
+
+@pytest.fixture
+def job(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_export_service, "BATCH_EXPORT_DIR", tmp_path)
+    monkeypatch.setattr(batch_export_service, "BATCH_EXPORT_CONCURRENCY", 10)
+    db.add_all([ReportDraft(title=f"报告{i}", owner_id=1) for i in range(5)])
+    db.commit()
+    return BatchExportService().create_job(db, 1, {}, "docx")
+
+
+@pytest.mark.asyncio
+async def test_completed_job_writes_archive(db, job, tmp_path, monkeypatch):
+    artifact_path = tmp_path / "artifact.docx"
+    artifact_path.write_bytes(b"docx")
+
+    async def export(self, payload, export_format):
+        return ExportArtifact(artifact_path, "hash", "application/octet-stream")
+
+    monkeypatch.setattr(ExportService, "export", export)
+    await BatchExportService().run_job(job.id)
+
+    db.expire_all()
+    finished = db.get(ExportJob, job.id)
+    assert (finished.status, finished.completed) == (ExportJobStatus.COMPLETED, 5)
+    assert {path.name for path in tmp_path.iterdir()} == {"artifact.docx", f"{job.id}.zip"}
+
+
+@pytest.mark.asyncio
+async def test_failure_cancels_renders_and_removes_partial_archive(db, job, tmp_path, monkeypatch):
+    async def export(self, payload, export_format):
+        await asyncio.Event().wait()
+
+    def build_payload(report):
+        if report.title == "报告3":
+            raise ValueError("报告数据损坏")
+        return {"id": report.id}
+
+    monkeypatch.setattr(ExportService, "export", export)
+    monkeypatch.setattr(batch_export_service, "build_payload", build_payload)
+    await BatchExportService().run_job(job.id)
+
+    db.expire_all()
+    finished = db.get(ExportJob, job.id)
+    assert finished.status == ExportJobStatus.FAILED
+    assert finished.error_message == "报告数据损坏"
+    # 已提交的渲染全部被取消，没有遗留的任务
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+    assert list(tmp_path.iterdir()) == []
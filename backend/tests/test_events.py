@@ -0,0 +1,74 @@
+"""广播事件与用户缓存失效测试"""
+
+import asyncio
+
+import pytest
+
+from app.core import events
+from app.core.events import EVENT_USER_CHANGED, EventBus, event_bus
+from app.core.security import AuthenticatedUser, user_cache
+from app.services.auth_service import AuthService, broadcast_user_changed
+
+
+def cache_user(user_id: int) -> None:
+    user_cache.put(user_id, AuthenticatedUser(user_id, "alice", "alice@example.com", True, False), 60)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_without_redis_is_handled_locally(monkeypatch):
+    monkeypatch.setattr(events, "redis_configured", lambda: False)
+    cache_user(1)
+
+    await broadcast_user_changed(1)
+
+    assert user_cache.get(1) is None
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_every_process(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    # 每个EventBus模拟一个worker进程，各自持有Redis连接
+    clients = []
+
+    def get_redis():
+        client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        clients.append(client)
+        return client
+
+    monkeypatch.setattr(events, "redis_configured", lambda: True)
+    monkeypatch.setattr(events, "get_redis", get_redis)
+    monkeypatch.setattr(events, "LISTEN_TIMEOUT", 0.01)
+
+    workers = [EventBus() for _ in range(3)]
+    received = [[] for _ in workers]
+    for bus, log in zip(workers, received):
+        bus.on_broadcast(EVENT_USER_CHANGED, log.append)
+        await bus.start()
+    try:
+        await workers[0].broadcast(EVENT_USER_CHANGED, {"user_id": 7})
+        for _ in range(100):
+            if all(received):
+                break
+            await asyncio.sleep(0.01)
+        assert received == [[{"user_id": 7}]] * 3
+    finally:
+        for bus in workers:
+            await bus.close()
+        for client in clients:
+            await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_deactivation_clears_cached_user(db, monkeypatch):
+    monkeypatch.setattr(events, "redis_configured", lambda: False)
+    service = AuthService()
+    assert service.get_user(db, 2).is_active
+
+    # 模拟其他进程停用用户：直接修改数据库后广播
+    service.set_active(db, 2, False)
+    cache_user(2)
+    assert service.get_user(db, 2).is_active
+    await event_bus.broadcast(EVENT_USER_CHANGED, {"user_id": 2})
+
+    assert not service.get_user(db, 2).is_active
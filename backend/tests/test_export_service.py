@@ -0,0 +1,48 @@
+"""导出缓存淘汰测试"""
+
+import os
+
+from app.services import export_service
+from app.services.export_service import prune_cache
+
+NOW = 1_000_000_000.0
+
+
+def make_artifact(root, name, size, age):
+    path = root / name[:2] / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (NOW - age, NOW - age))
+    return path
+
+
+def test_cache_dir_is_absolute():
+    assert export_service.EXPORT_CACHE_DIR.is_absolute()
+
+
+def test_prune_removes_expired_artifacts(tmp_path):
+    old = make_artifact(tmp_path, "aa01.docx", 10, age=40 * 86400)
+    fresh = make_artifact(tmp_path, "bb01.pdf", 10, age=86400)
+
+    assert prune_cache(tmp_path, max_bytes=1000, max_age=30 * 86400, now=NOW) == 1
+    assert not old.exists()
+    assert fresh.exists()
+
+
+def test_prune_evicts_least_recently_used_over_limit(tmp_path):
+    paths = [make_artifact(tmp_path, f"a{i}00.docx", 100, age=(5 - i) * 3600) for i in range(5)]
+
+    assert prune_cache(tmp_path, max_bytes=250, max_age=30 * 86400, now=NOW) == 3
+    assert [path.exists() for path in paths] == [False, False, False, True, True]
+
+
+def test_prune_keeps_recent_and_other_files(tmp_path):
+    recent = make_artifact(tmp_path, "cc01.docx", 100, age=60)
+    batch = tmp_path / "batches" / "job.zip"
+    batch.parent.mkdir()
+    batch.write_bytes(b"x" * 100)
+    os.utime(batch, (NOW - 40 * 86400, NOW - 40 * 86400))
+
+    assert prune_cache(tmp_path, max_bytes=0, max_age=0, now=NOW) == 0
+    assert recent.exists()
+    assert batch.exists()
@@ -0,0 +1,120 @@
+"""结构化字段抽取和规则热加载测试"""
+
+import json
+import os
+
+import pytest
+
+from app.db.models import ExtractedField, ReportDraft, UploadedFile
+from app.services import extraction_service
+from app.services.extraction_service import ExtractionService, _RuleSetLoader
+
+SAMPLE_TEXT = (
+    "保单号：PDAA202311000123\n"
+    "被保险人：张三\n"
+    "事故时间：2024年3月5日下午3时20分\n"
+    "事故地点：上海市浦东新区XX路\n"
+    "车牌号：沪A·12345\n"
+    "索赔金额：1.5万元\n"
+)
+
+RULES_V1 = {
+    "version": "v1",
+    "macros": {"SEP": "[ \\t]*[：:][ \\t]*"},
+    "rules": [{"name": "insured", "label": "被保险人", "pattern": "被保险人<<SEP>>(?P<value>\\S+)"}],
+}
+RULES_V2 = {
+    "version": "v2",
+    "macros": {"SEP": "[ \\t]*[：:][ \\t]*"},
+    "rules": [{"name": "applicant", "label": "申请人", "pattern": "申请人<<SEP>>(?P<value>\\S+)"}],
+}
+
+
+def write_rules(path, content, mtime):
+    path.write_text(content if isinstance(content, str) else json.dumps(content), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_extract_default_rules():
+    values = {item.name: item.value for item in ExtractionService().extract(SAMPLE_TEXT)}
+
+    assert values["policy_number"] == "PDAA202311000123"
+    assert values["insured"] == "张三"
+    assert values["accident_time"] == "2024-03-05T15:20"
+    assert values["accident_location"] == "上海市浦东新区XX路"
+    assert values["plate_number"] == "沪A12345"
+    assert values["claim_amount"] == "15000.00"
+
+
+def test_extract_offsets_point_at_value():
+    for item in ExtractionService().extract(SAMPLE_TEXT):
+        assert SAMPLE_TEXT[item.start:item.end] == item.raw_text
+
+
+def test_reload_on_change(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, RULES_V1, 1000)
+    loader = _RuleSetLoader(path)
+    assert loader.get().version == "v1"
+
+    write_rules(path, RULES_V2, 2000)
+    assert loader.get().version == "v2"
+
+
+@pytest.mark.parametrize("content", [
+    '{"version": "bad", "rules": [',
+    {"version": "bad", "rules": [{"name": "x", "pattern": "(?P<value>"}]},
+    {"version": "bad", "rules": [{"name": "x", "type": "unknown", "pattern": "(?P<value>x)"}]},
+    {"version": "bad"},
+])
+def test_invalid_reload_keeps_previous_rules(tmp_path, content):
+    path = tmp_path / "rules.json"
+    write_rules(path, RULES_V1, 1000)
+    loader = _RuleSetLoader(path)
+    loader.get()
+
+    write_rules(path, content, 2000)
+    assert loader.get().version == "v1"
+
+    # 文件写完整后加载新规则
+    write_rules(path, RULES_V2, 3000)
+    assert loader.get().version == "v2"
+
+
+def test_missing_file_keeps_previous_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, RULES_V1, 1000)
+    loader = _RuleSetLoader(path)
+    loader.get()
+
+    path.unlink()
+    assert loader.get().version == "v1"
+
+
+def test_invalid_initial_rules_raise(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, "{", 1000)
+    with pytest.raises(ValueError):
+        _RuleSetLoader(path).get()
+
+
+def test_failed_extraction_keeps_existing_fields(db, tmp_path, monkeypatch):
+    report = ReportDraft(title="测试报告", owner_id=1)
+    db.add(report)
+    db.flush()
+    db_file = UploadedFile(
+        filename="a.txt", original_filename="a.txt", file_path="a.txt", file_size=1,
+        file_type="text/plain", uploader_id=1, report_id=report.id, ocr_text=SAMPLE_TEXT
+    )
+    db.add(db_file)
+    db.flush()
+    count = ExtractionService().extract_file(db, db_file)
+    db.commit()
+
+    path = tmp_path / "rules.json"
+    write_rules(path, "{", 1000)
+    monkeypatch.setattr(extraction_service, "_loader", _RuleSetLoader(path))
+    with pytest.raises(ValueError):
+        ExtractionService().extract_file(db, db_file)
+
+    assert db.query(ExtractedField).filter(ExtractedField.file_id == db_file.id).count() == count
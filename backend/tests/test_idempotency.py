@@ -0,0 +1,66 @@
+"""幂等接口响应测试：带键与不带键的请求返回相同的响应"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app.api.deps import get_idempotency_key
+from app.utils.idempotency import IDEMPOTENT_REPLAYED_HEADER, run_idempotent
+
+
+class ItemResponse(BaseModel):
+    id: int
+    name: str
+    created_at: datetime
+
+
+class InternalItem(ItemResponse):
+    """处理函数返回的对象带有不应出现在响应中的字段"""
+    secret: str
+
+
+@pytest.fixture
+def client(db):
+    app = FastAPI()
+    calls = []
+
+    @app.post("/items", response_model=ItemResponse, status_code=201)
+    async def create_item(idempotency_key: Optional[str] = Depends(get_idempotency_key)):
+        async def handler():
+            calls.append(1)
+            return InternalItem(
+                id=len(calls), name="item", secret="x",
+                created_at=datetime(2024, 3, 5, 8, 0, tzinfo=timezone.utc)
+            )
+
+        return await run_idempotent(
+            db, 1, "items", idempotency_key, "fp", handler,
+            response_model=ItemResponse, status_code=201
+        )
+
+    client = TestClient(app)
+    client.calls = calls
+    return client
+
+
+def test_keyed_response_matches_unkeyed(client):
+    plain = client.post("/items")
+    keyed = client.post("/items", headers={"Idempotency-Key": "k1"})
+
+    assert keyed.status_code == plain.status_code == 201
+    assert "secret" not in keyed.json()
+    assert {**keyed.json(), "id": 0} == {**plain.json(), "id": 0}
+
+
+def test_replay_returns_stored_response(client):
+    first = client.post("/items", headers={"Idempotency-Key": "k1"})
+    replay = client.post("/items", headers={"Idempotency-Key": "k1"})
+
+    assert replay.status_code == 201
+    assert replay.json() == first.json()
+    assert replay.headers[IDEMPOTENT_REPLAYED_HEADER] == "true"
+    assert len(client.calls) == 1
@@ -0,0 +1,129 @@
+"""幂等键服务测试"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.db.config import SessionLocal
+from app.db.models import IdempotencyRecord
+from app.services.idempotency_service import (
+    IDEMPOTENCY_LOCK_TIMEOUT,
+    IdempotencyInProgressError,
+    IdempotencyKeyMismatchError,
+    IdempotencyService,
+    StoredResponse,
+    request_fingerprint
+)
+
+SCOPE = "ai.generate"
+
+
+def _shift(db, **deltas):
+    """把登记时间和过期时间提前，模拟时间流逝"""
+    record = db.query(IdempotencyRecord).one()
+    if "created_at" in deltas:
+        record.created_at = record.created_at - deltas["created_at"]
+    if "expires_at" in deltas:
+        record.expires_at = record.expires_at - deltas["expires_at"]
+    db.commit()
+
+
+def test_fingerprint_depends_on_content():
+    assert request_fingerprint(1, {"a": 1, "b": 2}) == request_fingerprint(1, {"b": 2, "a": 1})
+    assert request_fingerprint(1, b"abc") != request_fingerprint(1, b"abd")
+    assert request_fingerprint(1, "x") != request_fingerprint("1", "x")
+
+
+def test_first_request_registers_and_replay_returns_stored_response(db):
+    service = IdempotencyService()
+    assert service.begin(db, 1, SCOPE, "key", "fp") is None
+
+    service.complete(db, 1, SCOPE, "key", 200, b'{"ok":true}')
+
+    assert service.begin(db, 1, SCOPE, "key", "fp") == StoredResponse(200, b'{"ok":true}')
+
+
+def test_same_key_with_different_request_is_rejected(db):
+    service = IdempotencyService()
+    service.begin(db, 1, SCOPE, "key", "fp")
+    service.complete(db, 1, SCOPE, "key", 200, b"{}")
+
+    with pytest.raises(IdempotencyKeyMismatchError):
+        service.begin(db, 1, SCOPE, "key", "other")
+
+
+def test_key_in_progress_is_rejected(db):
+    service = IdempotencyService()
+    service.begin(db, 1, SCOPE, "key", "fp")
+
+    with pytest.raises(IdempotencyInProgressError):
+        service.begin(db, 1, SCOPE, "key", "fp")
+
+
+def test_keys_are_scoped_per_user_and_endpoint(db):
+    service = IdempotencyService()
+    service.begin(db, 1, SCOPE, "key", "fp")
+
+    assert service.begin(db, 2, SCOPE, "key", "fp") is None
+    assert service.begin(db, 1, "files.upload", "key", "fp") is None
+
+
+def test_release_allows_retry_with_same_key(db):
+    service = IdempotencyService()
+    service.begin(db, 1, SCOPE, "key", "fp")
+
+    service.release(db, 1, SCOPE, "key")
+
+    assert service.begin(db, 1, SCOPE, "key", "fp") is None
+
+
+def test_release_keeps_completed_response(db):
+    service = IdempotencyService()
+    service.begin(db, 1, SCOPE, "key", "fp")
+    service.complete(db, 1, SCOPE, "key", 201, b"done")
+
+    service.release(db, 1, SCOPE, "key")
+
+    assert service.begin(db, 1, SCOPE, "key", "fp") == StoredResponse(201, b"done")
+
+
+def test_expired_record_is_treated_as_new_request(db):
+    service = IdempotencyService()
+    service.begin(db, 1, SCOPE, "key", "fp")
+    service.complete(db, 1, SCOPE, "key", 200, b"old")
+    _shift(db, expires_at=timedelta(days=2))
+
+    # 过期后可用于不同的请求，保存的响应被清除
+    assert service.begin(db, 1, SCOPE, "key", "other") is None
+    record = db.query(IdempotencyRecord).one()
+    assert record.fingerprint == "other"
+    assert record.status_code is None
+
+
+def test_stale_in_progress_record_is_taken_over(db):
+    service = IdempotencyService()
+    service.begin(db, 1, SCOPE, "key", "fp")
+    _shift(db, created_at=timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT + 1))
+
+    assert service.begin(db, 1, SCOPE, "key", "fp") is None
+    # 接管后重新计时，再次请求视为处理中
+    with pytest.raises(IdempotencyInProgressError):
+        service.begin(db, 1, SCOPE, "key", "fp")
+
+
+def test_concurrent_takeover_has_single_winner(db):
+    service = IdempotencyService()
+    service.begin(db, 1, SCOPE, "key", "fp")
+    _shift(db, created_at=timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT + 1))
+
+    # 另一个重试读取到同一条中断的登记
+    other = SessionLocal()
+    try:
+        stale = other.query(IdempotencyRecord).one()
+        assert stale.created_at is not None
+
+        assert service.begin(db, 1, SCOPE, "key", "fp") is None
+        with pytest.raises(IdempotencyInProgressError):
+            service._restart(other, stale, "fp", datetime.now(timezone.utc))
+    finally:
+        other.close()
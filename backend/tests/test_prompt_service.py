@@ -0,0 +1,65 @@
+"""提示词版本并发写入测试"""
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app.db.config import SessionLocal
+from app.db.models import PromptTemplate
+from app.services import prompt_service
+from app.services.prompt_defaults import DEFAULT_PROMPTS
+from app.services.prompt_service import PromptService, seed_default_prompts
+
+
+def before_next_flush(db, func):
+    """在会话下次flush前用另一个会话执行func，模拟其他进程同时写入"""
+    def run(session, flush_context, instances):
+        other = SessionLocal()
+        try:
+            func(other)
+        finally:
+            other.close()
+
+    event.listen(db, "before_flush", run, once=True)
+
+
+def test_concurrent_seeding_keeps_first_defaults(db):
+    before_next_flush(db, PromptService().ensure_default_prompts)
+
+    PromptService().ensure_default_prompts(db)
+
+    assert db.query(PromptTemplate).count() == len(DEFAULT_PROMPTS)
+
+
+def test_seed_default_prompts_loads_registry(db):
+    seed_default_prompts()
+    seed_default_prompts()
+
+    assert db.query(PromptTemplate).count() == len(DEFAULT_PROMPTS)
+    assert PromptService().resolve(db, "conclusion").version == 1
+
+
+def test_create_version_retries_taken_version(db):
+    seed_default_prompts()
+
+    def create(other):
+        PromptService().create_version(other, "conclusion", "其他请求", activate=False)
+
+    before_next_flush(db, create)
+    prompt = PromptService().create_version(db, "conclusion", "新版本")
+
+    assert prompt.version == 3
+    assert [p.version for p in PromptService().list_versions(db, "conclusion")] == [3, 2, 1]
+    assert PromptService().resolve(db, "conclusion").id == prompt.id
+
+
+def test_create_version_gives_up_after_retries(db, monkeypatch):
+    seed_default_prompts()
+    monkeypatch.setattr(prompt_service, "PROMPT_VERSION_RETRIES", 1)
+
+    def create(other):
+        PromptService().create_version(other, "conclusion", "其他请求", activate=False)
+
+    before_next_flush(db, create)
+    with pytest.raises(IntegrityError):
+        PromptService().create_version(db, "conclusion", "新版本")
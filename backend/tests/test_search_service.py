@@ -0,0 +1,84 @@
+"""全文检索测试"""
+
+import random
+
+import pytest
+
+from app.db.models import ReportDraft, UploadedFile
+from app.services import search_service
+from app.services.search_service import SearchService
+
+WORDS = ["保险", "事故", "车辆", "追尾", "暴雨", "仓库", "损失", "查勘"]
+
+
+@pytest.fixture
+def corpus(db):
+    """随机生成用户1的报告和文件，以及一份用户2的报告"""
+    rng = random.Random(0)
+    service = SearchService()
+    docs = {}
+    for i in range(30):
+        text = "，".join(rng.sample(WORDS, rng.randint(1, 4)))
+        report = ReportDraft(title=f"报告{i}", owner_id=1, accident_details=text)
+        db.add(report)
+        db.flush()
+        service.index_report(db, report)
+        docs[("report", report.id)] = text
+    for i in range(10):
+        text = "，".join(rng.sample(WORDS, rng.randint(1, 4)))
+        db_file = UploadedFile(
+            filename=f"{i}.png", original_filename=f"{i}.png", file_path=f"{i}.png",
+            file_size=1, file_type="image/png", uploader_id=1, ocr_text=text
+        )
+        db.add(db_file)
+        db.flush()
+        service.index_file(db, db_file)
+        docs[("file", db_file.id)] = text
+    other = ReportDraft(title="其他用户", owner_id=2, accident_details="保险事故")
+    db.add(other)
+    db.flush()
+    service.index_report(db, other)
+    db.commit()
+    return docs
+
+
+def expected(docs, words, doc_type=None):
+    return {
+        key for key, text in docs.items()
+        if all(word in text for word in words) and (doc_type is None or key[0] == doc_type)
+    }
+
+
+@pytest.mark.parametrize("words", [["保险"], ["保险", "事故"], ["暴雨", "仓库", "损失"], ["追尾", "不存在"]])
+@pytest.mark.parametrize("doc_type", [None, "report", "file"])
+def test_search_matches_all_terms(db, corpus, words, doc_type):
+    result = SearchService().search(db, 1, " ".join(words), doc_type=doc_type, limit=100)
+
+    keys = {(hit.doc_type, hit.doc_id) for hit in result.hits}
+    assert keys == expected(corpus, words, doc_type)
+    assert result.total == len(keys)
+    assert not result.estimated
+    scores = [hit.score for hit in result.hits]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_pages_are_consistent(db, corpus):
+    full = SearchService().search(db, 1, "保险", limit=100)
+    pages = [SearchService().search(db, 1, "保险", skip=skip, limit=5) for skip in range(0, full.total + 5, 5)]
+
+    assert [hit.doc_id for page in pages for hit in page.hits] == [hit.doc_id for hit in full.hits]
+    assert all(page.total == full.total for page in pages)
+
+
+def test_other_users_documents_are_excluded(db, corpus):
+    result = SearchService().search(db, 2, "保险事故")
+    assert [hit.title for hit in result.hits] == ["其他用户"]
+
+
+def test_candidates_capped_for_common_terms(db, corpus, monkeypatch):
+    monkeypatch.setattr(search_service, "SEARCH_MAX_CANDIDATES", 3)
+
+    result = SearchService().search(db, 1, "保险", limit=100)
+
+    assert result.estimated
+    assert result.total == len(result.hits) == 3
@@ -0,0 +1,118 @@
+"""SingleFlight请求合并测试"""
+
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_result():
+    flight = SingleFlight("test")
+    calls = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "result"
+
+    tasks = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert flight.in_flight("key")
+    release.set()
+
+    assert await asyncio.gather(*tasks) == ["result"] * 3
+    assert calls == 1
+    assert not flight.in_flight("key")
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    flight = SingleFlight("test")
+
+    async def work(value):
+        await asyncio.sleep(0)
+        return value
+
+    results = await asyncio.gather(flight.do("a", lambda: work(1)), flight.do("b", lambda: work(2)))
+    assert results == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared_and_key_released():
+    flight = SingleFlight("test")
+    calls = 0
+    release = asyncio.Event()
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        raise ValueError("boom")
+
+    tasks = [asyncio.create_task(flight.do("key", fail)) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert calls == 1
+
+    async def succeed():
+        return "ok"
+
+    # 失败后释放键，之后的调用重新执行
+    assert await flight.do("key", succeed) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_leader_cancellation_hands_off_to_waiter():
+    flight = SingleFlight("test")
+    calls = 0
+    started = asyncio.Event()
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            started.set()
+            await asyncio.Event().wait()
+        return calls
+
+    leader = asyncio.create_task(flight.do("key", work))
+    await started.wait()
+    waiter = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+    # 等待方接手重新执行，不因执行方被取消而失败
+    assert await waiter == 2
+    assert not flight.in_flight("key")
+
+
+@pytest.mark.asyncio
+async def test_waiter_cancellation_does_not_affect_leader():
+    flight = SingleFlight("test")
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "result"
+
+    leader = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    release.set()
+    assert await leader == "result"
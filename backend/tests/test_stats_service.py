@@ -0,0 +1,130 @@
+"""用户统计计数器测试：增量维护的结果与按源表重算一致"""
+
+from datetime import datetime, timezone
+
+from app.db.models import InsuranceType, OCRStatus, ReportDraft, ReportStatus, UploadedFile, UserStatCounter
+from app.services.generation_log_service import write_logs
+from app.services.stats_service import StatsService
+
+
+def _counters(db):
+    db.expire_all()
+    return {
+        (user_id, name): value
+        for user_id, name, value in db.query(
+            UserStatCounter.user_id, UserStatCounter.name, UserStatCounter.value
+        )
+        if value
+    }
+
+
+def _assert_matches_rebuild(db):
+    maintained = _counters(db)
+    StatsService().rebuild(db)
+    assert maintained == _counters(db)
+    return maintained
+
+
+def _report(owner_id, **fields):
+    return ReportDraft(title="报告", owner_id=owner_id, updated_at=datetime.now(timezone.utc), **fields)
+
+
+def _file(uploader_id, report_id=None, **fields):
+    return UploadedFile(
+        filename="a.png",
+        original_filename="a.png",
+        file_path=f"uploads/{uploader_id}/a.png",
+        file_type="image/png",
+        file_size=1,
+        uploader_id=uploader_id,
+        report_id=report_id,
+        **fields
+    )
+
+
+def test_counters_follow_create_update_delete(db):
+    draft = _report(1)
+    auto = _report(1, insurance_type=InsuranceType.AUTO, status=ReportStatus.REVIEW)
+    other = _report(2, insurance_type=InsuranceType.LIABILITY)
+    db.add_all([draft, auto, other])
+    db.commit()
+    db.add_all([_file(1, draft.id), _file(1, ocr_status=OCRStatus.COMPLETED)])
+    db.commit()
+
+    counters = _assert_matches_rebuild(db)
+    assert counters[(1, "reports.status.draft")] == 1
+    assert counters[(1, "reports.status.review")] == 1
+    assert counters[(1, "reports.insurance_type.unset")] == 1
+    assert counters[(2, "reports.insurance_type.责任险")] == 1
+    assert counters[(1, "files.ocr_status.pending")] == 1
+
+    draft.status = ReportStatus.COMPLETED
+    auto.insurance_type = InsuranceType.OTHER
+    db.query(UploadedFile).filter(UploadedFile.report_id == draft.id).one().ocr_status = OCRStatus.FAILED
+    db.commit()
+
+    counters = _assert_matches_rebuild(db)
+    assert counters[(1, "reports.status.completed")] == 1
+    assert (1, "reports.status.draft") not in counters
+    assert counters[(1, "reports.insurance_type.其他")] == 1
+    assert counters[(1, "files.ocr_status.failed")] == 1
+
+    db.delete(db.query(UploadedFile).filter(UploadedFile.report_id == draft.id).one())
+    db.delete(auto)
+    db.commit()
+
+    counters = _assert_matches_rebuild(db)
+    assert (1, "reports.status.review") not in counters
+    assert (1, "reports.insurance_type.其他") not in counters
+
+
+def test_changing_owner_moves_counts(db):
+    report = _report(1, status=ReportStatus.REVIEW)
+    db.add(report)
+    db.commit()
+
+    report.owner_id = 2
+    db.commit()
+
+    counters = _assert_matches_rebuild(db)
+    assert (1, "reports.status.review") not in counters
+    assert counters[(2, "reports.status.review")] == 1
+
+
+def test_unchanged_flush_does_not_touch_counters(db):
+    report = _report(1)
+    db.add(report)
+    db.commit()
+    before = _counters(db)
+
+    report.title = "新标题"
+    db.commit()
+
+    assert _counters(db) == before
+
+
+def test_generation_logs_update_ai_usage(db):
+    report = _report(1)
+    db.add(report)
+    db.commit()
+
+    row = {
+        "report_id": report.id,
+        "user_id": 1,
+        "chapter_type": "conclusion",
+        "prompt_text": "p",
+        "generated_content": "c",
+        "model_name": "m",
+        "tokens_used": 30,
+        "prompt_tokens": 10,
+        "completion_tokens": 20,
+        "generation_time": 1.5,
+        "created_at": datetime.now(timezone.utc),
+    }
+    assert write_logs([row, dict(row)]) == 2
+
+    stats = StatsService().get_user_stats(db, 1)
+    assert stats.generation_count == 2
+    assert stats.tokens_used == 60
+    assert stats.generation_time == 3.0
+    _assert_matches_rebuild(db)
@@ -0,0 +1,84 @@
+"""模板填充和AI回退测试"""
+
+import json
+
+import pytest
+
+from app.db.models import ReportDraft
+from app.services import template_fill_service
+from app.services.ai_service import AIGenerationResult
+from app.services.template_fill_service import TemplateFillService, prompt_facts
+from app.services.template_service import compile_template
+
+TEMPLATE = "事故经过：{事故经过及索赔}\n报告：{报告标题}\n天气：{天气情况}"
+
+
+class FakeAIService:
+    """记录调用参数，报告标题含“失败”时抛出异常"""
+
+    calls = []
+
+    async def fill_slots(self, slots, template_content, facts=None, context=None):
+        self.calls.append(facts)
+        if "失败" in facts.get("报告标题", ""):
+            raise RuntimeError("AI服务不可用")
+        return AIGenerationResult(
+            content=json.dumps({slot: "晴" for slot in slots}, ensure_ascii=False),
+            prompt_used="",
+            model_name="test",
+            tokens_used=15,
+            prompt_tokens=10,
+            completion_tokens=5
+        )
+
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    FakeAIService.calls = []
+    monkeypatch.setattr(template_fill_service, "AIService", FakeAIService)
+    return FakeAIService
+
+
+def add_report(db, title):
+    report = ReportDraft(title=title, owner_id=1, accident_details="很长的章节正文" * 100)
+    db.add(report)
+    db.commit()
+    return report
+
+
+def test_prompt_facts_drop_chapter_bodies():
+    facts = {"报告标题": "标题", "事故经过及索赔": "正文", "公估结论": "结论", "事故时间": "2024-12-01"}
+    assert prompt_facts(facts) == {"报告标题": "标题", "事故时间": "2024-12-01"}
+
+
+@pytest.mark.asyncio
+async def test_fill_reports_keeps_deterministic_result_when_ai_fails(db, fake_ai):
+    ok = add_report(db, "正常报告")
+    failed = add_report(db, "失败报告")
+
+    results = await TemplateFillService().fill_reports(db, compile_template(TEMPLATE), [ok, failed], use_ai=True)
+
+    assert results[ok.id].filled["天气情况"] == "晴"
+    assert (results[ok.id].prompt_tokens, results[ok.id].completion_tokens) == (10, 5)
+    assert results[failed.id].missing == ["天气情况"]
+    assert results[failed.id].filled["报告标题"] == "失败报告"
+    assert results[failed.id].prompt_tokens == 0
+    # 章节正文不发送给AI
+    assert all("事故经过及索赔" not in facts for facts in fake_ai.calls)
+
+
+@pytest.mark.asyncio
+async def test_fill_reports_checks_budget_before_calling_ai(db, fake_ai):
+    report = add_report(db, "正常报告")
+    checked = []
+
+    def budget_check(prompt_tokens, calls):
+        checked.append(calls)
+        raise ValueError("超出预算")
+
+    with pytest.raises(ValueError):
+        await TemplateFillService().fill_reports(
+            db, compile_template(TEMPLATE), [report], use_ai=True, budget_check=budget_check
+        )
+    assert checked == [1]
+    assert fake_ai.calls == []
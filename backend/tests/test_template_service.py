@@ -0,0 +1,30 @@
+"""默认模板写入测试"""
+
+from app.db.models import ReportTemplate
+from app.services.template_defaults import DEFAULT_TEMPLATES
+from app.services.template_service import TemplateService, seed_default_templates
+
+
+def test_seeding_is_idempotent(db):
+    seed_default_templates()
+    seed_default_templates()
+
+    assert db.query(ReportTemplate).filter(ReportTemplate.is_default.is_(True)).count() == len(DEFAULT_TEMPLATES)
+
+
+def test_seeding_fills_missing_defaults(db):
+    seed_default_templates()
+    db.query(ReportTemplate).filter(ReportTemplate.chapter_type == DEFAULT_TEMPLATES[0]["type"]).delete()
+    db.commit()
+
+    TemplateService().ensure_default_templates(db)
+
+    names = sorted(name for (name,) in db.query(ReportTemplate.name).filter(ReportTemplate.is_default.is_(True)))
+    assert names == sorted(item["title"] for item in DEFAULT_TEMPLATES)
+
+
+def test_list_templates_does_not_write(db):
+    total, items = TemplateService().list_templates(db, 1)
+
+    assert (total, items) == (0, [])
+    assert db.query(ReportTemplate).count() == 0
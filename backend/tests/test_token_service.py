@@ -0,0 +1,86 @@
+"""Token计数和按token切分测试"""
+
+import pytest
+
+from app.services import token_service
+from app.services.token_service import count_tokens, preload_encoding, split_to_tokens
+
+
+class PairEncoding:
+    """每2个字符记为1个token的测试编码"""
+
+    def encode(self, text, disallowed_special=()):
+        return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture
+def encoding_loader(monkeypatch):
+    """清空已加载的编码，返回可替换加载结果的函数"""
+    monkeypatch.setattr(token_service, "_encodings", {})
+    monkeypatch.setattr(token_service, "_load_failed_at", {})
+
+    def use(result):
+        def load(name):
+            if isinstance(result, Exception):
+                raise result
+            return result
+        monkeypatch.setattr(token_service, "_import_encoding", load)
+
+    return use
+
+
+def test_count_tokens_uses_loaded_encoding(encoding_loader):
+    encoding_loader(PairEncoding())
+    assert count_tokens("abcdef") == 3
+    assert count_tokens("") == 0
+    assert count_tokens(None) == 0
+
+
+def test_estimate_counts_long_ascii_by_length(encoding_loader):
+    encoding_loader(OSError("offline"))
+    assert count_tokens("a" * 50000) == 12500
+    assert count_tokens("保险公估") == 4
+    assert count_tokens("loss of 12 cars") == 4
+
+
+def test_failed_load_is_retried(encoding_loader, monkeypatch):
+    encoding_loader(OSError("offline"))
+    assert token_service._load_encoding("cl100k_base") is None
+
+    encoding_loader(PairEncoding())
+    # 重试间隔内继续使用估算，间隔过后重新加载
+    assert token_service._load_encoding("cl100k_base") is None
+    monkeypatch.setattr(token_service, "TOKENIZER_RETRY_INTERVAL", 0)
+    assert isinstance(token_service._load_encoding("cl100k_base"), PairEncoding)
+
+
+def test_preload_raises_when_unavailable(encoding_loader):
+    encoding_loader(OSError("offline"))
+    with pytest.raises(RuntimeError):
+        preload_encoding()
+
+    # 预热重试不受重试间隔限制
+    encoding_loader(PairEncoding())
+    preload_encoding()
+    assert count_tokens("abcd") == 2
+
+
+@pytest.mark.parametrize("loaded", [PairEncoding(), OSError("offline")])
+def test_split_to_tokens_keeps_text_and_limit(encoding_loader, loaded):
+    encoding_loader(loaded)
+    text = "保险标的位于仓库一层。" * 20 + "water damage " * 30
+
+    pieces = split_to_tokens(text, 7)
+
+    assert "".join(pieces) == text
+    assert all(0 < count_tokens(piece) <= 7 for piece in pieces)
+    assert len(pieces) > 1
+
+
+def test_split_to_tokens_short_text(encoding_loader):
+    encoding_loader(PairEncoding())
+    assert split_to_tokens("abc", 10) == ["abc"]
+    assert split_to_tokens("", 10) == []
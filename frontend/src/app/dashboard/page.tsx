@@ -5,7 +5,7 @@
 'use client';
 
 import React, { useState, useEffect } from 'react';
-// import { api } from '@/lib/api'; // 暂时注释掉，等认证系统完成后再启用
+import { api } from '@/lib/api';
 
 interface Report {
   id: number;
@@ -16,6 +16,28 @@ interface Report {
   updated_at: string;
 }
 
+/**
+ * 仪表板统计，由后端按用户维护的计数器给出，不依赖报告列表分页
+ */
+interface DashboardStats {
+  reports: {
+    total: number;
+    by_status: Record<string, number>;
+    by_insurance_type: Record<string, number>;
+  };
+  files: {
+    total: number;
+    by_ocr_status: Record<string, number>;
+  };
+  ai: {
+    generation_count: number;
+    tokens_used: number;
+    prompt_tokens: number;
+    completion_tokens: number;
+    generation_time: number;
+  };
+}
+
 interface User {
   name: string;
   email: string;
@@ -28,6 +50,7 @@ export default function DashboardPage() {
   });
 
   const [reports, setReports] = useState<Report[]>([]);
+  const [stats, setStats] = useState<DashboardStats | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
@@ -89,6 +112,24 @@ export default function DashboardPage() {
     }
   };
 
+  /**
+   * 加载统计数据
+   */
+  const loadStats = async () => {
+    try {
+      const data = await api.dashboard.stats() as DashboardStats;
+      setStats(data);
+    } catch (err) {
+      console.error('加载统计失败:', err);
+      setStats(null);
+    }
+  };
+
+  /**
+   * 按报告状态取统计数，统计未加载时显示占位符
+   */
+  const statusCount = (status: string) => stats ? (stats.reports.by_status[status] ?? 0) : '-';
+
   /**
    * 删除报告
    */
@@ -106,6 +147,7 @@ export default function DashboardPage() {
       
       // 从列表中移除已删除的报告
       setReports(prev => prev.filter(report => report.id !== reportId));
+      loadStats();
       alert('报告删除成功');
     } catch (err) {
       console.error('删除报告失败:', err);
@@ -155,9 +197,10 @@ export default function DashboardPage() {
     window.location.href = '/templates';
   };
 
-  // 页面加载时获取报告列表
+  // 页面加载时获取报告列表和统计
   useEffect(() => {
     loadReports();
+    loadStats();
   }, []);
 
   const getStatusText = (status: string) => {
@@ -234,7 +277,7 @@ export default function DashboardPage() {
               <div className="text-3xl mr-4">📊</div>
               <div>
                 <p className="text-sm text-gray-600">总报告数</p>
-                <p className="text-2xl font-bold text-gray-900">{reports.length}</p>
+                <p className="text-2xl font-bold text-gray-900">{stats ? stats.reports.total : '-'}</p>
               </div>
             </div>
           </div>
@@ -245,7 +288,7 @@ export default function DashboardPage() {
               <div>
                 <p className="text-sm text-gray-600">草稿</p>
                 <p className="text-2xl font-bold text-yellow-600">
-                  {reports.filter(r => r.status === 'draft').length}
+                  {statusCount('draft')}
                 </p>
               </div>
             </div>
@@ -257,7 +300,7 @@ export default function DashboardPage() {
               <div>
                 <p className="text-sm text-gray-600">审核中</p>
                 <p className="text-2xl font-bold text-blue-600">
-                  {reports.filter(r => r.status === 'review').length}
+                  {statusCount('review')}
                 </p>
               </div>
             </div>
@@ -269,7 +312,7 @@ export default function DashboardPage() {
               <div>
                 <p className="text-sm text-gray-600">已完成</p>
                 <p className="text-2xl font-bold text-green-600">
-                  {reports.filter(r => r.status === 'completed').length}
+                  {statusCount('completed')}
                 </p>
               </div>
             </div>
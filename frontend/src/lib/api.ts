@@ -139,6 +139,9 @@ export const API_ENDPOINTS = {
   // 模板相关
   TEMPLATES: '/api/v1/templates',
   TEMPLATE_BY_ID: (id: string) => `/api/v1/templates/${id}`,
+  
+  // 仪表盘相关
+  DASHBOARD_STATS: '/api/v1/dashboard/stats',
 };
 
 /**
@@ -176,4 +179,9 @@ export const api = {
     update: (id: string, data: any) => apiClient.put(API_ENDPOINTS.TEMPLATE_BY_ID(id), data),
     delete: (id: string) => apiClient.delete(API_ENDPOINTS.TEMPLATE_BY_ID(id)),
   },
+
+  // 仪表盘相关
+  dashboard: {
+    stats: () => apiClient.get(API_ENDPOINTS.DASHBOARD_STATS),
+  },
 }; 
\ No newline at end of file